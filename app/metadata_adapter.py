@@ -1,12 +1,8 @@
-import mutagen.easyid3
-
 from app.model import Song
+from mptreasury.adapters.tag_writer import song_tags, sync_file
 
 
-def update_metadata(song: Song):
-    """Update metadata of the song file to match what's in the db"""
-    tags = mutagen.easyid3.EasyID3(str(song.local_path))
-    tags["title"] = song.title
-    tags["artist"] = song.artist_name
-    tags["album"] = song.album_name
-    tags.save()
+def update_metadata(song: Song) -> bool:
+    """Update metadata of the song file to match what's in the db; the file is
+    only written when its tags differ. Returns whether it was"""
+    return sync_file(song.local_path, song_tags(song))
@@ -1,11 +1,20 @@
 import os
 import re
+import shutil
 from pathlib import Path
 from typing import List, Optional
 
 from deflacue import deflacue  # type: ignore
+from loguru import logger
 
+from mptreasury.adapters.cue_split_cache import CueSplitCache
+from mptreasury.adapters.cue_splitter import (
+    CueSheetError,
+    parse_cue_sheet,
+    split_cue_album,
+)
 from mptreasury.core import config, constants
+from mptreasury.util.metrics import metrics
 
 
 class RawSong:
@@ -15,11 +24,17 @@ class RawSong:
         path: Path,
         album_name: str | None = None,
         artist_name: str | None = None,
+        track_start: int = 0,
+        track_end: int | None = None,
     ):
         self.title = title
         self.album_name = album_name
         self.artist_name = artist_name
         self.path = path
+        # range of a cue track inside its album image, in cue frames (1/75s);
+        # the whole file by default
+        self.track_start = track_start
+        self.track_end = track_end
 
 
 class CueParser:
@@ -47,12 +62,71 @@ class CueParser:
                     details = line.split(" ", 1)[1].replace("\n", "").strip('"')
         return album_name, artist_name, details
 
+    @property
+    def virtual_tracks(self) -> bool:
+        return self._config.CUE_IMPORT_MODE == constants.CueImportMode.virtual
+
+    def virtual_songs(self, cue_folder: Path) -> list[RawSong]:
+        """Songs as ranges of the album image, as laid out by the cue sheet"""
+        (cue_file,) = cue_folder.glob("*.cue")
+        sheet = parse_cue_sheet(cue_file)
+        images = {track.file for track in sheet.tracks}
+        paths = {
+            image: self._existing_image(image, cue_file, len(images)) for image in images
+        }
+        return [
+            RawSong(
+                title=track.title,
+                path=paths[track.file],
+                track_start=track.start or 0,
+                track_end=track.end,
+            )
+            for track in sheet.tracks
+        ]
+
+    @staticmethod
+    def _existing_image(image: Path, cue_file: Path, images: int) -> Path:
+        """The image a cue sheet points at; one that was renamed (e.g. when it
+        was converted to flac) is found if it's the only music file next to the sheet"""
+        if image.exists():
+            return image
+        music_files = [
+            file
+            for file in cue_file.parent.iterdir()
+            if file.suffix in constants.ALL_MUSIC_EXTENSIONS
+        ]
+        if images == 1 and len(music_files) == 1:
+            logger.warning(
+                "{} of {} does not exist; using {}", image, cue_file, music_files[0]
+            )
+            return music_files[0]
+        raise CueSheetError(f"{image} of {cue_file} does not exist")
+
     def split_songs(self, cue_folder: Path, album_name: str, artist_name: str):
+        cache = CueSplitCache(
+            self._config.CACHE_FOLDER, self._config.CUE_SPLIT_CACHE_MAX_BYTES
+        )
+        with metrics.span("cue_split"):
+            songs_folder = cache.get_or_split(
+                cue_folder, lambda target: self._split(cue_folder, target)
+            )
+        return self._get_folder_with_songs(songs_folder)
+
+    def _split(self, cue_folder: Path, target: Path):
+        (cue_file,) = cue_folder.glob("*.cue")
+        try:
+            split_cue_album(cue_file, target, self._config.CUE_SPLIT_WORKERS)
+        except CueSheetError as e:
+            logger.warning("Cannot split {} by tracks: {}; using deflacue", cue_file, e)
+            shutil.rmtree(target)
+            target.mkdir()
+            self._split_with_deflacue(cue_folder, target)
+
+    @staticmethod
+    def _split_with_deflacue(cue_folder: Path, target: Path):
         # TODO: mb we should check that sox libsox-fmt-all are installed before trying anythin
-        d = deflacue.Deflacue(cue_folder, dest_path=self._config.CACHE_FOLDER)
+        d = deflacue.Deflacue(cue_folder, dest_path=target)
         d.do()
-        partial_path = Path(self._config.CACHE_FOLDER / cue_folder.name)
-        return self._get_folder_with_songs(partial_path)
 
     def _get_folder_with_songs(self, start_folder: Path):
         subfolders = []
@@ -71,20 +145,27 @@ class RawAlbum:
     def __init__(self, music_path: Path, cue_parser: CueParser):
         self.music_path = music_path
         self.songs: List[RawSong] = []
+        # Discogs release the files are tagged with, if any
+        self.release_id: int | None = None
+        songs: list[RawSong] | None = None
         if self._is_cue_folder(self.music_path):
             self.name, self.artist_name, self.details = cue_parser.parse_cue_file_data(
                 self.music_path
             )
-            self.music_path = cue_parser.split_songs(
-                self.music_path, self.name, self.artist_name
-            )
+            if cue_parser.virtual_tracks:
+                songs = cue_parser.virtual_songs(self.music_path)
+            else:
+                self.music_path = cue_parser.split_songs(
+                    self.music_path, self.name, self.artist_name
+                )
         else:
             (
                 self.name,
                 self.artist_name,
                 self.details,
             ) = self._get_data_from_album_folder_name(self.music_path.name)
-        songs = self._gather_songs(self.music_path)
+        if songs is None:
+            songs = self._gather_songs(self.music_path)
         for song in songs:
             song.album_name = self.name
             song.artist_name = self.artist_name
@@ -215,9 +296,19 @@ class Song:
         remote_path: Path | None = None,
         album: Optional[Album] = None,
         id: Optional[int] = None,
+        track_start: int = 0,
+        track_end: int | None = None,
+        album_id: Optional[int] = None,
+        content_hash: Optional[str] = None,
     ):
         self.id = id
         self.title = title
+        # see RawSong
+        self.track_start = track_start
+        self.track_end = track_end
+        self.album_id = album_id
+        # sha256 of the file; cue tracks share their image's
+        self.content_hash = content_hash
         # self.genre = genre
         # self.released = released
         """TODO: custom type that ensures
@@ -234,6 +325,11 @@ class Song:
         self.artist_name = artist_name
         self.album = album
 
+    @property
+    def is_cue_track(self) -> bool:
+        """Whether the song is only part of its file"""
+        return self.track_start != 0 or self.track_end is not None
+
     def printable_dict(self):
         return dict(
             id=self.id,
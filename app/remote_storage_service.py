@@ -1,12 +1,38 @@
+import hashlib
 import logging
+import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from app import config, model
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+from app import model
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.util.metrics import metrics
 
 logger = logging.getLogger("mptreasury")
 
 
+def remote_path_for(song: model.Song) -> Path:
+    # cue tracks share their album image, which is uploaded once
+    file_name = (
+        song.local_path.name
+        if song.is_cue_track
+        else f"{song.title}{song.local_path.suffix}"
+    )
+    return Path(
+        unicodedata.normalize(
+            "NFKD",
+            f"{song.artist_name}/{song.album_name}/{file_name}",
+        )
+        .encode("ascii", "ignore")
+        .decode()
+    )
+
+
 def upload_local_songs(songs: list[model.Song], library_bucket: str, s3_client):
     for song in songs:
         if not song.local_path:
@@ -16,17 +42,198 @@ def upload_local_songs(songs: list[model.Song], library_bucket: str, s3_client):
                 f"Song {song.title} has already been uploaded; cannot upload again - you should copy or move its remote location"
             )
 
-        song.remote_path = Path(
-            unicodedata.normalize(
-                "NFKD",
-                f"{song.artist_name}/{song.album_name}/{song.title}{song.local_path.suffix}",
-            )
-            .encode("ascii", "ignore")
-            .decode()
-        )
-        # TODO: we should check for the path, or for the songs being there already
-        
+        song.remote_path = remote_path_for(song)
         logger.info("Uploading %s to %s", song.title, song.remote_path)
         s3_client.upload_file(
             str(song.local_path), library_bucket, str(song.remote_path)
         )
+
+
+def get_s3_client(config: Config):
+    import boto3
+
+    return boto3.client(
+        "s3",
+        endpoint_url=config.S3_ENDPOINT_URL,
+        aws_access_key_id=config.AWS_ACCESS_KEY,
+        aws_secret_access_key=config.AWS_SECRET_KEY,
+    )
+
+
+def multipart_etag(path: Path, part_size: int) -> str:
+    """The ETag S3 gives an object uploaded from path with part_size as both
+    the multipart threshold and the part size: the md5 of the file when it's
+    smaller than a part, otherwise the md5 of the parts' md5s, followed by the
+    number of parts (a file of exactly one part is still a multipart upload)"""
+    if path.stat().st_size < part_size:
+        return hashlib.md5(path.read_bytes()).hexdigest()
+    part_digests = []
+    with path.open("rb") as f:
+        while part := f.read(part_size):
+            part_digests.append(hashlib.md5(part).digest())
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+class UploadReport:
+    def __init__(self) -> None:
+        self.uploaded: list[model.Song] = []
+        self.skipped: list[model.Song] = []
+        self.failed: list[tuple[model.Song, Exception]] = []
+
+    def to_dict(self) -> dict:
+        return dict(
+            uploaded=len(self.uploaded),
+            skipped=len(self.skipped),
+            failed=[
+                dict(local_path=str(song.local_path), error=str(error))
+                for song, error in self.failed
+            ],
+        )
+
+
+class UploadEngine:
+    """Uploads songs to the library bucket, several files at a time, each in
+    concurrent parts. Files already in the bucket with the same size (and
+    ETag, when verifying) are not uploaded again. Every finished upload is
+    recorded in the db's ledger, so an interrupted run picks up where it stopped"""
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        Session,
+        part_size: int = 8 * 1024 * 1024,
+        concurrency: int = 4,
+        file_concurrency: int = 4,
+        verify_etag: bool = False,
+    ) -> None:
+        self._s3_client = s3_client
+        self.bucket = bucket
+        self._Session = Session
+        self.part_size = part_size
+        self.file_concurrency = file_concurrency
+        self.verify_etag = verify_etag
+        self._transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=concurrency,
+        )
+
+    @classmethod
+    def from_config(cls, config: Config, s3_client, Session) -> "UploadEngine":
+        if not config.S3_LIBRARY_BUCKET:
+            raise ValueError("S3_LIBRARY_BUCKET is not configured")
+        return cls(
+            s3_client,
+            config.S3_LIBRARY_BUCKET,
+            Session,
+            part_size=config.S3_PART_SIZE,
+            concurrency=config.S3_UPLOAD_CONCURRENCY,
+            file_concurrency=config.S3_FILE_CONCURRENCY,
+            verify_etag=config.S3_VERIFY_ETAG,
+        )
+
+    def upload(self, songs: list[model.Song]) -> UploadReport:
+        ledger = db.get_uploads(self.bucket, self._Session)
+        report = UploadReport()
+        # cue tracks of the same image share a file, which is uploaded once
+        songs_by_file: dict[Path, list[model.Song]] = {}
+        for song in songs:
+            songs_by_file.setdefault(song.local_path, []).append(song)
+
+        def upload_one(file_songs: list[model.Song]):
+            try:
+                uploaded = self._upload_songs(
+                    file_songs, ledger.get(file_songs[0].local_path)
+                )
+            except Exception as e:
+                logger.warning("Failed to upload %s: %s", file_songs[0].local_path, e)
+                report.failed.extend((song, e) for song in file_songs)
+                return
+            (report.uploaded if uploaded else report.skipped).extend(file_songs)
+
+        if self.file_concurrency > 1 and len(songs_by_file) > 1:
+            with ThreadPoolExecutor(max_workers=self.file_concurrency) as executor:
+                list(executor.map(upload_one, songs_by_file.values()))
+        else:
+            for file_songs in songs_by_file.values():
+                upload_one(file_songs)
+        logger.info(
+            "Uploaded %s songs, skipped %s, %s failed",
+            len(report.uploaded),
+            len(report.skipped),
+            len(report.failed),
+        )
+        return report
+
+    def _upload_songs(
+        self, songs: list[model.Song], ledger_entry: dict | None
+    ) -> bool:
+        """Upload the songs' file unless it's already there;
+        returns whether it was uploaded"""
+        song = songs[0]
+        if not song.local_path:
+            raise ValueError(f"Song {song.title} does not exist locally; cannot upload")
+        remote_path = song.remote_path or remote_path_for(song)
+        stat = song.local_path.stat()
+        if (
+            ledger_entry is not None
+            and ledger_entry["remote_path"] == remote_path
+            and ledger_entry["size"] == stat.st_size
+            and ledger_entry["mtime"] == stat.st_mtime
+        ):
+            # songs added since the file was uploaded, e.g. a re-imported album
+            # or another track of the same cue image, don't have it stored yet
+            stale = [song for song in songs if song.remote_path != remote_path]
+            for song in songs:
+                song.remote_path = remote_path
+            db.record_remote_path(stale, remote_path, self._Session)
+            metrics.increment("files_already_uploaded")
+            return False
+
+        etag = (
+            multipart_etag(song.local_path, self.part_size)
+            if self.verify_etag
+            else None
+        )
+        uploaded = not self._is_in_bucket(remote_path, stat.st_size, etag)
+        if uploaded:
+            logger.info("Uploading %s to %s", song.title, remote_path)
+            with metrics.span("upload"):
+                self._s3_client.upload_file(
+                    str(song.local_path),
+                    self.bucket,
+                    str(remote_path),
+                    Config=self._transfer_config,
+                )
+            metrics.increment("files_uploaded")
+            metrics.increment("bytes_uploaded", stat.st_size)
+        else:
+            metrics.increment("files_already_uploaded")
+        for song in songs:
+            song.remote_path = remote_path
+        db.record_upload(
+            songs,
+            dict(
+                local_path=songs[0].local_path,
+                bucket=self.bucket,
+                remote_path=remote_path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                etag=etag,
+                uploaded_at=time.time(),
+            ),
+            self._Session,
+        )
+        return uploaded
+
+    def _is_in_bucket(self, remote_path: Path, size: int, etag: str | None) -> bool:
+        try:
+            head = self._s3_client.head_object(Bucket=self.bucket, Key=str(remote_path))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+        if head["ContentLength"] != size:
+            return False
+        return etag is None or head["ETag"].strip('"') == etag
@@ -9,8 +9,8 @@ from app import (
     db,
     discogs_adapter,
     import_service,
-    remote_storage_service,
 )
+from mptreasury.services import upload_service
 
 
 @click.group()
@@ -84,12 +84,9 @@ def import_action(import_path: Path, upload_to_remote: bool):
         )
     except ValueError as e:
         raise click.ClickException(str(e))
-    if res:
-        _, songs = res
-        if upload_to_remote:
-            remote_storage_service.upload_local_songs(
-                songs=songs, library_bucket=settings.S3_LIBRARY_BUCKET, s3_client=s3_client
-            )
+    if res and upload_to_remote:
+        # everything not uploaded yet, including what an earlier run left behind
+        upload_service.upload_library(s3_client, Session=session, config=settings)
 
 
 if __name__ == "__main__":
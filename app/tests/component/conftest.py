@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import pytest
+from sqlalchemy.orm import Session as OrmSession
+
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.util import injection
+
+
+@pytest.fixture
+def config(tmp_path: Path) -> Config:
+    return Config(
+        DB_FILE=tmp_path / "test.db",
+        LIBRARY_DIR=tmp_path / "lib",
+        CACHE_FOLDER=tmp_path / "cache",
+    )
+
+
+@pytest.fixture
+def open_library_db():
+    """Opens the db of a config and creates its tables, returning its
+    sessionmaker; the engine is disposed of after the test"""
+
+    def open_library_db(config: Config):
+        if db.master_engine is not None:
+            db.master_engine.dispose()
+        db.master_engine = None
+        Session = db.get_sessionmaker(config)
+        db.create_tables()
+        return Session
+
+    yield open_library_db
+    if db.master_engine is not None:
+        db.master_engine.dispose()
+    db.master_engine = None
+
+
+@pytest.fixture
+def Session(config: Config, open_library_db):
+    return open_library_db(config)
+
+
+@pytest.fixture
+def injected(config: Config, Session, monkeypatch: pytest.MonkeyPatch) -> Config:
+    """The config and the db, injected like bootstrap() does it"""
+    monkeypatch.setitem(injection._INJECTS, Config, config)
+    monkeypatch.setitem(injection._INJECTS, OrmSession, Session)
+    monkeypatch.setitem(injection._SCOPED_INJECTS, db.DbSession, Session)
+    return config
@@ -0,0 +1,117 @@
+import threading
+import time
+
+from mptreasury.adapters.discogs_adapter import FakeArtist, FakeTrack
+from mptreasury.services import import_service
+
+
+class SlowRelease:
+    """A search result whose tracklist takes a while to fetch"""
+
+    def __init__(self, id: int, track_names: list[str], delay: float = 0) -> None:
+        self.id = id
+        self.title = f"release {id}"
+        self.artists = [FakeArtist()]
+        self._track_names = track_names
+        self._delay = delay
+        self.fetched = threading.Event()
+
+    @property
+    def tracklist(self):
+        time.sleep(self._delay)
+        self.fetched.set()
+        return [FakeTrack(title) for title in self._track_names]
+
+
+raw_tracks = ["First Song", "Second Song"]
+
+
+def test_concurrent_match_is_same_as_sequential():
+    """Test that when several candidates pass, the earliest one in the search
+    results is picked, even if a later one finished fetching first"""
+    candidates = [
+        SlowRelease(0, ["Something", "Else"]),
+        SlowRelease(1, raw_tracks, delay=0.2),
+        SlowRelease(2, raw_tracks),
+    ]
+    sequential = import_service.find_matching_candidate(raw_tracks, candidates)
+    concurrent = import_service.find_matching_candidate_concurrently(
+        raw_tracks, candidates, workers=3
+    )
+    assert sequential is not None and concurrent is not None
+    assert sequential.index == concurrent.index == 1
+
+
+def test_concurrent_match_stops_early():
+    """Test that candidates after an accepted one are not fetched
+    if they haven't been started yet"""
+    candidates = [SlowRelease(0, raw_tracks, delay=0.1)] + [
+        SlowRelease(i, ["Nope"], delay=0.1) for i in range(1, 10)
+    ]
+    match = import_service.find_matching_candidate_concurrently(
+        raw_tracks, candidates, workers=2
+    )
+    assert match is not None and match.index == 0
+    # workers that were busy, or that grabbed a new candidate before
+    # the accepted one was noticed, get a chance to finish
+    time.sleep(0.3)
+    assert sum(candidate.fetched.is_set() for candidate in candidates) <= 4
+
+
+def test_concurrent_match_accepted_while_earlier_candidate_runs():
+    """Test that an accepted candidate that finishes while an earlier one is
+    still being fetched wins once that one is rejected, and that the candidates
+    after it being dropped doesn't fail the match"""
+    candidates = [
+        SlowRelease(0, ["Something", "Else"], delay=0.2),
+        SlowRelease(1, raw_tracks),
+    ] + [SlowRelease(i, ["Nope"], delay=0.1) for i in range(2, 6)]
+    match = import_service.find_matching_candidate_concurrently(
+        raw_tracks, candidates, workers=2
+    )
+    assert match is not None and match.index == 1
+
+
+def test_concurrent_match_without_accepted_candidate():
+    candidates = [SlowRelease(i, ["Nope"]) for i in range(5)]
+    assert (
+        import_service.find_matching_candidate_concurrently(
+            raw_tracks, candidates, workers=2
+        )
+        is None
+    )
+
+
+def search_result(id: int, title: str, **data) -> SlowRelease:
+    release = SlowRelease(id, raw_tracks)
+    release.data = dict(id=id, title=title, **data)  # type: ignore
+    return release
+
+
+def test_hopeless_candidates_are_not_fetched():
+    """Test that candidates are ranked by their search results, and the ones
+    with another title, a video format or far too many tracks are dropped
+    without their tracklist being fetched"""
+    candidates = [
+        search_result(0, "Someone Else - Unrelated"),
+        search_result(1, "John Coltrane - Blue Train", format=["DVD", "NTSC"]),
+        search_result(2, "John Coltrane - Blue Train", track_count=12),
+        search_result(3, "John Coltrane - Blue Trane Live"),
+        search_result(4, "John Coltrane - Blue Train", format=["CD", "Album"]),
+        search_result(5, "John Coltrane - Blue Train", format=["CD", "DVD"], track_count=2),
+    ]
+    ranked, pruned = import_service.rank_candidates(
+        candidates, "Blue Train", "John Coltrane", len(raw_tracks)
+    )
+    assert [release.id for release in ranked] == [4, 5, 3]
+    assert pruned == 3
+    match = import_service.find_matching_candidate(raw_tracks, ranked)
+    assert match is not None and match.album_res.id == 4
+    assert [release.fetched.is_set() for release in candidates] == [False] * 4 + [True, False]
+
+
+def test_candidates_without_search_data_are_kept():
+    candidates = [SlowRelease(0, raw_tracks), SlowRelease(1, raw_tracks)]
+    ranked, pruned = import_service.rank_candidates(candidates, "Blue Train", None, 2)
+    assert ranked == candidates
+    assert pruned == 0
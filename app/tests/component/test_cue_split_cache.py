@@ -0,0 +1,89 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from mptreasury.adapters.cue_split_cache import CueSplitCache
+
+
+def make_cue_folder(path: Path, audio: bytes) -> Path:
+    path.mkdir(parents=True)
+    (path / "album.cue").write_text('FILE "album.flac" WAVE\n')
+    (path / "album.flac").write_bytes(audio)
+    return path
+
+
+class FakeSplitter:
+    def __init__(self, song_size: int = 10) -> None:
+        self.calls: list[Path] = []
+        self.song_size = song_size
+
+    def __call__(self, target: Path):
+        self.calls.append(target)
+        songs = target / "Artist" / "Album"
+        songs.mkdir(parents=True)
+        for i in range(2):
+            (songs / f"0{i} - Song.flac").write_bytes(b"x" * self.song_size)
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> CueSplitCache:
+    return CueSplitCache(tmp_path / "cache", max_bytes=60)
+
+
+def test_split_is_reused_by_content(cache: CueSplitCache, tmp_path: Path):
+    """Test that the same rip is split once, even from differently named
+    folders, and that a different rip with the same folder name is not mixed up"""
+    split = FakeSplitter()
+    first = cache.get_or_split(make_cue_folder(tmp_path / "a" / "Album", b"1"), split)
+    again = cache.get_or_split(make_cue_folder(tmp_path / "b" / "Renamed", b"1"), split)
+    assert first == again
+    assert len(split.calls) == 1
+    other = cache.get_or_split(make_cue_folder(tmp_path / "c" / "Album", b"2"), split)
+    assert other != first
+    assert len(split.calls) == 2
+    assert (first / "Artist" / "Album" / "00 - Song.flac").exists()
+
+
+def test_emptied_entry_is_split_again(cache: CueSplitCache, tmp_path: Path):
+    """Test that an entry whose songs were moved out, like the move placement
+    strategy does, isn't reused"""
+    cue_folder = make_cue_folder(tmp_path / "Album", b"1")
+    split = FakeSplitter()
+    entry = cache.get_or_split(cue_folder, split)
+    (entry / "Artist" / "Album" / "01 - Song.flac").rename(tmp_path / "moved.flac")
+    assert cache.get_or_split(cue_folder, split) == entry
+    assert len(split.calls) == 2
+    assert (entry / "Artist" / "Album" / "01 - Song.flac").exists()
+
+
+def test_failed_split_is_not_cached(cache: CueSplitCache, tmp_path: Path):
+    cue_folder = make_cue_folder(tmp_path / "Album", b"1")
+
+    def failing_split(target: Path):
+        (target / "half written.flac").write_bytes(b"x")
+        raise RuntimeError("sox died")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_split(cue_folder, failing_split)
+    split = FakeSplitter()
+    cache.get_or_split(cue_folder, split)
+    assert len(split.calls) == 1
+    assert [entry.name for entry in cache.folder.iterdir() if "partial" in entry.name] == []
+
+
+def test_least_recently_used_split_is_evicted(cache: CueSplitCache, tmp_path: Path):
+    split = FakeSplitter(song_size=10)
+    folders = [make_cue_folder(tmp_path / str(i), bytes([i])) for i in range(3)]
+    entries = []
+    for age, folder in enumerate(folders):
+        entry = cache.get_or_split(folder, split)
+        os.utime(entry, (1000 + age, 1000 + age))
+        entries.append(entry)
+    # using the oldest one makes the second one the least recently used
+    cache.get_or_split(folders[0], split)
+    cache.get_or_split(make_cue_folder(tmp_path / "3", b"3"), split)
+    assert cache.size() <= 60
+    assert len(split.calls) == 4
+    assert entries[0].exists()
+    assert not entries[1].exists()
@@ -0,0 +1,111 @@
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from pathlib import Path
+
+import pytest
+
+from app import model
+from mptreasury.adapters import cue_splitter
+from mptreasury.core.config import Config
+
+CUE_SHEET = """REM GENRE Rock
+REM DATE 1994
+PERFORMER "Test Artist"
+TITLE "Test/Album"
+FILE "album image.wav" WAVE
+  TRACK 01 AUDIO
+    TITLE "First Song"
+    INDEX 01 00:00:00
+  TRACK 02 AUDIO
+    TITLE "Second Song"
+    PERFORMER "Guest Artist"
+    INDEX 00 00:01:00
+    INDEX 01 00:01:30
+  TRACK 03 AUDIO
+    TITLE "Third Song"
+    INDEX 01 00:02:74
+"""
+
+
+@pytest.fixture
+def cue_folder(tmp_path: Path) -> Path:
+    folder = tmp_path / "Test Artist - Test Album"
+    folder.mkdir()
+    (folder / "album.cue").write_text(CUE_SHEET)
+    with wave.open(str(folder / "album image.wav"), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"\0\0" * 8000 * 4)
+    return folder
+
+
+def test_parse_cue_sheet(cue_folder: Path):
+    sheet = cue_splitter.parse_cue_sheet(cue_folder / "album.cue")
+    assert (sheet.performer, sheet.title, sheet.date) == (
+        "Test Artist",
+        "Test/Album",
+        "1994",
+    )
+    assert [track.title for track in sheet.tracks] == [
+        "First Song",
+        "Second Song",
+        "Third Song",
+    ]
+    assert [track.performer for track in sheet.tracks] == [None, "Guest Artist", None]
+    # the pregap (INDEX 00) is left to the previous track
+    assert [(track.start, track.end) for track in sheet.tracks] == [
+        (0, 105),
+        (105, 224),
+        (224, None),
+    ]
+    assert sheet.tracks[0].file == cue_folder / "album image.wav"
+
+
+def test_tracks_are_split_concurrently(
+    cue_folder: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    running = 0
+    most_running = 0
+    lock = threading.Lock()
+    commands: list[list[str]] = []
+
+    def fake_run(command: list[str], **kwargs):
+        nonlocal running, most_running
+        with lock:
+            commands.append(command)
+            running += 1
+            most_running = max(most_running, running)
+        time.sleep(0.05)
+        Path(command[command.index("trim") - 1]).write_bytes(b"flac")
+        with lock:
+            running -= 1
+
+    monkeypatch.setattr(subprocess, "run", fake_run)
+    songs_folder = cue_splitter.split_cue_album(
+        cue_folder / "album.cue", tmp_path / "split", workers=3
+    )
+    assert songs_folder == tmp_path / "split" / "Test Artist" / "1994 - TestAlbum"
+    assert most_running > 1
+    assert sorted(path.name for path in songs_folder.iterdir()) == [
+        "1 - First Song.flac",
+        "2 - Second Song.flac",
+        "3 - Third Song.flac",
+    ]
+    second = next(command for command in commands if "2 - Second" in " ".join(command))
+    assert second[-3:] == ["trim", "1.400000", "=2.986667"]
+    assert "--add-comment=ARTIST=Guest Artist" in second
+    # what RawAlbum makes of the split songs
+    cue_parser = model.CueParser(Config(CACHE_FOLDER=tmp_path / "cache"))
+    assert cue_parser._get_folder_with_songs(tmp_path / "split") == songs_folder
+
+
+@pytest.mark.skipif(shutil.which("sox") is None, reason="sox is not installed")
+def test_split_with_sox(cue_folder: Path, tmp_path: Path):
+    songs_folder = cue_splitter.split_cue_album(
+        cue_folder / "album.cue", tmp_path / "split", workers=2
+    )
+    assert len(list(songs_folder.glob("*.flac"))) == 3
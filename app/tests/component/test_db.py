@@ -0,0 +1,153 @@
+import sqlite3
+from pathlib import Path
+
+from sqlalchemy import select, text
+
+from app.model import Album, Song
+from mptreasury.core import db
+from mptreasury.core.config import Config
+
+
+def make_album(master_provider_id: int) -> tuple[Album, list[Song]]:
+    album = Album(
+        name=f"Album {master_provider_id}",
+        genre="Rock",
+        released=1990,
+        artist_id=1,
+        artist_name="Artist",
+        master_provider_id=master_provider_id,
+        master_name=f"Master {master_provider_id}",
+        provider_id=master_provider_id * 10,
+    )
+    songs = [
+        Song(
+            title=f"Song {i}",
+            album_name=album.name,
+            artist_name=album.artist_name,
+            local_path=Path(f"/lib/{master_provider_id}/{i}.flac"),
+            album=album,
+        )
+        for i in range(3)
+    ]
+    return album, songs
+
+
+def test_bulk_write_assigns_ids(Session):
+    entries = [make_album(1), make_album(2)]
+    db.add_albums_and_songs(entries, Session)
+    for album, songs in entries:
+        assert album.id is not None
+        assert all(song.id is not None for song in songs)
+    with Session() as session:
+        assert len(session.execute(select(Album)).all()) == 2
+        assert len(session.execute(select(Song)).all()) == 6
+
+
+def test_batch_is_written_when_full(Session):
+    flushed: list[list[Album]] = []
+    batch = db.ImportBatch(Session, batch_size=2, on_flush=flushed.append)
+    batch.add(*make_album(1))
+    assert flushed == []
+    batch.add(*make_album(2))
+    assert [len(albums) for albums in flushed] == [2]
+    album, songs = make_album(3)
+    batch.add(album, songs)
+    assert batch.has_album(album)
+    batch.flush()
+    assert batch.written == 3
+    assert not batch.has_album(album)
+
+
+def test_same_master_twice_in_a_batch_is_written_once(Session):
+    first, first_songs = make_album(1)
+    second, second_songs = make_album(1)
+    db.add_albums_and_songs([(first, first_songs), (second, second_songs)], Session)
+    assert first.id is not None
+    assert second.id == first.id
+    with Session() as session:
+        assert len(session.execute(select(Album)).all()) == 1
+
+
+def test_album_key_is_claimed_once(Session):
+    batch = db.ImportBatch(Session, batch_size=0)
+    album, _ = make_album(1)
+    assert batch.claim(album)
+    assert not batch.claim(make_album(1)[0])
+    assert batch.claim(make_album(2)[0])
+    batch.release(album)
+    assert batch.claim(make_album(1)[0])
+
+
+def test_batch_rows_round_trip(Session):
+    """Test that a batch can be handed over as plain rows, like worker processes do"""
+    worker_batch = db.ImportBatch(Session, batch_size=0)
+    worker_batch.add(*make_album(1))
+    parent_batch = db.ImportBatch(Session, batch_size=0)
+    parent_batch.add_rows(worker_batch.rows())
+    parent_batch.flush()
+    with Session() as session:
+        songs = session.execute(select(Song)).scalars().all()
+        assert sorted(song.title for song in songs) == ["Song 0", "Song 1", "Song 2"]
+        assert songs[0].local_path == Path("/lib/1/0.flac")
+
+
+def test_sqlite_pragmas(Session):
+    with Session() as session:
+        assert session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert session.execute(text("PRAGMA synchronous")).scalar() == 1
+
+
+def test_existing_master_ids_lookup(Session):
+    db.add_albums_and_songs([make_album(1), make_album(2)], Session)
+    assert db.get_existing_master_ids([1, 2, 3, None], Session) == {1, 2}
+
+
+def test_existing_album_is_not_written_again(Session):
+    """Test that an album whose master is already in the library keeps its id,
+    and that its songs are not added twice"""
+    first, _ = entry = make_album(1)
+    db.add_albums_and_songs([entry], Session)
+    again, _ = duplicate = make_album(1)
+    db.add_albums_and_songs([duplicate, make_album(1)], Session)
+    assert again.id == first.id
+    with Session() as session:
+        assert len(session.execute(select(Album)).all()) == 1
+        assert len(session.execute(select(Song)).all()) == 3
+
+
+def test_masterless_albums_are_deduplicated_by_release(Session):
+    """Test that releases without a master are told apart by their own id,
+    which may well be the id of some other master"""
+    mastered, _ = entry = make_album(1)
+    masterless = []
+    for _ in range(2):
+        album, songs = make_album(2)
+        album.master_provider_id = album.master_name = None
+        album.provider_id = 1
+        masterless.append((album, songs))
+    db.add_albums_and_songs([entry, masterless[0]], Session)
+    db.add_albums_and_songs([masterless[1]], Session)
+    first, again = (album for album, _ in masterless)
+    assert first.id not in (None, mastered.id)
+    assert again.id == first.id
+    assert db.get_album_id(again, Session) == first.id
+    assert db.get_existing_master_ids([1], Session) == {1}
+    with Session() as session:
+        assert len(session.execute(select(Album)).all()) == 2
+        assert len(session.execute(select(Song)).all()) == 6
+
+
+def test_unique_index_added_to_existing_db(tmp_path: Path, open_library_db):
+    """Test that dbs created before the dedup indexes existed get them"""
+    db_file = tmp_path / "old.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "CREATE TABLE albums (id INTEGER PRIMARY KEY, name VARCHAR, genre VARCHAR, "
+        "released INTEGER, artist_id INTEGER, artist_name VARCHAR, "
+        "provider_id INTEGER, master_name VARCHAR, master_provider_id INTEGER)"
+    )
+    conn.close()
+    open_library_db(Config(DB_FILE=db_file))
+    conn = sqlite3.connect(db_file)
+    indexes = [row[1] for row in conn.execute("PRAGMA index_list(albums)")]
+    assert "ux_albums_master_provider_id" in indexes
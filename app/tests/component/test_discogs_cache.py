@@ -0,0 +1,69 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from mptreasury.adapters.discogs_cache import CachingFetcher, DiscogsCache
+
+
+class FakeFetcher:
+    def __init__(self) -> None:
+        self.calls = []
+
+    def fetch(self, client, method, url, data=None, headers=None, json=True):
+        self.calls.append((method, url))
+        return f"payload for {url}".encode(), 200
+
+
+@pytest.fixture
+def cache(tmp_path: Path):
+    cache = DiscogsCache(tmp_path, max_bytes=1024, search_ttl=60, release_ttl=600)
+    yield cache
+    cache.close()
+
+
+def test_release_is_fetched_only_once(cache: DiscogsCache):
+    """Test that a second request for the same release is served from the cache"""
+    fetcher = FakeFetcher()
+    caching_fetcher = CachingFetcher(fetcher, cache)
+    url = "https://api.discogs.com/releases/123"
+    first = caching_fetcher.fetch(None, "GET", url)
+    second = caching_fetcher.fetch(None, "GET", url)
+    assert first == second
+    assert len(fetcher.calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_uncacheable_urls_are_passed_through(cache: DiscogsCache):
+    """Test that requests that aren't searches, releases or masters are never cached"""
+    fetcher = FakeFetcher()
+    caching_fetcher = CachingFetcher(fetcher, cache)
+    url = "https://api.discogs.com/users/someone"
+    caching_fetcher.fetch(None, "GET", url)
+    caching_fetcher.fetch(None, "GET", url)
+    assert len(fetcher.calls) == 2
+
+
+def test_expired_entry_is_a_miss(cache: DiscogsCache):
+    """Test that an entry is not served after its TTL passed"""
+    cache.put("key", b"value", ttl=-1)
+    assert cache.get("key") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(cache: DiscogsCache):
+    """Test that when the cache grows over its size limit,
+    the entry that was used the longest time ago is evicted first"""
+    cache.put("old", b"a" * 400, ttl=60)
+    time.sleep(0.01)
+    cache.put("recent", b"b" * 400, ttl=60)
+    time.sleep(0.01)
+    # touching "old" makes "recent" the least recently used
+    cache.get("old")
+    time.sleep(0.01)
+    cache.put("new", b"c" * 400, ttl=60)
+    assert cache.get("recent") is None
+    assert cache.get("old") is not None
+    assert cache.get("new") is not None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,123 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from mptreasury.adapters.discogs_adapter import OfflineSearcher, Searcher
+from mptreasury.adapters.discogs_dump import DiscogsDumpIndex
+from mptreasury.core import db
+from mptreasury.services import import_service
+from mptreasury.util import injection
+
+RELEASES_DUMP = """<releases>
+<release id="1577" status="Accepted">
+  <artists><artist><id>97545</id><name>John Coltrane (2)</name></artist></artists>
+  <title>Blue Train</title>
+  <formats><format name="Vinyl" qty="1"><descriptions><description>LP</description><description>Album</description></descriptions></format></formats>
+  <genres><genre>Jazz</genre></genres>
+  <released>1957-09-00</released>
+  <master_id is_main_release="true">15</master_id>
+  <tracklist>
+    <track><position></position><title>Side One</title></track>
+    <track><position>A1</position><title>Blue Train</title></track>
+    <track><position>A2</position><title>Moment's Notice</title></track>
+    <track><position>B</position><title>Medley</title>
+      <sub_tracks><track><position>B.a</position><title>Locomotion</title></track></sub_tracks>
+    </track>
+    <track><position>B2</position><title>Lazy Bird</title></track>
+  </tracklist>
+</release>
+<release id="2000" status="Accepted">
+  <artists><artist><id>1</id><name>Someone Else</name></artist></artists>
+  <title>Blue Train Remixes</title>
+  <genres><genre>Electronic</genre></genres>
+  <tracklist><track><position>1</position><title>Blue Train (Dub)</title></track></tracklist>
+</release>
+<release id="3000" status="Rejected">
+  <artists><artist><id>97545</id><name>John Coltrane</name></artist></artists>
+  <title>Blue Train</title>
+</release>
+</releases>
+"""
+
+MASTERS_DUMP = """<masters>
+<master id="15"><main_release>1577</main_release><title>Blue Train</title><year>1957</year></master>
+</masters>
+"""
+
+
+@pytest.fixture
+def index(tmp_path: Path):
+    releases = tmp_path / "discogs_releases.xml.gz"
+    releases.write_bytes(gzip.compress(RELEASES_DUMP.encode()))
+    masters = tmp_path / "discogs_masters.xml"
+    masters.write_text(MASTERS_DUMP)
+    index = DiscogsDumpIndex(tmp_path / "dump.sqlite")
+    assert index.ingest(releases) == dict(releases=2, masters=0, skipped=1)
+    assert index.ingest(masters) == dict(releases=0, masters=1, skipped=0)
+    yield index
+    index.close()
+
+
+def test_dump_is_searchable(index: DiscogsDumpIndex):
+    """Test that releases are found by words of their title and artist,
+    exact titles first, and only with the tracks the API would list"""
+    assert [r.id for r in index.search("blue train")] == [1577, 2000]
+    assert [r.id for r in index.search("Blue Train", "John Coltrane")] == [1577]
+    assert index.search("Blue Train", "Miles Davis") == []
+    release = index.release(1577)
+    assert release is not None
+    assert (release.title, release.year, release.genres) == ("Blue Train", 1957, ["Jazz"])
+    assert release.artists[0].name == "John Coltrane"
+    assert (release.master.id, release.master.title) == (15, "Blue Train")
+    # like the API, no master rather than one made up from the release
+    assert index.release(2000).master is None  # type: ignore
+    assert release.data["format"] == ["Vinyl", "LP", "Album"]
+    assert [track.title for track in release.tracklist] == [
+        "Blue Train",
+        "Moment's Notice",
+        "Lazy Bird",
+    ]
+
+
+def test_reingesting_replaces_entries(index: DiscogsDumpIndex, tmp_path: Path):
+    dump = tmp_path / "again.xml"
+    dump.write_text(RELEASES_DUMP.replace("Moment's Notice", "Moments Notice"))
+    index.ingest(dump)
+    assert len(index.search("blue train")) == 2
+    assert "Moments Notice" in index.tracks(1577)
+
+
+@pytest.mark.parametrize(
+    "folder_name, titles, provider_id, master_id",
+    [
+        (
+            "John Coltrane - Blue Train (1957)",
+            ["Blue Train", "Moment's Notice", "Lazy Bird"],
+            1577,
+            15,
+        ),
+        ("Someone Else - Blue Train Remixes", ["Blue Train (Dub)"], 2000, None),
+    ],
+)
+def test_album_is_imported_offline(
+    index: DiscogsDumpIndex,
+    injected,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    folder_name: str,
+    titles: list[str],
+    provider_id: int,
+    master_id: int | None,
+):
+    monkeypatch.setitem(injection._INJECTS, Searcher, OfflineSearcher(index))
+    folder = tmp_path / "src" / folder_name
+    folder.mkdir(parents=True)
+    for number, title in enumerate(titles):
+        (folder / f"{number + 1:02} - {title}.flac").touch()
+    result = import_service.import_album_folder(folder)
+    assert result.status == import_service.AlbumImportStatus.imported
+    assert (result.provider_id, result.songs_count) == (provider_id, len(titles))
+    with db.master_engine.connect() as conn:  # type: ignore
+        (album,) = conn.execute(db.albums_table.select()).all()
+    assert album.master_provider_id == master_id
@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from discogs_client import Client
+
+from mptreasury.adapters.discogs_rate_limit import (
+    RateLimitedFetcher,
+    RateLimiter,
+    retry_after_seconds,
+)
+
+
+class StubDiscogs(ThreadingHTTPServer):
+    """Answers every request with a release, after `delay` seconds; the first
+    `throttle` requests get a 429 instead"""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.lock = threading.Lock()
+        self.requests: list[tuple[float, str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.throttle = 0
+        self.retry_after: str | None = None
+        self.delay = 0.0
+        self.headers = {"X-Discogs-Ratelimit": "600", "X-Discogs-Ratelimit-Remaining": "599"}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: StubDiscogs
+
+    def do_GET(self):
+        stub = self.server
+        with stub.lock:
+            stub.requests.append((time.monotonic(), self.path))
+            stub.in_flight += 1
+            stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+            throttled = stub.throttle > 0
+            stub.throttle -= 1
+        time.sleep(stub.delay)
+        with stub.lock:
+            stub.in_flight -= 1
+        if throttled:
+            self.send_response(429)
+            if stub.retry_after is not None:
+                self.send_header("Retry-After", stub.retry_after)
+            body = b'{"message": "You are making requests too quickly."}'
+        else:
+            self.send_response(200)
+            body = json.dumps({"id": 1, "title": "Blue Train"}).encode()
+        for name, value in stub.headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    stub = StubDiscogs()
+    thread = threading.Thread(target=stub.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.shutdown()
+    stub.server_close()
+
+
+def make_client(stub: StubDiscogs, limiter: RateLimiter) -> Client:
+    client = Client("mptreasury-tests/0.1", user_token="token")
+    client._base_url = stub.url
+    client._fetcher = RateLimitedFetcher("token", limiter, max_retries=3)
+    return client
+
+
+def test_throttled_request_is_retried_after_retry_after(stub: StubDiscogs):
+    """Test that a 429 pauses requests for as long as Retry-After says,
+    halves the concurrency, and that the request is then sent again"""
+    stub.throttle = 1
+    stub.retry_after = "0.3"
+    limiter = RateLimiter(requests_per_minute=600, max_concurrency=4)
+    client = make_client(stub, limiter)
+    assert client.release(1).title == "Blue Train"
+    (first, _), (second, path) = stub.requests
+    assert second - first >= 0.3
+    assert path.startswith("/releases/1")
+    assert limiter.stats()["concurrency"] == 2
+    assert limiter.throttled == 1
+
+
+def test_requests_in_flight_never_exceed_concurrency(stub: StubDiscogs):
+    """Test that the threads sharing a limiter don't send more requests at once
+    than it allows"""
+    stub.delay = 0.05
+    limiter = RateLimiter(requests_per_minute=6000, max_concurrency=2)
+    fetcher = RateLimitedFetcher("token", limiter)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda i: fetcher.fetch(None, "GET", f"{stub.url}/releases/{i}"),
+                range(16),
+            )
+        )
+    assert all(status == 200 for _, status in results)
+    assert stub.max_in_flight == 2
+
+
+def test_rate_limit_headers_drain_the_bucket(stub: StubDiscogs):
+    """Test that the limit and remaining requests reported by Discogs, which
+    count requests from everywhere, are what the limiter goes by"""
+    stub.headers = {"X-Discogs-Ratelimit": "120", "X-Discogs-Ratelimit-Remaining": "0"}
+    limiter = RateLimiter(requests_per_minute=600, max_concurrency=4)
+    fetcher = RateLimitedFetcher("token", limiter)
+    fetcher.fetch(None, "GET", f"{stub.url}/releases/1")
+    assert limiter.stats()["limit"] == 120
+    fetcher.fetch(None, "GET", f"{stub.url}/releases/2")
+    (first, _), (second, _) = stub.requests
+    # two requests a second make for half a second until the next token
+    assert second - first >= 0.4
+
+
+def test_retry_after_formats():
+    assert retry_after_seconds("2") == 2.0
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert retry_after_seconds("soon") is None
@@ -0,0 +1,127 @@
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from mptreasury.adapters import embedded_tags, tag_writer
+from mptreasury.adapters.discogs_adapter import (
+    FakeArtist,
+    FakeDiscogsAlbum,
+    FakeDiscogsCatalogClient,
+    FakeMaster,
+    Searcher,
+)
+from mptreasury.services import import_service
+from mptreasury.util import injection
+
+TITLES = ["Blue Train", "Moment's Notice", "Locomotion"]
+
+
+def write_flac(path: Path, tags: dict[str, str]):
+    info = struct.pack(">HH", 4096, 4096) + b"\0" * 6
+    info += ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, "big") + b"\0" * 16
+    path.write_bytes(b"fLaC" + bytes([0x80]) + len(info).to_bytes(3, "big") + info)
+    tag_writer.sync_file(path, tags)
+
+
+def tagged_album(folder: Path, release_id: str | None = None, album="Blue Train"):
+    """An album whose file names say nothing, but whose tags say it all"""
+    folder.mkdir(parents=True)
+    for number, title in enumerate(TITLES):
+        tags = dict(title=title, artist="John Coltrane", album=album)
+        if release_id is not None:
+            tags[tag_writer.DISCOGS_RELEASE_ID] = release_id
+        write_flac(folder / f"track{number:02}.flac", tags)
+    return folder
+
+
+@pytest.fixture
+def client(injected, monkeypatch: pytest.MonkeyPatch) -> FakeDiscogsCatalogClient:
+    release = FakeDiscogsAlbum(
+        TITLES,
+        id=1577,
+        title="Blue Train",
+        artist=FakeArtist(id=1, name="John Coltrane"),
+        master=FakeMaster(id=15, title="Blue Train"),
+    )
+    client = FakeDiscogsCatalogClient([release], decoys=3)
+    monkeypatch.setitem(injection._INJECTS, Searcher, Searcher(client))  # type: ignore
+    return client
+
+
+def test_album_tags_are_read(tmp_path: Path):
+    folder = tagged_album(tmp_path / "rip", release_id="https://www.discogs.com/release/1577-Blue-Train")
+    paths = sorted(folder.iterdir())
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        tags = embedded_tags.read_album_tags(paths, executor)
+    assert (tags.album, tags.artist, tags.release_id) == ("Blue Train", "John Coltrane", 1577)
+    assert [tags.titles[path] for path in paths] == TITLES
+    assert tags.complete_for(paths)
+    (tmp_path / "rip" / "untagged.flac").write_bytes(b"not flac")
+    assert not embedded_tags.read_album_tags(sorted(folder.iterdir())).complete_for(
+        sorted(folder.iterdir())
+    )
+
+
+def test_tagged_release_is_fetched_without_searching(
+    tmp_path: Path, client: FakeDiscogsCatalogClient
+):
+    folder = tagged_album(tmp_path / "src" / "unknown rip", release_id="1577")
+    result = import_service.import_album_folder(folder)
+    assert result.status == import_service.AlbumImportStatus.imported
+    assert result.provider_id == 1577
+    assert (client.searches, client.releases) == (0, 1)
+
+
+def test_search_is_seeded_from_tags(tmp_path: Path, client: FakeDiscogsCatalogClient):
+    folder = tagged_album(tmp_path / "src" / "unknown rip")
+    result = import_service.import_album_folder(folder)
+    assert result.status == import_service.AlbumImportStatus.imported
+    assert (client.searches, client.releases) == (1, 0)
+
+
+def test_missing_tagged_release_falls_back_to_search(
+    tmp_path: Path, client: FakeDiscogsCatalogClient
+):
+    folder = tagged_album(tmp_path / "src" / "unknown rip", release_id="404")
+    result = import_service.import_album_folder(folder)
+    assert result.status == import_service.AlbumImportStatus.imported
+    assert (client.searches, client.releases) == (1, 1)
+
+
+def test_tagged_album_folder_is_imported_on_its_own(
+    tmp_path: Path, client: FakeDiscogsCatalogClient
+):
+    """Test that importing an album folder by itself, rather than as part of
+    an artist folder, reads its tags too, and records it for the next scan"""
+    folder = tagged_album(tmp_path / "src" / "unknown rip", release_id="1577")
+    (result,) = import_service.import_folder(folder, incremental=True)
+    assert result.status == import_service.AlbumImportStatus.imported
+    assert (result.provider_id, result.songs_count) == (1577, 3)
+    assert (client.searches, client.releases) == (0, 1)
+    (result,) = import_service.import_folder(folder, incremental=True)
+    assert result.status == import_service.AlbumImportStatus.unchanged
+    assert (client.searches, client.releases) == (0, 1)
+
+
+def test_albums_of_an_import_share_a_tag_reader(
+    tmp_path: Path,
+    injected,
+    client: FakeDiscogsCatalogClient,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    injected.TAG_WORKERS = 2
+    artist_folder = tmp_path / "src" / "John Coltrane"
+    tagged_album(artist_folder / "first rip", release_id="1577")
+    tagged_album(artist_folder / "second rip", release_id="1577")
+    executors = []
+
+    def read_album_tags(paths, executor=None):
+        executors.append(executor)
+        return embedded_tags.read_album_tags(paths, executor)
+
+    monkeypatch.setattr(import_service, "read_album_tags", read_album_tags)
+    import_service.import_artist_folder(artist_folder, workers=1)
+    assert len(executors) == 2
+    assert executors[0] is not None and executors[0] is executors[1]
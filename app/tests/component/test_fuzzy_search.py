@@ -0,0 +1,138 @@
+import sqlite3
+from pathlib import Path
+
+from sqlalchemy import select
+
+from app import model
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.core.constants import SearchTermKind
+from mptreasury.services import fuzzy_search_service
+from mptreasury.util.trigrams import trigrams
+
+
+def make_album(name: str, artist: str, master_id: int) -> model.Album:
+    return model.Album(
+        name=name,
+        genre="Rock",
+        released=1990,
+        artist_id=master_id * 10,
+        artist_name=artist,
+        master_provider_id=master_id,
+        master_name=name,
+        provider_id=master_id,
+    )
+
+
+def make_song(title: str, album: model.Album, path: str) -> model.Song:
+    return model.Song(
+        title=title,
+        album_name=album.name,
+        artist_name=album.artist_name,
+        local_path=Path(path),
+    )
+
+
+def names(matches: list[dict]) -> list[tuple[str, str]]:
+    return [(match["kind"], match["name"]) for match in matches]
+
+
+def test_trigrams_ignore_case_and_accents():
+    assert trigrams("Abc") == {" ab", "abc", "bc "}
+    assert trigrams("a") == {" a "}
+    assert trigrams("Café!") == trigrams("cafe")
+
+
+def test_misspelled_names_are_found(Session):
+    album = make_album("Metamorfosi Inferno", "Metamorfosi", 1)
+    other = make_album("Blue Train", "John Coltrane", 2)
+    db.add_albums_and_songs(
+        [
+            (album, [make_song("Paradiso", album, "/lib/1.flac")]),
+            (other, [make_song("Moment's Notice", other, "/lib/2.flac")]),
+        ],
+        Session,
+    )
+    search = fuzzy_search_service.fuzzy_search
+    matches = search("metamorfossi infern", Session=Session)
+    assert names(matches)[0] == ("album", "Metamorfosi Inferno")
+    assert matches[0]["id"] == album.id
+    assert names(search("jon coltran", Session=Session)) == [("artist", "John Coltrane")]
+    assert names(search("moments notise", ["song"], Session=Session)) == [
+        ("song", "Moment's Notice")
+    ]
+    assert search("metamorfossi", ["song"], Session=Session) == []
+
+
+def test_renamed_songs_are_reindexed(Session):
+    album = make_album("Album", "Artist", 1)
+    db.add_album_and_songs(album, [make_song("Old Title", album, "/lib/1.flac")], Session)
+    renamed = make_album("Album", "Artist", 2)
+    db.add_album_and_songs(
+        renamed, [make_song("Brand New Name", renamed, "/lib/1.flac")], Session
+    )
+    search = fuzzy_search_service.fuzzy_search
+    assert search("old title", ["song"], Session=Session) == []
+    assert names(search("brand new nme", ["song"], Session=Session)) == [
+        ("song", "Brand New Name")
+    ]
+
+
+def test_existing_library_is_indexed(tmp_path: Path, open_library_db):
+    db_file = tmp_path / "old.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "CREATE TABLE albums (id INTEGER PRIMARY KEY, name VARCHAR, genre VARCHAR, "
+        "released INTEGER, artist_id INTEGER, artist_name VARCHAR, "
+        "provider_id INTEGER, master_name VARCHAR, master_provider_id INTEGER)"
+    )
+    conn.execute(
+        "INSERT INTO albums (name, artist_id, artist_name, master_provider_id) "
+        "VALUES ('Metamorfosi Inferno', 7, 'Metamorfosi', 1)"
+    )
+    conn.commit()
+    conn.close()
+    Session = open_library_db(Config(DB_FILE=db_file))
+    matches = fuzzy_search_service.fuzzy_search("metamorfosi infrno", Session=Session)
+    assert names(matches)[0] == ("album", "Metamorfosi Inferno")
+
+
+
+def test_only_new_and_renamed_terms_are_written(Session):
+    """Test that reindexing leaves unchanged terms' trigrams alone, and drops
+    the old trigrams of renamed ones"""
+
+    def grams(session) -> dict[tuple[str, int], set[str]]:
+        rows = session.execute(
+            select(
+                db.search_terms_table.c.kind,
+                db.search_terms_table.c.ref_id,
+                db.trigrams_table.c.gram,
+            ).join(
+                db.trigrams_table,
+                db.trigrams_table.c.term_id == db.search_terms_table.c.id,
+            )
+        )
+        by_term: dict[tuple[str, int], set[str]] = {}
+        for kind, ref_id, gram in rows:
+            by_term.setdefault((kind, ref_id), set()).add(gram)
+        return by_term
+
+    with Session() as session:
+        db.index_search_terms(
+            session,
+            [(SearchTermKind.artist, 1, "Coltrane"), (SearchTermKind.song, 1, "Naima")],
+        )
+        db.index_search_terms(
+            session,
+            [
+                (SearchTermKind.artist, 1, "Coltrane"),
+                (SearchTermKind.song, 1, "Equinox"),
+                (SearchTermKind.song, 2, "Naima"),
+            ],
+        )
+        assert grams(session) == {
+            ("artist", 1): trigrams("Coltrane"),
+            ("song", 1): trigrams("Equinox"),
+            ("song", 2): trigrams("Naima"),
+        }
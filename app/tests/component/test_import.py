@@ -1,10 +1,13 @@
+import errno
 import os
 import shutil
 from pathlib import Path
 
 import pytest
 
-from app import import_service, model
+from app import model
+from mptreasury.core.constants import PlacementStrategy
+from mptreasury.services import import_service, placement_service
 
 
 @pytest.fixture
@@ -123,3 +126,130 @@ def test_copy_songs_to_music_folder_non_ascii_title(
     )
     assert str(song_with_non_ascii_title.local_path).encode("ascii")
     assert str(song_with_non_ascii_title.local_path).endswith("/N Test Title.flac")
+
+
+@pytest.fixture
+def song_to_place(tmp_path: Path):
+    song_path = tmp_path / "downloads" / "01 - Test Title.flac"
+    song_path.parent.mkdir()
+    song_path.write_bytes(b"not really flac")
+    yield model.Song(
+        title="Test Title",
+        album_name="Test Album",
+        artist_name="Test Artist",
+        local_path=song_path,
+    )
+
+
+def test_hardlink_placement_shares_data(song_to_place: model.Song, tmp_path: Path):
+    source = song_to_place.local_path
+    import_service.copy_songs_to_music_folder(
+        [song_to_place], tmp_path / "lib", PlacementStrategy.hardlink
+    )
+    assert song_to_place.local_path.samefile(source)
+
+
+def test_move_placement_removes_source(song_to_place: model.Song, tmp_path: Path):
+    source = song_to_place.local_path
+    import_service.copy_songs_to_music_folder(
+        [song_to_place], tmp_path / "lib", PlacementStrategy.move
+    )
+    assert not source.exists()
+    assert song_to_place.local_path.read_bytes() == b"not really flac"
+
+
+@pytest.mark.parametrize(
+    "strategy", [PlacementStrategy.hardlink, PlacementStrategy.move]
+)
+def test_placement_across_devices_falls_back_to_copy(
+    song_to_place: model.Song, tmp_path: Path, monkeypatch, strategy
+):
+    """Test that when linking or renaming isn't possible between the source and
+    the library, the file is copied instead"""
+
+    def cross_device(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    monkeypatch.setattr(os, "rename", cross_device)
+    source = song_to_place.local_path
+    used = placement_service.place_file(
+        source, tmp_path / "placed.flac", strategy, verify=True
+    )
+    # a move stays a move, even if it's done by copying and deleting
+    expected = strategy if strategy == PlacementStrategy.move else PlacementStrategy.copy
+    assert used == expected
+    assert (tmp_path / "placed.flac").read_bytes() == b"not really flac"
+    assert source.exists() == (strategy != PlacementStrategy.move)
+
+
+def test_reflink_placement(song_to_place: model.Song, tmp_path: Path):
+    """Test that reflinks work, or fall back to copies where unsupported"""
+    import_service.copy_songs_to_music_folder(
+        [song_to_place], tmp_path / "lib", PlacementStrategy.reflink, workers=2
+    )
+    assert song_to_place.local_path.read_bytes() == b"not really flac"
+
+
+def make_song(title: str, album_name: str, path: Path) -> model.Song:
+    return model.Song(
+        title=title, album_name=album_name, artist_name="Test Artist", local_path=path
+    )
+
+
+def test_same_content_is_linked_not_copied(tmp_path: Path):
+    """Test that a song whose file is already in the library, from another rip
+    or release, is hard linked to it, and that the hashes are kept"""
+    (tmp_path / "rip1").mkdir()
+    (tmp_path / "rip2").mkdir()
+    for rip in ["rip1", "rip2"]:
+        (tmp_path / rip / "song.flac").write_bytes(b"same audio")
+    (tmp_path / "rip2" / "other.flac").write_bytes(b"other audio")
+    first = make_song("Song", "First Release", tmp_path / "rip1" / "song.flac")
+    import_service.copy_songs_to_music_folder(
+        [first], tmp_path / "lib", dedup=True, workers=2
+    )
+    assert first.content_hash == placement_service.file_checksum(first.local_path)
+
+    second = make_song("Song", "Second Release", tmp_path / "rip2" / "song.flac")
+    other = make_song("Other", "Second Release", tmp_path / "rip2" / "other.flac")
+    placement_service.hash_songs([second, other])
+    linked = placement_service.place_songs(
+        [second, other],
+        tmp_path / "lib",
+        library_files={first.content_hash: first.local_path},
+    )
+    assert linked == 1
+    assert second.local_path.samefile(first.local_path)
+    assert not other.local_path.samefile(tmp_path / "rip2" / "other.flac")
+
+
+def test_moved_duplicates_leave_no_source_behind(tmp_path: Path):
+    """Test that moving a song whose content is already in the library links it
+    to that file, and still removes the song's own file"""
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "song.flac").write_bytes(b"same audio")
+    (tmp_path / "song.flac").write_bytes(b"same audio")
+    song = make_song("Song", "Second Release", tmp_path / "song.flac")
+    placement_service.hash_songs([song])
+    linked = placement_service.place_songs(
+        [song],
+        tmp_path / "lib",
+        PlacementStrategy.move,
+        library_files={song.content_hash: tmp_path / "lib" / "song.flac"},
+    )
+    assert linked == 1
+    assert song.local_path.samefile(tmp_path / "lib" / "song.flac")
+    assert not (tmp_path / "song.flac").exists()
+
+
+def test_duplicates_within_an_import_are_linked(tmp_path: Path):
+    for name in ["a.flac", "b.flac"]:
+        (tmp_path / name).write_bytes(b"same audio")
+    songs = [
+        make_song("A", "Album", tmp_path / "a.flac"),
+        make_song("B", "Album", tmp_path / "b.flac"),
+    ]
+    placement_service.hash_songs(songs, workers=2)
+    assert placement_service.place_songs(songs, tmp_path / "lib", workers=2) == 1
+    assert songs[0].local_path.samefile(songs[1].local_path)
@@ -0,0 +1,114 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from mptreasury.adapters.discogs_dump import DiscogsDumpIndex
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.core.constants import PlacementStrategy
+from mptreasury.services import import_service
+from mptreasury.util.metrics import metrics
+
+ALBUMS = {
+    1001: ("Blue Train", ["Blue Train", "Moment's Notice", "Locomotion"]),
+    1002: ("Giant Steps", ["Giant Steps", "Cousin Mary", "Countdown"]),
+}
+
+
+def write_dump(path: Path):
+    releases = []
+    for id, (title, tracks) in ALBUMS.items():
+        tracklist = "".join(
+            f"<track><position>{n + 1}</position><title>{track}</title></track>"
+            for n, track in enumerate(tracks)
+        )
+        releases.append(
+            f'<release id="{id}" status="Accepted">'
+            "<artists><artist><id>97545</id><name>John Coltrane</name></artist></artists>"
+            f"<title>{title}</title><genres><genre>Jazz</genre></genres>"
+            f"<master_id>{id + 100}</master_id><tracklist>{tracklist}</tracklist>"
+            "</release>"
+        )
+    path.write_text(f"<releases>{''.join(releases)}</releases>")
+
+
+@pytest.fixture
+def artist_folder(tmp_path: Path) -> Path:
+    folder = tmp_path / "src" / "John Coltrane"
+    for title, tracks in ALBUMS.values():
+        album_folder = folder / f"John Coltrane - {title}"
+        album_folder.mkdir(parents=True)
+        for number, track in enumerate(tracks):
+            (album_folder / f"{number + 1:02} - {track}.flac").write_text(track)
+    return folder
+
+
+@pytest.fixture
+def config(tmp_path: Path) -> Config:
+    dump = tmp_path / "releases.xml"
+    write_dump(dump)
+    index = DiscogsDumpIndex(tmp_path / "dump.sqlite")
+    index.ingest(dump)
+    index.close()
+    # workers are spawned and bootstrap themselves from the config, so the
+    # catalog they search has to be one they can open: the dump index
+    return Config(
+        DB_FILE=tmp_path / "test.db",
+        LIBRARY_DIR=tmp_path / "lib",
+        CACHE_FOLDER=tmp_path / "cache",
+        DISCOGS_DUMP_INDEX=tmp_path / "dump.sqlite",
+        IMPORT_WORKERS=2,
+    )
+
+
+def test_albums_are_imported_by_worker_processes(
+    artist_folder: Path, injected: Config
+):
+    """Test that albums imported in worker processes are written by the parent,
+    along with the metrics the workers recorded"""
+    metrics.drain()
+    results = import_service.import_artist_folder(artist_folder, injected.IMPORT_WORKERS)
+    assert [result.status for result in results] == [
+        import_service.AlbumImportStatus.imported
+    ] * 2
+    assert sorted(result.provider_id for result in results) == sorted(ALBUMS)
+    with db.master_engine.connect() as conn:  # type: ignore
+        titles = sorted(row.title for row in conn.execute(db.songs_table.select()))
+    assert titles == sorted(track for _, tracks in ALBUMS.values() for track in tracks)
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["albums_imported"] == 2
+    assert snapshot["counters"]["candidates_fetched"] >= 2
+
+
+def test_workers_that_cannot_start_fail_their_albums(
+    artist_folder: Path, injected: Config, tmp_path: Path
+):
+    # a directory can't be opened as the index, so bootstrap fails in the workers
+    injected.DISCOGS_DUMP_INDEX = tmp_path
+    results = import_service.import_artist_folder(artist_folder, injected.IMPORT_WORKERS)
+    assert [result.status for result in results] == [
+        import_service.AlbumImportStatus.failed
+    ] * 2
+    assert all(result.error for result in results)
+
+
+def test_album_in_the_folder_twice_is_placed_once(artist_folder: Path, injected: Config):
+    """Test that when two workers match the same master, only the one that
+    claims it first places its files; moving must not lose the other's files"""
+    injected.PLACEMENT_STRATEGY = PlacementStrategy.move
+    original = artist_folder / "John Coltrane - Blue Train"
+    copy = artist_folder / "John Coltrane - Blue Train (copy)"
+    shutil.copytree(original, copy)
+    results = import_service.import_artist_folder(artist_folder, injected.IMPORT_WORKERS)
+    assert [result.status for result in results] == [
+        import_service.AlbumImportStatus.imported
+    ] * 3
+    with db.master_engine.connect() as conn:  # type: ignore
+        albums = conn.execute(db.albums_table.select()).all()
+        songs = conn.execute(db.songs_table.select()).all()
+    assert sorted(album.provider_id for album in albums) == sorted(ALBUMS)
+    assert len(songs) == 6
+    # one of the two was moved into the library, the other was left alone
+    assert sorted(len(list(folder.iterdir())) for folder in (original, copy)) == [0, 3]
+    assert all(Path(song.local_path).exists() for song in songs)
@@ -0,0 +1,141 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from sqlalchemy.orm import Session
+
+from mptreasury import server
+from mptreasury.core import db
+from mptreasury.services import import_service
+from mptreasury.services.job_service import Job
+from mptreasury.util import injection
+from mptreasury.util.injection import (
+    IncorrectInjectableSignatureError,
+    Injected,
+    MissingDependencyError,
+    injectable,
+    injectable_sync,
+    injection_scope,
+)
+
+
+class Settings:
+    ...
+
+
+class Resource:
+    """Stands in for a db session"""
+
+    def __init__(self) -> None:
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+
+@pytest.fixture
+def injects(monkeypatch: pytest.MonkeyPatch) -> list[Resource]:
+    created: list[Resource] = []
+
+    def make_resource() -> Resource:
+        created.append(Resource())
+        return created[-1]
+
+    monkeypatch.setattr(injection, "_INJECTS", {Settings: Settings()})
+    monkeypatch.setattr(injection, "_SCOPED_INJECTS", {Resource: make_resource})
+    return created
+
+
+@injectable_sync
+def get_resource(*, settings: Settings = Injected, resource: Resource = Injected):
+    """Docstring of get_resource"""
+    return settings, resource
+
+
+def test_injected_function_keeps_its_metadata():
+    assert get_resource.__name__ == "get_resource"
+    assert get_resource.__doc__ == "Docstring of get_resource"
+
+
+def test_wrong_signature_fails_at_decoration():
+    with pytest.raises(IncorrectInjectableSignatureError):
+
+        @injectable_sync
+        def positional(settings: Settings = Injected):
+            ...
+
+
+def test_missing_dependency(injects: list[Resource]):
+    @injectable_sync
+    def needs_int(*, value: int = Injected):
+        ...
+
+    with pytest.raises(MissingDependencyError):
+        needs_int()
+
+
+def test_scope_shares_and_closes_dependencies(injects: list[Resource]):
+    with injection_scope():
+        settings, first = get_resource()
+        _, second = get_resource()
+        assert first is second
+        assert not first.closed
+    assert first.closed
+    assert settings is injection._INJECTS[Settings]
+
+
+def test_call_outside_scope_gets_its_own(injects: list[Resource]):
+    _, first = get_resource()
+    _, second = get_resource()
+    assert first is not second
+    assert first.closed and second.closed
+
+
+def test_explicit_arguments_are_not_injected(injects: list[Resource]):
+    resource = Resource()
+    assert get_resource(resource=resource)[1] is resource
+    assert injects == []
+
+
+def test_async_injection(injects: list[Resource]):
+    @injectable
+    async def get_async(*, resource: Resource = Injected):
+        return resource
+
+    async def main():
+        with injection_scope():
+            return await get_async(), await get_async()
+
+    first, second = asyncio.run(main())
+    assert first is second and first.closed
+
+
+def test_import_jobs_get_a_session_each(
+    injected, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    """Test that everything an import job runs gets the session of the job,
+    and that another job gets another one"""
+    sessions: list[list[Session]] = []
+
+    @injectable_sync
+    def get_session(*, db_session: db.DbSession = Injected):
+        return db_session
+
+    def import_folder(music_path: Path, job: Job, incremental: bool = False):
+        sessions.append([get_session(), get_session()])
+        return []
+
+    monkeypatch.setattr(import_service, "import_folder", import_folder)
+    loop = asyncio.new_event_loop()
+    try:
+        server.run_import_job(Job(tmp_path, loop))
+        server.run_import_job(Job(tmp_path, loop))
+    finally:
+        loop.close()
+    (first, also_first), (second, _) = sessions
+    assert isinstance(first, Session) and isinstance(second, Session)
+    assert first is also_first
+    assert first is not second
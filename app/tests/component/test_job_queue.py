@@ -0,0 +1,159 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from mptreasury.services.job_service import (
+    FINISHED_JOB_EVENTS,
+    Job,
+    JobQueue,
+    JobStatus,
+    QueueFullError,
+    UnknownJobError,
+)
+
+
+class BlockingRunner:
+    """Job runner that doesn't finish until it's released"""
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.calls: list[Path] = []
+
+    def __call__(self, job: Job):
+        self.calls.append(job.music_path)
+        job.report("scanned")
+        self.release.wait(timeout=5)
+        job.check_cancelled()
+        return [dict(music_path=str(job.music_path))]
+
+
+async def wait_for(job, *statuses):
+    for _ in range(200):
+        if job.status in statuses:
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError(f"job stayed {job.status}")
+
+
+def run_with_queue(test, max_queued=10, max_finished=100):
+    runner = BlockingRunner()
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            queue = JobQueue(
+                runner,
+                executor,
+                workers=1,
+                max_queued=max_queued,
+                max_finished=max_finished,
+            )
+            queue.start()
+            try:
+                await test(queue, runner)
+            finally:
+                runner.release.set()
+                await queue.close()
+
+    asyncio.run(main())
+
+
+def test_job_runs_and_reports_result(tmp_path: Path):
+    async def test(queue: JobQueue, runner: BlockingRunner):
+        job = queue.submit(tmp_path)
+        await wait_for(job, JobStatus.running)
+        runner.release.set()
+        await wait_for(job, JobStatus.done)
+        assert queue.get(job.id).result == [dict(music_path=str(tmp_path))]
+
+    run_with_queue(test)
+
+
+def test_duplicate_submissions_are_coalesced(tmp_path: Path):
+    """Test that submitting a path that is already being imported
+    returns the existing job"""
+
+    async def test(queue: JobQueue, runner: BlockingRunner):
+        first = queue.submit(tmp_path)
+        second = queue.submit(tmp_path / ".." / tmp_path.name)
+        assert first is second
+        runner.release.set()
+        await wait_for(first, JobStatus.done)
+        assert runner.calls == [tmp_path.resolve()]
+
+    run_with_queue(test)
+
+
+def test_full_queue_rejects_submissions(tmp_path: Path):
+    async def test(queue: JobQueue, runner: BlockingRunner):
+        running = queue.submit(tmp_path / "a")
+        await wait_for(running, JobStatus.running)
+        queue.submit(tmp_path / "b")
+        with pytest.raises(QueueFullError):
+            queue.submit(tmp_path / "c")
+
+    run_with_queue(test, max_queued=1)
+
+
+def test_queued_job_is_cancelled_without_running(tmp_path: Path):
+    async def test(queue: JobQueue, runner: BlockingRunner):
+        running = queue.submit(tmp_path / "a")
+        await wait_for(running, JobStatus.running)
+        queued = queue.submit(tmp_path / "b")
+        queue.cancel(queued.id)
+        assert queued.status == JobStatus.cancelled
+        runner.release.set()
+        await wait_for(running, JobStatus.done)
+        await asyncio.sleep(0.05)
+        assert runner.calls == [(tmp_path / "a").resolve()]
+
+    run_with_queue(test)
+
+
+def test_running_job_is_cancelled(tmp_path: Path):
+    async def test(queue: JobQueue, runner: BlockingRunner):
+        job = queue.submit(tmp_path)
+        await wait_for(job, JobStatus.running)
+        queue.cancel(job.id)
+        runner.release.set()
+        await wait_for(job, JobStatus.cancelled)
+
+    run_with_queue(test)
+
+
+def test_subscriber_gets_progress_until_job_finishes(tmp_path: Path):
+    async def test(queue: JobQueue, runner: BlockingRunner):
+        job = queue.submit(tmp_path)
+        await wait_for(job, JobStatus.running)
+        events = job.subscribe()
+        runner.release.set()
+        stages = []
+        while (event := await asyncio.wait_for(events.get(), 1)) is not None:
+            stages.append(event["stage"])
+        assert stages == ["scanned", "done"]
+
+    run_with_queue(test)
+
+
+def test_only_the_last_finished_jobs_are_kept(tmp_path: Path):
+    """Test that a long running server forgets its oldest finished jobs,
+    and keeps only the last events of the ones it remembers"""
+
+    async def test(queue: JobQueue, runner: BlockingRunner):
+        runner.release.set()
+        jobs = []
+        for name in ["a", "b", "c"]:
+            job = queue.submit(tmp_path / name)
+            for number in range(FINISHED_JOB_EVENTS * 2):
+                job.report("album_done", number=number)
+            await wait_for(job, JobStatus.done)
+            jobs.append(job)
+        with pytest.raises(UnknownJobError):
+            queue.get(jobs[0].id)
+        assert queue.jobs() == jobs[1:]
+        assert len(jobs[2].events) == FINISHED_JOB_EVENTS
+        assert jobs[2].events[-1]["stage"] == "done"
+
+    run_with_queue(test, max_finished=2)
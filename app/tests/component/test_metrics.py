@@ -0,0 +1,49 @@
+import time
+from pathlib import Path
+
+from mptreasury.util.metrics import Metrics
+
+
+def test_span_is_recorded_in_histogram():
+    metrics = Metrics()
+    with metrics.span("search"):
+        time.sleep(0.002)
+    metrics.observe("search", 20)
+    histogram = metrics.snapshot()["stages"]["search"]
+    assert histogram["count"] == 2
+    assert histogram["sum"] > 20.002
+    # 2ms lands in the 5ms bucket, 20s in the 60s one
+    assert histogram["counts"][1] == 1
+    assert histogram["counts"][-2] == 1
+
+
+def test_worker_metrics_are_merged():
+    """Test that what a worker process drains can be added to the parent's"""
+    parent, worker = Metrics(), Metrics()
+    parent.increment("albums_imported")
+    parent.observe("matching", 0.02)
+    worker.increment("albums_imported", 2)
+    worker.observe("matching", 0.03)
+    worker.observe("placement", 0.5)
+    parent.merge(worker.drain())
+    assert worker.snapshot() == dict(counters={}, stages={})
+    snapshot = parent.snapshot()
+    assert snapshot["counters"] == dict(albums_imported=3)
+    assert snapshot["stages"]["matching"]["count"] == 2
+    assert snapshot["stages"]["placement"]["count"] == 1
+
+
+def test_prometheus_file(tmp_path: Path):
+    metrics = Metrics()
+    metrics.increment("songs_placed", 12)
+    metrics.observe("db_write", 0.007)
+    metrics.observe("db_write", 2)
+    metrics_file = tmp_path / "textfile" / "mptreasury.prom"
+    metrics.write_prometheus_file(metrics_file)
+    lines = metrics_file.read_text().splitlines()
+    assert "mptreasury_songs_placed_total 12" in lines
+    assert 'mptreasury_stage_seconds_bucket{stage="db_write",le="0.005"} 0' in lines
+    assert 'mptreasury_stage_seconds_bucket{stage="db_write",le="0.01"} 1' in lines
+    assert 'mptreasury_stage_seconds_bucket{stage="db_write",le="+Inf"} 2' in lines
+    assert 'mptreasury_stage_seconds_count{stage="db_write"} 2' in lines
+    assert [path.name for path in metrics_file.parent.iterdir()] == ["mptreasury.prom"]
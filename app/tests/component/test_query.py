@@ -0,0 +1,115 @@
+import sqlite3
+from pathlib import Path
+
+from app import model
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.services import query_service
+
+
+def make_album(name: str, genre: str, master_id: int) -> model.Album:
+    return model.Album(
+        name=name,
+        genre=genre,
+        released=1990,
+        artist_id=1,
+        artist_name="Test Artist",
+        master_provider_id=master_id,
+        master_name=name,
+        provider_id=master_id,
+    )
+
+
+def make_song(title: str, album: model.Album, path: str) -> model.Song:
+    return model.Song(
+        title=title,
+        album_name=album.name,
+        artist_name=album.artist_name,
+        local_path=Path(path),
+    )
+
+
+def titles(result: dict) -> list[str]:
+    return [song["title"] for song in result["songs"]]
+
+
+def test_songs_are_found_by_any_field(Session):
+    rock = make_album("Electric Nights", "Rock", 1)
+    jazz = make_album("Blue Café", "Jazz", 2)
+    db.add_albums_and_songs(
+        [
+            (rock, [make_song("Night Drive", rock, "/lib/1.flac")]),
+            (jazz, [make_song("Morning Coffee", jazz, "/lib/2.flac")]),
+        ],
+        Session,
+    )
+    query = query_service.query_songs
+    assert titles(query("drive", Session=Session)) == ["Night Drive"]
+    assert titles(query("jazz", Session=Session)) == ["Morning Coffee"]
+    # accents don't matter, and the last word may be incomplete
+    assert titles(query("blue cafe", Session=Session)) == ["Morning Coffee"]
+    assert titles(query("test artist mor", Session=Session)) == ["Morning Coffee"]
+    # FTS5 syntax in the input is just text
+    assert titles(query('night" OR "coffee', Session=Session)) == []
+    assert titles(query("***", Session=Session)) == []
+
+
+def test_results_are_ranked_and_paginated(Session):
+    album = make_album("Night Songs", "Ambient", 1)
+    songs = [make_song(f"Song {i}", album, f"/lib/{i}.flac") for i in range(5)]
+    songs.append(make_song("Night", album, "/lib/night.flac"))
+    db.add_album_and_songs(album, songs, Session)
+    first = query_service.query_songs("night", 0, 4, Session=Session)
+    # a title hit outranks an album hit
+    assert titles(first)[0] == "Night"
+    assert first["has_more"]
+    second = query_service.query_songs("night", 1, 4, Session=Session)
+    assert not second["has_more"]
+    assert len(titles(first) + titles(second)) == 6
+    assert set(titles(first)).isdisjoint(titles(second))
+
+
+def test_index_follows_song_changes(Session):
+    album = make_album("Album", "Rock", 1)
+    song = make_song("Old Title", album, "/lib/1.flac")
+    db.add_album_and_songs(album, [song], Session)
+    renamed = make_album("Album", "Rock", 2)
+    new_song = make_song("New Title", renamed, "/lib/1.flac")
+    db.add_album_and_songs(renamed, [new_song], Session)
+    assert titles(query_service.query_songs("old", Session=Session)) == []
+    assert titles(query_service.query_songs("new", Session=Session)) == ["New Title"]
+    db.record_remote_path([new_song], Path("Artist/Album/New Title.flac"), Session)
+    assert titles(query_service.query_songs("new", Session=Session)) == ["New Title"]
+
+
+def test_existing_songs_are_indexed(tmp_path: Path, open_library_db):
+    db_file = tmp_path / "old.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "CREATE TABLE songs (id INTEGER PRIMARY KEY, title VARCHAR, "
+        "local_path VARCHAR, remote_path VARCHAR, album_name VARCHAR, "
+        "artist_name VARCHAR)"
+    )
+    conn.execute(
+        "INSERT INTO songs (title, local_path, album_name, artist_name) "
+        "VALUES ('Old Song', '/lib/old.flac', 'Old Album', 'Old Artist')"
+    )
+    conn.commit()
+    conn.close()
+    Session = open_library_db(Config(DB_FILE=db_file))
+    # creating the tables again must not index the songs twice
+    db.create_tables()
+    assert titles(query_service.query_songs("old", Session=Session)) == ["Old Song"]
+
+
+def test_broad_queries_list_title_matches_first(Session, monkeypatch):
+    monkeypatch.setattr(query_service, "RANK_LIMIT", 2)
+    album = make_album("Night Songs", "Ambient", 1)
+    songs = [make_song(f"Song {i}", album, f"/lib/{i}.flac") for i in range(3)]
+    songs.insert(1, make_song("Night", album, "/lib/night.flac"))
+    db.add_album_and_songs(album, songs, Session)
+    pages = [query_service.query_songs("night", page, 2, Session=Session) for page in (0, 1)]
+    assert not pages[0]["ranked"]
+    # the title match first, then the album matches, newest first
+    assert titles(pages[0]) + titles(pages[1]) == ["Night", "Song 2", "Song 1", "Song 0"]
+    assert pages[0]["has_more"] and not pages[1]["has_more"]
@@ -1,9 +1,14 @@
+import hashlib
 import logging
 from pathlib import Path
 
 import pytest
+from botocore.exceptions import ClientError
 
 from app import model, remote_storage_service
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.services import upload_service
 
 # TODO: isn't there a better place for this?
 logger = logging.getLogger("mptreasury")
@@ -66,3 +71,218 @@ def test_remote_path_is_normalized(
     assert fake_s3_client.calls == [
         ("test", "aaa", "U S Test Artist/I O Test Album/A E Title")
     ]
+
+
+class InMemoryS3:
+    """Stand-in for an S3-compatible store, with the ETags S3 would give"""
+
+    def __init__(self) -> None:
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.etags: dict[tuple[str, str], str] = {}
+        self.uploads: list[str] = []
+        self.heads = 0
+        self.fail_keys: set[str] = set()
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        self.heads += 1
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return dict(
+            ContentLength=len(self.objects[Bucket, Key]),
+            ETag=f'"{self.etags[Bucket, Key]}"',
+        )
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, Config=None):
+        if Key in self.fail_keys:
+            raise ConnectionError("connection reset")
+        self.uploads.append(Key)
+        data = Path(Filename).read_bytes()
+        self.objects[Bucket, Key] = data
+        self.etags[Bucket, Key] = self._etag(data, Config)
+
+    @staticmethod
+    def _etag(data: bytes, Config) -> str:
+        """Like S3: single part uploads get the md5 of the object, multipart
+        ones the md5 of their parts' md5s and the number of parts"""
+        if len(data) < Config.multipart_threshold:
+            return hashlib.md5(data).hexdigest()
+        size = Config.multipart_chunksize
+        parts = [data[i : i + size] for i in range(0, len(data), size)]
+        digests = b"".join(hashlib.md5(part).digest() for part in parts)
+        return f"{hashlib.md5(digests).hexdigest()}-{len(parts)}"
+
+
+@pytest.fixture
+def local_songs(tmp_path: Path) -> list[model.Song]:
+    songs = []
+    for i in range(4):
+        local_path = tmp_path / f"{i}.flac"
+        local_path.write_bytes(bytes([i]) * (10 + i * 7))
+        songs.append(
+            model.Song(
+                title=f"Song {i}",
+                album_name="Album",
+                artist_name="Artist",
+                local_path=local_path,
+            )
+        )
+    return songs
+
+
+def test_interrupted_upload_resumes(Session, local_songs: list[model.Song]):
+    """Test that after a failed run, only the songs that didn't make it are
+    uploaded again, and that the ledger alone is enough to skip the rest"""
+    s3 = InMemoryS3()
+    s3.fail_keys = {"Artist/Album/Song 2.flac"}
+    engine = remote_storage_service.UploadEngine(
+        s3, "bucket", Session, part_size=8, concurrency=2, file_concurrency=3
+    )
+    report = engine.upload(local_songs)
+    assert len(report.uploaded) == 3
+    assert [song.title for song, _ in report.failed] == ["Song 2"]
+
+    s3.fail_keys = set()
+    s3.uploads = []
+    s3.heads = 0
+    for song in local_songs:
+        song.remote_path = None
+    report = engine.upload(local_songs[:2])
+    assert len(report.skipped) == 2
+    assert s3.uploads == []
+    assert s3.heads == 0
+
+    report = engine.upload(local_songs)
+    assert s3.uploads == ["Artist/Album/Song 2.flac"]
+    assert len(report.skipped) == 3
+    assert local_songs[2].remote_path == Path("Artist/Album/Song 2.flac")
+
+
+def test_object_already_in_bucket_is_skipped(Session, local_songs: list[model.Song]):
+    """Test that objects with the same size and ETag are not uploaded again,
+    even when the ledger doesn't know about them"""
+    s3 = InMemoryS3()
+    remote_storage_service.UploadEngine(s3, "bucket", Session, part_size=8).upload(
+        local_songs[:1]
+    )
+    s3.uploads = []
+    engine = remote_storage_service.UploadEngine(
+        s3, "bucket", Session, part_size=8, verify_etag=True
+    )
+    local_songs[0].local_path.write_bytes(b"\xff" * 10)
+    engine.upload(local_songs[:2])
+    # same size as before, but different content
+    assert sorted(s3.uploads) == ["Artist/Album/Song 0.flac", "Artist/Album/Song 1.flac"]
+    s3.uploads = []
+    with Session() as session:
+        session.execute(db.uploads_table.delete())
+        session.commit()
+    report = engine.upload(local_songs[:2])
+    assert s3.uploads == []
+    assert len(report.skipped) == 2
+
+
+@pytest.mark.parametrize("size", [7, 8, 16, 17])
+def test_etag_of_part_sized_files_is_verified(
+    Session, local_songs: list[model.Song], size: int
+):
+    """Test that files of exactly one or more parts, which are uploaded
+    in parts, are found in the bucket by their multipart ETag"""
+    local_songs[0].local_path.write_bytes(b"x" * size)
+    s3 = InMemoryS3()
+    engine = remote_storage_service.UploadEngine(
+        s3, "bucket", Session, part_size=8, verify_etag=True
+    )
+    engine.upload(local_songs[:1])
+    assert s3.etags["bucket", "Artist/Album/Song 0.flac"].endswith("-1") == (
+        8 <= size < 16
+    )
+    with Session() as session:
+        session.execute(db.uploads_table.delete())
+        session.commit()
+    s3.uploads = []
+    report = engine.upload(local_songs[:1])
+    assert s3.uploads == []
+    assert len(report.skipped) == 1
+
+
+def test_uploaded_remote_path_is_stored(Session, local_songs: list[model.Song]):
+    album = model.Album(
+        name="Album",
+        genre="Rock",
+        released=1990,
+        artist_id=1,
+        artist_name="Artist",
+        master_provider_id=1,
+        master_name="Album",
+        provider_id=10,
+    )
+    db.add_album_and_songs(album, local_songs, Session)
+    assert len(db.get_songs_to_upload(Session)) == 4
+    remote_storage_service.UploadEngine(InMemoryS3(), "bucket", Session).upload(
+        local_songs
+    )
+    assert db.get_songs_to_upload(Session) == []
+
+
+def test_library_upload_resumes_from_the_db(Session, local_songs: list[model.Song]):
+    """Test that uploading the library only sends what isn't uploaded yet"""
+    album = model.Album(
+        name="Album",
+        genre="Rock",
+        released=1990,
+        artist_id=1,
+        artist_name="Artist",
+        master_provider_id=1,
+        master_name="Album",
+        provider_id=10,
+    )
+    db.add_album_and_songs(album, local_songs, Session)
+    config = Config(S3_LIBRARY_BUCKET="bucket")
+    s3 = InMemoryS3()
+    s3.fail_keys = {"Artist/Album/Song 1.flac"}
+    report = upload_service.upload_library(s3, Session=Session, config=config)
+    assert (report["uploaded"], len(report["failed"])) == (3, 1)
+    s3.fail_keys = set()
+    s3.uploads = []
+    report = upload_service.upload_library(s3, Session=Session, config=config)
+    assert s3.uploads == ["Artist/Album/Song 1.flac"]
+    assert db.get_songs_to_upload(Session) == []
+
+
+def test_new_songs_of_uploaded_files_are_stored(Session, local_songs: list[model.Song]):
+    """Test that songs added for files the ledger already has, like those of a
+    re-imported album, get their remote path stored without uploading again"""
+    album = model.Album(
+        name="Album",
+        genre="Rock",
+        released=1990,
+        artist_id=1,
+        artist_name="Artist",
+        master_provider_id=1,
+        master_name="Album",
+        provider_id=10,
+    )
+    db.add_album_and_songs(album, local_songs, Session)
+    config = Config(S3_LIBRARY_BUCKET="bucket")
+    s3 = InMemoryS3()
+    upload_service.upload_library(s3, Session=Session, config=config)
+    with Session() as session:
+        session.execute(db.songs_table.delete())
+        session.execute(db.albums_table.delete())
+        session.commit()
+    reimported = [
+        model.Song(
+            title=song.title,
+            album_name=song.album_name,
+            artist_name=song.artist_name,
+            local_path=song.local_path,
+        )
+        for song in local_songs
+    ]
+    db.add_album_and_songs(album, reimported, Session)
+    assert len(db.get_songs_to_upload(Session)) == 4
+    s3.uploads = []
+    report = upload_service.upload_library(s3, Session=Session, config=config)
+    assert (report["uploaded"], report["skipped"]) == (0, 4)
+    assert s3.uploads == []
+    assert db.get_songs_to_upload(Session) == []
@@ -0,0 +1,82 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from mptreasury.adapters.discogs_adapter import (
+    FakeArtist,
+    FakeDiscogsAlbum,
+    FakeDiscogsCatalogClient,
+    FakeMaster,
+    Searcher,
+)
+from mptreasury.services import import_service, scan_service
+from mptreasury.util import injection
+
+
+@pytest.fixture
+def client(injected, monkeypatch: pytest.MonkeyPatch) -> FakeDiscogsCatalogClient:
+    albums = [
+        FakeDiscogsAlbum(
+            [f"song{i}" for i in range(3)],
+            id=album,
+            title=f"Album{album}",
+            artist=FakeArtist(id=1, name="Artist"),
+            master=FakeMaster(id=album, title=f"Master {album}"),
+        )
+        for album in range(3)
+    ]
+    client = FakeDiscogsCatalogClient(albums)
+    monkeypatch.setitem(injection._INJECTS, Searcher, Searcher(client))  # type: ignore
+    return client
+
+
+@pytest.fixture
+def download_folder(tmp_path: Path) -> Path:
+    root = tmp_path / "downloads"
+    for album in range(3):
+        album_folder = root / f"Artist - Album{album}"
+        album_folder.mkdir(parents=True)
+        for song in range(3):
+            (album_folder / f"0{song} - song{song}.flac").write_text("x")
+    return root
+
+
+def test_fingerprint_follows_changes(download_folder: Path):
+    """Test that a folder's fingerprint changes when a file in it is added,
+    modified or renamed, and only then"""
+    album_folder = download_folder / "Artist - Album0"
+    fingerprint = scan_service.folder_fingerprint(album_folder)
+    assert scan_service.folder_fingerprint(album_folder) == fingerprint
+    song = album_folder / "00 - song0.flac"
+    stat = song.stat()
+    song.write_text("y")
+    os.utime(song, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    # same size and mtime: the contents aren't read
+    assert scan_service.folder_fingerprint(album_folder) == fingerprint
+    song.write_text("yy")
+    modified = scan_service.folder_fingerprint(album_folder)
+    assert modified != fingerprint
+    song.rename(album_folder / "00 - renamed.flac")
+    assert scan_service.folder_fingerprint(album_folder) != modified
+
+
+def test_incremental_scan_imports_only_changed_folders(
+    client: FakeDiscogsCatalogClient, download_folder: Path
+):
+    results = import_service.import_folder(download_folder, incremental=True)
+    assert [str(result.status) for result in results] == ["imported"] * 3
+    assert len(client.queries) == 3
+
+    client.queries = []
+    (download_folder / "Artist - Album1" / "03 - bonus.flac").write_text("x")
+    results = import_service.import_folder(download_folder, incremental=True)
+    assert sorted(client.queries) == ["Album1"]
+    statuses = {result.music_path.name: str(result.status) for result in results}
+    assert statuses["Artist - Album0"] == "unchanged"
+    assert statuses["Artist - Album2"] == "unchanged"
+
+    client.queries = []
+    import_service.import_folder(download_folder, incremental=False)
+    assert len(client.queries) == 3
+
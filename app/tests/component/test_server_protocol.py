@@ -0,0 +1,219 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from app.model import Album, Song
+from mptreasury import server
+from mptreasury.core import db
+from mptreasury.services import fuzzy_search_service
+from mptreasury.protocol import (
+    MAX_MESSAGE_SIZE,
+    ProtocolError,
+    encode_message,
+    read_message,
+)
+from mptreasury.services.job_service import Job, JobQueue
+from mptreasury.util.metrics import metrics
+
+
+def fake_import(job: Job):
+    for stage in ["scanned", "searched", "matched", "copied", "committed"]:
+        job.report(stage)
+    return [dict(music_path=str(job.music_path), status="imported")]
+
+
+def run_against_server(tmp_path: Path, client):
+    socket_path = str(tmp_path / "socket")
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            server.job_queue = JobQueue(fake_import, executor, workers=1, max_queued=5)
+            server.job_queue.start()
+            unix_server = await asyncio.start_unix_server(
+                server.handle_client, socket_path, limit=MAX_MESSAGE_SIZE
+            )
+            try:
+                reader, writer = await asyncio.open_unix_connection(
+                    socket_path, limit=MAX_MESSAGE_SIZE
+                )
+                await asyncio.wait_for(client(reader, writer), 5)
+                writer.close()
+            finally:
+                unix_server.close()
+                await server.job_queue.close()
+                server.job_queue = None
+
+    asyncio.run(main())
+
+
+def test_followed_import_streams_progress(tmp_path: Path):
+    async def client(reader, writer):
+        writer.write(
+            encode_message(
+                dict(id=7, name="import_folder", music_path=str(tmp_path), follow=True)
+            )
+        )
+        messages = []
+        while message := await read_message(reader):
+            messages.append(message)
+            if message["type"] == "result" and message["status"] == "done":
+                break
+        assert all(message["id"] == 7 for message in messages)
+        assert messages[0]["type"] == "result"
+        stages = [m["stage"] for m in messages if m["type"] == "event"]
+        assert stages == ["scanned", "searched", "matched", "copied", "committed", "done"]
+        assert messages[-1]["result"] == [
+            dict(music_path=str(tmp_path), status="imported")
+        ]
+
+    run_against_server(tmp_path, client)
+
+
+def test_pipelined_requests_are_answered_by_id(tmp_path: Path):
+    async def client(reader, writer):
+        writer.write(
+            encode_message(dict(id=1, name="list_jobs"))
+            + encode_message(dict(id=2, name="no_such_request"))
+            + b"not json\n"
+        )
+        messages = [await read_message(reader) for _ in range(3)]
+        by_id = {message["id"]: message for message in messages}
+        assert by_id[1]["type"] == "result"
+        assert by_id[2]["type"] == "error"
+        assert by_id[None]["type"] == "error"
+
+    run_against_server(tmp_path, client)
+
+
+def test_failed_request_gets_an_error(tmp_path: Path):
+    """Test that a request that blows up is still answered, and doesn't hold
+    up the requests after it"""
+
+    async def client(reader, writer):
+        writer.write(
+            encode_message(dict(id=1, name="query_songs", query="song", page="abc"))
+            + encode_message(dict(id=2, name="list_jobs"))
+        )
+        messages = [await read_message(reader) for _ in range(2)]
+        by_id = {message["id"]: message for message in messages}
+        assert by_id[1]["type"] == "error"
+        assert "ValueError" in by_id[1]["error"]
+        assert by_id[2]["type"] == "result"
+
+    run_against_server(tmp_path, client)
+
+
+def test_large_request(tmp_path: Path):
+    """Test that requests larger than a single socket read are handled"""
+    long_path = str(tmp_path / ("a" * 10_000))
+
+    async def client(reader, writer):
+        writer.write(
+            encode_message(dict(id=1, name="import_folder", music_path=long_path))
+        )
+        message = await read_message(reader)
+        assert message["type"] == "result"
+        assert message["music_path"].endswith("a" * 10_000)
+
+    run_against_server(tmp_path, client)
+
+
+def test_oversized_request_is_dropped(tmp_path: Path):
+    """Test that a line longer than the limit gets one error, and that
+    the request after it is still answered"""
+    oversized = "a" * (MAX_MESSAGE_SIZE * 2 + 10)
+
+    async def client(reader, writer):
+        writer.write(encode_message(dict(id=1, name="stats", padding=oversized)))
+        writer.write(encode_message(dict(id=2, name="list_jobs")))
+        message = await read_message(reader)
+        assert message["type"] == "error"
+        message = await read_message(reader)
+        assert (message["id"], message["type"]) == (2, "result")
+
+    run_against_server(tmp_path, client)
+
+
+def test_oversized_line_is_skipped_whole():
+    async def main():
+        reader = asyncio.StreamReader(limit=16)
+        reader.feed_data(b'{"padding": "' + b"a" * 40 + b'"}\n{"id": 2}\n')
+        reader.feed_eof()
+        with pytest.raises(ProtocolError):
+            await read_message(reader)
+        assert await read_message(reader) == dict(id=2)
+        assert await read_message(reader) is None
+
+    asyncio.run(main())
+
+
+def test_stats_request(tmp_path: Path):
+    metrics.increment("albums_imported")
+
+    async def client(reader, writer):
+        writer.write(encode_message(dict(id=1, name="stats")))
+        message = await read_message(reader)
+        assert message["type"] == "result"
+        assert message["counters"]["albums_imported"] >= 1
+        assert "stages" in message
+
+    run_against_server(tmp_path, client)
+
+
+def test_query_songs_request(tmp_path: Path, Session, injected):
+    album = Album(
+        name="Album",
+        genre="Rock",
+        released=1990,
+        artist_id=1,
+        artist_name="Artist",
+        master_provider_id=1,
+        master_name="Album",
+        provider_id=10,
+    )
+    songs = [
+        Song(
+            title=f"Song {i}",
+            album_name="Album",
+            artist_name="Artist",
+            local_path=Path(f"/lib/{i}.flac"),
+        )
+        for i in range(3)
+    ]
+    db.add_album_and_songs(album, songs, Session)
+
+    async def client(reader, writer):
+        request = dict(id=1, name="query_songs", query="song", page=1, page_size=2)
+        writer.write(encode_message(request))
+        message = await read_message(reader)
+        assert message["type"] == "result"
+        assert len(message["songs"]) == 1
+        assert not message["has_more"]
+
+    run_against_server(tmp_path, client)
+
+
+def test_slow_search_does_not_hold_up_other_requests(tmp_path: Path, monkeypatch):
+    """Test that a search is served off the event loop: it waits here until
+    the answer to a request sent after it has come back"""
+    answered = threading.Event()
+
+    def slow_search(query, kinds=None, limit=fuzzy_search_service.DEFAULT_LIMIT):
+        assert answered.wait(5)
+        return []
+
+    monkeypatch.setattr(fuzzy_search_service, "fuzzy_search", slow_search)
+
+    async def client(reader, writer):
+        writer.write(encode_message(dict(id=1, name="fuzzy_search", query="train")))
+        writer.write(encode_message(dict(id=2, name="list_jobs")))
+        message = await read_message(reader)
+        assert message["id"] == 2
+        answered.set()
+        message = await read_message(reader)
+        assert (message["id"], message["matches"]) == (1, [])
+
+    run_against_server(tmp_path, client)
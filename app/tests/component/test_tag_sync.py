@@ -0,0 +1,171 @@
+import struct
+import wave
+from pathlib import Path
+
+import pytest
+
+from app import model
+from mptreasury.adapters import tag_writer
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.services import placement_service, tag_service
+
+
+def write_flac(path: Path):
+    """Just the STREAMINFO block; mutagen doesn't need any audio"""
+    info = struct.pack(">HH", 4096, 4096) + b"\0" * 6
+    info += ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, "big") + b"\0" * 16
+    path.write_bytes(b"fLaC" + bytes([0x80]) + len(info).to_bytes(3, "big") + info)
+
+
+def write_mp3(path: Path):
+    # a few silent 128kbps, 44.1kHz MPEG-1 layer III frames
+    path.write_bytes((b"\xff\xfb\x90\x64" + b"\0" * 413) * 5)
+
+
+def write_wav(path: Path):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"\0\0" * 80)
+
+
+WRITERS = {".flac": write_flac, ".mp3": write_mp3, ".wav": write_wav}
+
+
+def make_album(name: str) -> model.Album:
+    return model.Album(
+        name=name,
+        genre="Jazz",
+        released=1958,
+        artist_id=1,
+        artist_name="John Coltrane",
+        master_provider_id=1,
+        master_name=name,
+        provider_id=1,
+    )
+
+
+@pytest.fixture
+def songs(tmp_path: Path) -> list[model.Song]:
+    songs = []
+    for title, suffix in [("Blue Train", ".flac"), ("Locomotion", ".mp3"), ("Lazy Bird", ".wav")]:
+        path = tmp_path / f"{title}{suffix}"
+        WRITERS[suffix](path)
+        songs.append(
+            model.Song(
+                title=title,
+                album_name="Blue Train",
+                artist_name="John Coltrane",
+                local_path=path,
+            )
+        )
+    return songs
+
+
+def read_tags(path: Path) -> dict:
+    tagged = tag_writer.TaggedFile(path)
+    return {key: tagged.get(key) for key in ["title", "artist", "album", "genre", "date"]}
+
+
+def test_every_format_is_tagged(songs: list[model.Song]):
+    album = make_album("Blue Train")
+    report = tag_writer.TagSync(workers=2).sync([(album, songs)])
+    assert sorted(report.updated) == sorted(song.local_path for song in songs)
+    for song in songs:
+        assert read_tags(song.local_path) == dict(
+            title=[song.title],
+            artist=["John Coltrane"],
+            album=["Blue Train"],
+            genre=["Jazz"],
+            date=["1958"],
+        )
+
+
+def test_only_files_that_differ_are_written(songs: list[model.Song]):
+    album = make_album("Blue Train")
+    tag_writer.TagSync().sync([(album, songs)])
+    mtimes = {song.local_path: song.local_path.stat().st_mtime_ns for song in songs}
+    songs[1].title = "Locomotion (Alternate Take)"
+    report = tag_writer.TagSync().sync([(album, songs)])
+    assert report.updated == [songs[1].local_path]
+    assert report.unchanged == 2
+    for song in songs[::2]:
+        assert song.local_path.stat().st_mtime_ns == mtimes[song.local_path]
+    assert read_tags(songs[1].local_path)["title"] == ["Locomotion (Alternate Take)"]
+
+
+def test_unreadable_files_are_reported(songs: list[model.Song], tmp_path: Path):
+    broken = tmp_path / "broken.flac"
+    broken.write_bytes(b"not flac")
+    ogg = tmp_path / "song.ogg"
+    ogg.write_bytes(b"")
+    songs += [
+        model.Song(title="Broken", album_name="A", artist_name="B", local_path=broken),
+        model.Song(title="Ogg", album_name="A", artist_name="B", local_path=ogg),
+    ]
+    report = tag_writer.TagSync().sync([(None, songs)])
+    assert set(report.failed) == {broken, ogg}
+    assert len(report.updated) == 3
+
+
+def test_library_is_synced_with_the_db(
+    songs: list[model.Song], Session, config: Config
+):
+    album = make_album("Blue Train")
+    db.add_album_and_songs(album, songs, Session)
+    first = tag_service.sync_tags(Session=Session, config=config)
+    assert len(first["updated"]) == 3
+    again = tag_service.sync_tags([album.id], Session=Session, config=config)
+    assert again == dict(updated=[], unchanged=3, failed={})
+
+
+def test_linked_files_are_unlinked_before_being_written(
+    tmp_path: Path, open_library_db
+):
+    """Test that a file hard linked to a song of another album, and to the
+    download it came from, is given an inode of its own before being tagged,
+    and that the content hashes of the db follow the new tags"""
+    download = tmp_path / "download.flac"
+    write_flac(download)
+    (tmp_path / "lib").mkdir()
+    first = tmp_path / "lib" / "first.flac"
+    second = tmp_path / "lib" / "second.flac"
+    first.hardlink_to(download)
+    second.hardlink_to(download)
+    untouched = download.stat()
+    content_hash = placement_service.file_checksum(download)
+    entries = []
+    for number, (name, path) in enumerate([("Blue Train", first), ("Coltrane Jazz", second)]):
+        album = make_album(name)
+        album.master_provider_id = album.provider_id = number + 1
+        song = model.Song(
+            title="Lazy Bird",
+            album_name=name,
+            artist_name="John Coltrane",
+            local_path=path,
+            content_hash=content_hash,
+        )
+        entries.append((album, [song]))
+    config = Config(DB_FILE=tmp_path / "library.db", TAG_WORKERS=2)
+    Session = open_library_db(config)
+    for album, album_songs in entries:
+        db.add_album_and_songs(album, album_songs, Session)
+    report = tag_service.sync_tags(Session=Session, config=config)
+    assert sorted(report["updated"]) == [str(first), str(second)]
+    assert read_tags(first)["album"] == ["Blue Train"]
+    assert read_tags(second)["album"] == ["Coltrane Jazz"]
+    assert read_tags(download)["album"] == []
+    assert (download.stat().st_mtime_ns, download.stat().st_nlink) == (
+        untouched.st_mtime_ns,
+        1,
+    )
+    with Session() as session:
+        songs = session.query(model.Song)
+        hashes = {song.local_path: song.content_hash for song in songs}
+    assert hashes == {
+        first: placement_service.file_checksum(first),
+        second: placement_service.file_checksum(second),
+    }
+    assert content_hash not in hashes.values()
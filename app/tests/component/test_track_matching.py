@@ -0,0 +1,50 @@
+import pytest
+
+from mptreasury.util import track_matching
+
+
+def test_optimal_assignment_beats_greedy():
+    """Test that the assignment maximizes the total score, even when
+    the best pick for the first row is a bad pick overall"""
+    matrix = [
+        [90, 80],
+        [85, 0],
+    ]
+    assert track_matching.optimal_assignment(matrix) == [(0, 1), (1, 0)]
+
+
+@pytest.mark.parametrize(
+    "matrix,expected",
+    [
+        ([[10, 50, 20]], [(0, 1)]),
+        ([[10], [50], [20]], [(1, 0)]),
+        ([], []),
+    ],
+)
+def test_optimal_assignment_rectangular(matrix, expected):
+    assert track_matching.optimal_assignment(matrix) == expected
+
+
+def test_match_tracks_keeps_triplet_shape():
+    """Test that triplets are (actual track, potential match, score),
+    in the order of the potential matches"""
+    actual_tracks = ["02 - Second Song", "01 - First Song"]
+    potential_matches = ["First Song", "Second Song"]
+    triplets, score = track_matching.match_tracks(actual_tracks, potential_matches)
+    assert triplets == [
+        ("01 - First Song", "First Song", 100),
+        ("02 - Second Song", "Second Song", 100),
+    ]
+    assert score == 100
+
+
+def test_match_tracks_penalizes_missing_tracks():
+    """Test that local tracks without a match lower the score"""
+    _, score = track_matching.match_tracks(["A song", "B song"], ["A song"])
+    assert score == pytest.approx(80)
+
+
+def test_match_tracks_without_potential_matches():
+    triplets, score = track_matching.match_tracks(["A song"], [])
+    assert triplets == []
+    assert score == 0
@@ -0,0 +1,153 @@
+import io
+import sqlite3
+import wave
+from pathlib import Path
+
+import pytest
+from sqlalchemy import select
+
+from app import model
+from mptreasury.adapters import track_reader
+from mptreasury.adapters.cue_splitter import CueSheetError
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.services import placement_service
+
+RATE = 7500
+CUE_SHEET = """PERFORMER "Test Artist"
+TITLE "Test Album"
+FILE "image.wav" WAVE
+  TRACK 01 AUDIO
+    TITLE "First Song"
+    INDEX 01 00:00:00
+  TRACK 02 AUDIO
+    TITLE "Second Song"
+    INDEX 01 00:01:00
+"""
+
+
+@pytest.fixture
+def cue_folder(tmp_path: Path) -> Path:
+    folder = tmp_path / "Test Artist - Test Album"
+    folder.mkdir()
+    (folder / "album.cue").write_text(CUE_SHEET)
+    with wave.open(str(folder / "image.wav"), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        # every sample holds the second it's in
+        f.writeframes(b"".join(bytes([second, 0]) * RATE for second in range(3)))
+    return folder
+
+
+@pytest.fixture
+def virtual_cue_parser(tmp_path: Path) -> model.CueParser:
+    config = Config(CACHE_FOLDER=tmp_path / "cache", CUE_IMPORT_MODE="virtual")
+    return model.CueParser(config)
+
+
+def test_cue_album_is_not_split(cue_folder: Path, virtual_cue_parser: model.CueParser):
+    raw_album = model.RawAlbum(cue_folder, cue_parser=virtual_cue_parser)
+    assert raw_album.name == "Test Album"
+    assert [
+        (song.title, song.path.name, song.track_start, song.track_end)
+        for song in raw_album.songs
+    ] == [("First Song", "image.wav", 0, 75), ("Second Song", "image.wav", 75, None)]
+    assert not (virtual_cue_parser._config.CACHE_FOLDER / "cue_splits").exists()
+
+
+def test_renamed_image_is_found(cue_folder: Path, virtual_cue_parser: model.CueParser):
+    """Test that an image that doesn't have the name the cue sheet gives it
+    is used if it's the only music file of the album"""
+    (cue_folder / "image.wav").rename(cue_folder / "image.flac")
+    raw_album = model.RawAlbum(cue_folder, cue_parser=virtual_cue_parser)
+    assert [song.path for song in raw_album.songs] == [cue_folder / "image.flac"] * 2
+
+
+def test_missing_image_is_an_error(
+    cue_folder: Path, virtual_cue_parser: model.CueParser
+):
+    (cue_folder / "image.wav").unlink()
+    (cue_folder / "other.wav").write_bytes(b"")
+    (cue_folder / "another.flac").write_bytes(b"")
+    with pytest.raises(CueSheetError, match="image.wav"):
+        model.RawAlbum(cue_folder, cue_parser=virtual_cue_parser)
+
+
+def make_song(title: str, image: Path, start: int, end: int | None) -> model.Song:
+    return model.Song(
+        title=title,
+        album_name="Test Album",
+        artist_name="Test Artist",
+        local_path=image,
+        track_start=start,
+        track_end=end,
+    )
+
+
+def test_reader_yields_only_the_track(cue_folder: Path):
+    image = cue_folder / "image.wav"
+    song = make_song("Second Song", image, start=75, end=150)
+    data = b"".join(track_reader.read_song(song, chunk_size=1000))
+    with wave.open(io.BytesIO(data), "rb") as f:
+        assert f.getframerate() == RATE
+        assert f.getnframes() == RATE
+        assert set(f.readframes(RATE)[::2]) == {1}
+    whole_file = make_song("Image", image, start=0, end=None)
+    assert b"".join(track_reader.read_song(whole_file)) == image.read_bytes()
+
+
+def test_image_is_placed_once(cue_folder: Path, tmp_path: Path):
+    image = cue_folder / "image.wav"
+    songs = [
+        make_song("First Song", image, start=0, end=75),
+        make_song("Second Song", image, start=75, end=None),
+    ]
+    placement_service.place_songs(songs, tmp_path / "lib", workers=2)
+    placed = tmp_path / "lib" / "Test Artist" / "Test Album" / "image.wav"
+    assert [song.local_path for song in songs] == [placed, placed]
+    assert list(placed.parent.iterdir()) == [placed]
+
+
+def test_tracks_of_an_image_are_stored(
+    tmp_path: Path, cue_folder: Path, open_library_db
+):
+    """Test that tracks sharing an image are separate songs, and that dbs from
+    before track ranges existed get the new columns"""
+    db_file = tmp_path / "old.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "CREATE TABLE songs (id INTEGER PRIMARY KEY, title VARCHAR, "
+        "local_path VARCHAR, remote_path VARCHAR, album_name VARCHAR, "
+        "artist_name VARCHAR)"
+    )
+    conn.execute("CREATE UNIQUE INDEX ux_songs_local_path ON songs (local_path)")
+    conn.execute(
+        "INSERT INTO songs (title, local_path) VALUES ('Old Song', '/lib/old.flac')"
+    )
+    conn.commit()
+    conn.close()
+    Session = open_library_db(Config(DB_FILE=db_file))
+    album = model.Album(
+        name="Test Album",
+        genre="Rock",
+        released=1990,
+        artist_id=1,
+        artist_name="Test Artist",
+        master_provider_id=1,
+        master_name="Test Album",
+        provider_id=10,
+    )
+    image = cue_folder / "image.wav"
+    songs = [
+        make_song("First Song", image, start=0, end=75),
+        make_song("Second Song", image, start=75, end=None),
+    ]
+    db.add_album_and_songs(album, songs, Session)
+    with Session() as session:
+        stored = session.execute(select(model.Song)).scalars().all()
+        assert sorted((song.title, song.track_start) for song in stored) == [
+            ("First Song", 0),
+            ("Old Song", 0),
+            ("Second Song", 75),
+        ]
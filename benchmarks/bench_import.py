@@ -0,0 +1,227 @@
+"""Import throughput on synthetic libraries, with an offline Discogs.
+
+    python -m benchmarks.bench_import                     # compare with baselines
+    python -m benchmarks.bench_import --size small --save # record new baselines
+
+Every album is imported from a generated artist folder, through the real
+import_folder, Searcher and db; only the Discogs client is fake. Stage timings
+are the time between consecutive progress events of an album, e.g. "matched"
+is the time it took to fetch and match candidates once the search was done.
+"""
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import wave
+from collections import defaultdict
+from pathlib import Path
+
+import click
+from loguru import logger
+from sqlalchemy.orm import Session as SessionMaker
+
+from app.model import Song
+from mptreasury.adapters.discogs_adapter import (
+    FakeArtist,
+    FakeDiscogsAlbum,
+    FakeDiscogsCatalogClient,
+    FakeMaster,
+    Searcher,
+)
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.services import import_service
+from mptreasury.util import injection
+
+BASELINES_FILE = Path(__file__).parent / "baselines.json"
+
+# albums, tracks per album, how many of the albums are cue images
+SIZES = {
+    "small": dict(albums=20, tracks=10, cue_albums=4),
+    "medium": dict(albums=200, tracks=10, cue_albums=20),
+    "large": dict(albums=1000, tracks=12, cue_albums=50),
+}
+
+# slower than this, relative to the baseline, counts as a regression
+REGRESSION_THRESHOLD = 1.2
+
+ARTIST = "Synthetic Artist"
+
+
+def _track_title(album: int, track: int) -> str:
+    return f"Song {track} of Album {album}"
+
+
+def _write_cue_album(folder: Path, album: int, tracks: int, sample_rate: int = 8000):
+    """An album image with a second of silence per track"""
+    sheet = [f'PERFORMER "{ARTIST}"', f'TITLE "Album {album}"', 'FILE "image.wav" WAVE']
+    for track in range(tracks):
+        sheet += [
+            f"  TRACK {track + 1:02} AUDIO",
+            f'    TITLE "{_track_title(album, track)}"',
+            f"    INDEX 01 00:{track:02}:00",
+        ]
+    (folder / "album.cue").write_text("\n".join(sheet) + "\n")
+    with wave.open(str(folder / "image.wav"), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\0\0" * sample_rate * tracks)
+
+
+def generate_library(
+    root: Path, albums: int, tracks: int, cue_albums: int, file_size: int = 4096
+) -> tuple[Path, list[FakeDiscogsAlbum]]:
+    """An artist folder with `albums` album folders, the last `cue_albums` of
+    which are cue images, along with the Discogs releases they should match"""
+    artist_folder = root / ARTIST
+    releases = []
+    for album in range(albums):
+        folder = artist_folder / f"{ARTIST} - Album {album}"
+        folder.mkdir(parents=True)
+        if album >= albums - cue_albums:
+            _write_cue_album(folder, album, tracks)
+        else:
+            for track in range(tracks):
+                song = folder / f"{track + 1:02} - {_track_title(album, track)}.flac"
+                song.write_bytes(album.to_bytes(4, "big") * (file_size // 4))
+        releases.append(
+            FakeDiscogsAlbum(
+                [_track_title(album, track) for track in range(tracks)],
+                id=album + 1,
+                title=f"Album {album}",
+                artist=FakeArtist(id=1, name=ARTIST),
+                master=FakeMaster(id=album + 1, title=f"Album {album}"),
+            )
+        )
+    return artist_folder, releases
+
+
+class StageTimer:
+    """Stands in for a job: it gets the pipeline's progress events,
+    and times the stages between them"""
+
+    def __init__(self) -> None:
+        self.stages: dict[str, float] = defaultdict(float)
+        self._last = time.perf_counter()
+
+    def check_cancelled(self):
+        pass
+
+    def report(self, stage: str, **details):
+        now = time.perf_counter()
+        self.stages[stage] += now - self._last
+        self._last = now
+
+
+def run_import(size: str, workdir: Path, decoys: int, prefetch_workers: int) -> dict:
+    params = SIZES[size]
+    library_root = workdir / size
+    started = time.perf_counter()
+    music_path, releases = generate_library(library_root / "source", **params)
+    generated = time.perf_counter() - started
+    config = Config(
+        DB_FILE=library_root / "library.db",
+        LIBRARY_DIR=library_root / "library",
+        CACHE_FOLDER=library_root / "cache",
+        CUE_IMPORT_MODE="virtual",
+        CANDIDATE_PREFETCH_WORKERS=prefetch_workers,
+        IMPORT_WORKERS=0,
+    )
+    db.master_engine = None
+    Session = db.get_sessionmaker(config)
+    db.create_tables()
+    client = FakeDiscogsCatalogClient(releases, decoys=decoys)
+    # injected like bootstrap does, but replaced for every run
+    injection._INJECTS.update(
+        {Config: config, Searcher: Searcher(client), SessionMaker: Session}
+    )
+    injection._SCOPED_INJECTS[db.DbSession] = Session
+
+    timer = StageTimer()
+    started = time.perf_counter()
+    results = import_service.import_folder(music_path, timer)  # type: ignore
+    elapsed = time.perf_counter() - started
+    with Session() as session:
+        songs = session.query(Song).count()
+    db.master_engine.dispose()
+    db.master_engine = None
+
+    imported = sum(
+        result.status == import_service.AlbumImportStatus.imported for result in results
+    )
+    if imported != params["albums"]:
+        raise RuntimeError(f"Only {imported} of {params['albums']} albums were imported")
+    return dict(
+        albums=params["albums"],
+        songs=songs,
+        seconds=round(elapsed, 4),
+        albums_per_second=round(params["albums"] / elapsed, 2),
+        generate_seconds=round(generated, 4),
+        stages={stage: round(seconds, 4) for stage, seconds in timer.stages.items()},
+    )
+
+
+def compare(size: str, result: dict, baselines: dict) -> bool:
+    """Print how the result compares with its baseline; False on a regression"""
+    baseline = baselines.get(size)
+    click.echo(f"  {result['albums_per_second']} albums/s in {result['seconds']}s")
+    for stage, seconds in result["stages"].items():
+        before = baseline["stages"].get(stage) if baseline else None
+        against = f" (baseline {before:.4f}s)" if before is not None else ""
+        click.echo(f"    {stage:<12} {seconds:8.4f}s{against}")
+    if baseline is None:
+        click.echo(f"  no baseline for {size}")
+        return True
+    ratio = baseline["albums_per_second"] / result["albums_per_second"]
+    click.echo(
+        f"  baseline {baseline['albums_per_second']} albums/s "
+        f"({(ratio - 1) * 100:+.0f}% time)"
+    )
+    if ratio > REGRESSION_THRESHOLD:
+        click.echo(f"  REGRESSION: {size} is {ratio:.2f}x slower than its baseline")
+        return False
+    return True
+
+
+@click.command()
+@click.option(
+    "--size",
+    "sizes",
+    type=click.Choice(list(SIZES)),
+    multiple=True,
+    help="Library sizes to run; all of them by default",
+)
+@click.option("--decoys", default=3, help="Non-matching candidates per search")
+@click.option("--prefetch-workers", default=0, help="CANDIDATE_PREFETCH_WORKERS")
+@click.option("--save/--no-save", default=False, help="Record the results as baselines")
+def main(sizes: tuple[str, ...], decoys: int, prefetch_workers: int, save: bool):
+    # per-album log lines would be most of what's measured
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    baselines = json.loads(BASELINES_FILE.read_text()) if BASELINES_FILE.exists() else {}
+    results = {}
+    ok = True
+    workdir = Path(tempfile.mkdtemp(prefix="mptreasury-bench-"))
+    try:
+        for size in sizes or SIZES:
+            click.echo(f"{size}: {SIZES[size]}")
+            results[size] = run_import(size, workdir, decoys, prefetch_workers)
+            ok = compare(size, results[size], baselines.get("results", {})) and ok
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if save:
+        baselines.setdefault("results", {}).update(results)
+        baselines["machine"] = dict(
+            python=platform.python_version(), platform=platform.platform()
+        )
+        BASELINES_FILE.write_text(json.dumps(baselines, indent=2) + "\n")
+        click.echo(f"Saved baselines to {BASELINES_FILE}")
+    elif not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
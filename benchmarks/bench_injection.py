@@ -0,0 +1,76 @@
+"""Call overhead of injected functions, compared with the implementation
+that inspected the signature on every call.
+
+    python -m benchmarks.bench_injection
+"""
+import timeit
+from inspect import _ParameterKind, signature
+
+from mptreasury.util import injection
+from mptreasury.util.injection import Injected, injectable_sync, injection_scope
+
+CALLS = 100_000
+
+
+def legacy_injectable_sync(func):
+    def inner(*args, **kwargs):
+        for name, sig in signature(func).parameters.items():
+            if sig.default is Injected:
+                if sig.kind is not _ParameterKind.KEYWORD_ONLY:
+                    raise injection.IncorrectInjectableSignatureError(name)
+                if kwargs.get(name) is not None:
+                    pass
+                elif sig.annotation in injection._INJECTS:
+                    kwargs.update({name: injection._INJECTS[sig.annotation]})
+                else:
+                    raise injection.MissingDependencyError(name)
+        return func(*args, **kwargs)
+
+    return inner
+
+
+class Config:
+    ...
+
+
+class Searcher:
+    ...
+
+
+class Scoped:
+    ...
+
+
+def service(
+    path: str, job=None, *, config: Config = Injected, searcher: Searcher = Injected
+):
+    return path
+
+
+def scoped_service(path: str, *, config: Config = Injected, scoped: Scoped = Injected):
+    return path
+
+
+def per_call(func, *args) -> float:
+    """Microseconds per call"""
+    return min(timeit.repeat(lambda: func(*args), number=CALLS, repeat=5)) / CALLS * 1e6
+
+
+def main():
+    injection._INJECTS.update({Config: Config(), Searcher: Searcher()})
+    injection._SCOPED_INJECTS[Scoped] = Scoped
+    results = {
+        "plain call": per_call(service, "path", None),
+        "legacy injection": per_call(legacy_injectable_sync(service), "path"),
+        "compiled injection": per_call(injectable_sync(service), "path"),
+    }
+    compiled_scoped = injectable_sync(scoped_service)
+    results["scoped, own scope per call"] = per_call(compiled_scoped, "path")
+    with injection_scope():
+        results["scoped, inside a scope"] = per_call(compiled_scoped, "path")
+    for name, microseconds in results.items():
+        print(f"{name:<28} {microseconds:8.3f} µs/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Song search latency on a synthetic library.
+
+    python -m benchmarks.bench_query                 # 500k songs
+    python -m benchmarks.bench_query --songs 50000
+
+Songs and albums are inserted straight into the tables, so the full-text index
+is filled by its triggers, like it is on import.
+"""
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from itertools import accumulate
+from pathlib import Path
+
+import click
+from sqlalchemy import insert
+
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.services import query_service
+
+GENRES = ["Rock", "Jazz", "Electronic", "Folk", "Classical", "Hip Hop"]
+# a few very common words, then made up ones
+COMMON_WORDS = "love night heart blue the of you me in song".split()
+QUERIES = ["love", "blue night", "the", "heart of", "lomi", "kesa ravo", "jazz vu"]
+
+TRACKS_PER_ALBUM = 10
+VOCABULARY_SIZE = 20_000
+SYLLABLES = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+
+
+def _vocabulary(rng: random.Random) -> list[str]:
+    words = list(COMMON_WORDS)
+    while len(words) < VOCABULARY_SIZE:
+        words.append("".join(rng.choices(SYLLABLES, k=rng.randint(2, 3))))
+    return words
+
+
+def _title(rng: random.Random, words: list[str], cum_weights: list[float]) -> str:
+    # word frequencies follow Zipf's law, like in real titles
+    count = rng.randint(1, 4)
+    chosen = rng.choices(words, cum_weights=cum_weights, k=count)
+    return " ".join(word.capitalize() for word in chosen)
+
+
+def fill_library(Session, songs: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = _vocabulary(rng)
+    weights = list(accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    artists = [_title(rng, words, weights) for _ in range(songs // 100 + 1)]
+    albums = songs // TRACKS_PER_ALBUM
+    with Session() as session:
+        session.execute(
+            insert(db.albums_table),
+            [
+                dict(
+                    id=album + 1,
+                    name=_title(rng, words, weights),
+                    genre=rng.choice(GENRES),
+                    artist_name=rng.choice(artists),
+                    master_provider_id=album + 1,
+                )
+                for album in range(albums)
+            ],
+        )
+        album_rows = session.execute(
+            db.albums_table.select().with_only_columns(
+                db.albums_table.c.id, db.albums_table.c.name, db.albums_table.c.artist_name
+            )
+        ).all()
+        session.execute(
+            insert(db.songs_table),
+            [
+                dict(
+                    title=_title(rng, words, weights),
+                    album_id=album_id,
+                    album_name=album_name,
+                    artist_name=artist_name,
+                    local_path=Path(f"/lib/{album_id}/{track}.flac"),
+                )
+                for album_id, album_name, artist_name in album_rows
+                for track in range(TRACKS_PER_ALBUM)
+            ],
+        )
+        session.commit()
+
+
+@click.command()
+@click.option("--songs", default=500_000, help="Songs in the library")
+@click.option("--repeat", default=20, help="Runs of every query")
+@click.option("--page-size", default=20)
+def main(songs: int, repeat: int, page_size: int):
+    workdir = Path(tempfile.mkdtemp(prefix="mptreasury-bench-"))
+    try:
+        db.master_engine = None
+        Session = db.get_sessionmaker(Config(DB_FILE=workdir / "library.db"))
+        db.create_tables()
+        started = time.perf_counter()
+        fill_library(Session, songs)
+        click.echo(f"Inserted {songs} songs in {time.perf_counter() - started:.1f}s")
+        for query in QUERIES:
+            timings = []
+            for page in range(repeat):
+                started = time.perf_counter()
+                result = query_service.query_songs(
+                    query, page % 3, page_size, Session=Session
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+            click.echo(
+                f"  {query!r:<14} median {statistics.median(timings):7.2f}ms "
+                f"max {max(timings):7.2f}ms ({len(result['songs'])} on the last page)"
+            )
+        db.master_engine.dispose()
+        db.master_engine = None
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
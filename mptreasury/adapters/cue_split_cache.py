@@ -0,0 +1,131 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Callable
+
+from loguru import logger
+
+from mptreasury.core import constants
+
+CACHE_DIR_NAME = "cue_splits"
+HASH_CHUNK_SIZE = 1024 * 1024
+# files of an entry, with their sizes, as the split left them
+MANIFEST_NAME = ".manifest"
+
+
+def cue_folder_key(cue_folder: Path) -> str:
+    """Digest of the cue sheet and audio files of the folder, by content,
+    so that the same rip in two places (or renamed) gets the same key"""
+    digest = hashlib.sha256()
+    files = sorted(
+        file
+        for file in cue_folder.iterdir()
+        if file.suffix == ".cue" or file.suffix in constants.ALL_MUSIC_EXTENSIONS
+    )
+    for file in files:
+        # the cue sheet refers to the audio file by name
+        digest.update(f"{file.name}\0".encode(errors="surrogateescape"))
+        with file.open("rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _files(folder: Path) -> list[Path]:
+    return [
+        Path(root) / file
+        for root, _, files in os.walk(folder)
+        for file in files
+        if file != MANIFEST_NAME
+    ]
+
+
+def _write_manifest(entry: Path):
+    lines = [
+        f"{file.stat().st_size}\t{file.relative_to(entry)}" for file in _files(entry)
+    ]
+    (entry / MANIFEST_NAME).write_text("\n".join(sorted(lines)))
+
+
+def _is_intact(entry: Path) -> bool:
+    """Whether the entry still holds every file the split wrote. Placing songs
+    by moving them takes them out of the cache"""
+    try:
+        manifest = (entry / MANIFEST_NAME).read_text()
+    except OSError:
+        return False
+    for line in manifest.splitlines():
+        size, name = line.split("\t", 1)
+        file = entry / name
+        if not file.is_file() or file.stat().st_size != int(size):
+            return False
+    return True
+
+
+def _folder_size(folder: Path) -> int:
+    # the manifests are left out, so that the cap is on the songs alone
+    return sum(file.stat().st_size for file in _files(folder))
+
+
+class CueSplitCache:
+    """Split cue albums under CACHE_FOLDER/cue_splits/<key>, where the key
+    is a digest of the cue sheet and audio. An entry's mtime is bumped when
+    it is used; when the entries' total size goes over `max_bytes`, the least
+    recently used ones are removed."""
+
+    def __init__(self, cache_folder: Path, max_bytes: int) -> None:
+        self.folder = cache_folder / CACHE_DIR_NAME
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def get_or_split(self, cue_folder: Path, split: Callable[[Path], None]) -> Path:
+        """Folder holding the split songs of cue_folder. When they're not
+        cached yet, split(target) is called to write them to target"""
+        key = cue_folder_key(cue_folder)
+        entry = self.folder / key
+        if entry.is_dir():
+            if _is_intact(entry):
+                logger.info("Reusing split songs of {} from {}", cue_folder, entry)
+                os.utime(entry)
+                return entry
+            logger.info("Split songs of {} are gone from {}", cue_folder, entry)
+            shutil.rmtree(entry, ignore_errors=True)
+        # split somewhere else first, so that an interrupted split
+        # never looks like a cached one
+        partial = self.folder / f"{key}.{os.getpid()}.partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir()
+        try:
+            split(partial)
+            _write_manifest(partial)
+            os.rename(partial, entry)
+        except OSError:
+            if not entry.is_dir():
+                raise
+            # another process split the same album in the meantime
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+        self.evict(keep=entry)
+        return entry
+
+    def evict(self, keep: Path | None = None):
+        entries = [
+            entry
+            for entry in self.folder.iterdir()
+            if entry.is_dir() and not entry.name.endswith(".partial")
+        ]
+        sizes = {entry: _folder_size(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            logger.info("Evicting split songs {} from the cache", entry.name)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+    def size(self) -> int:
+        return _folder_size(self.folder)
@@ -0,0 +1,160 @@
+import re
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from loguru import logger
+
+# cue sheet positions are in frames, 75 to a second
+FRAMES_PER_SECOND = 75
+
+_INDEX_RE = re.compile(r"INDEX\s+(\d+)\s+(\d+):(\d+):(\d+)")
+_TRACK_RE = re.compile(r"TRACK\s+(\d+)\s+(\w+)")
+
+
+class CueSheetError(Exception):
+    ...
+
+
+class CueTrack:
+    def __init__(self, number: int, file: Path) -> None:
+        self.number = number
+        self.file = file
+        self.title = ""
+        self.performer: str | None = None
+        # INDEX 01, in frames from the start of the file
+        self.start: int | None = None
+        # start of the next track in the same file; None means the end of the file
+        self.end: int | None = None
+
+
+class CueSheet:
+    def __init__(self) -> None:
+        self.title = ""
+        self.performer = ""
+        self.date: str | None = None
+        self.tracks: list[CueTrack] = []
+
+
+def _value(line: str) -> str:
+    return line.split(" ", 1)[1].strip().strip('"') if " " in line else ""
+
+
+def _read_cue_text(cue_file: Path) -> str:
+    data = cue_file.read_bytes()
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return data.decode(errors="ignore")
+
+
+def parse_cue_sheet(cue_file: Path) -> CueSheet:
+    """Reads the track layout from a cue sheet; file paths are relative to it"""
+    sheet = CueSheet()
+    current_file: Path | None = None
+    track: CueTrack | None = None
+    for raw_line in _read_cue_text(cue_file).splitlines():
+        line = raw_line.strip()
+        keyword = line.split(" ", 1)[0].upper()
+        match keyword:
+            case "FILE":
+                # FILE "name with spaces.flac" WAVE
+                name = line[len("FILE") :].strip().rsplit(" ", 1)[0].strip('"')
+                current_file = cue_file.parent / name
+            case "TRACK":
+                if current_file is None or not (match := _TRACK_RE.match(line)):
+                    raise CueSheetError(f"Bad TRACK line in {cue_file}: {line}")
+                track = CueTrack(int(match.group(1)), current_file)
+                sheet.tracks.append(track)
+            case "TITLE" | "PERFORMER":
+                attribute = keyword.lower()
+                setattr(track if track is not None else sheet, attribute, _value(line))
+            case "REM" if track is None and line.upper().startswith("REM DATE"):
+                sheet.date = _value(_value(line))
+            case "INDEX":
+                if track is None or not (match := _INDEX_RE.match(line)):
+                    raise CueSheetError(f"Bad INDEX line in {cue_file}: {line}")
+                if int(match.group(1)) == 1:
+                    minutes, seconds, frames = (int(group) for group in match.groups()[1:])
+                    track.start = (minutes * 60 + seconds) * FRAMES_PER_SECOND + frames
+    if not sheet.tracks:
+        raise CueSheetError(f"No tracks in {cue_file}")
+    for track, next_track in zip(sheet.tracks, sheet.tracks[1:] + [None]):
+        if track.start is None:
+            raise CueSheetError(f"Track {track.number} of {cue_file} has no INDEX 01")
+        if next_track is not None and next_track.file == track.file:
+            track.end = next_track.start
+    return sheet
+
+
+def _sanitize(value: str) -> str:
+    return value.replace("/", "")
+
+
+def album_folder(sheet: CueSheet, target: Path) -> Path:
+    """Where the songs go: <target>/<performer>/<date - album>, like deflacue does"""
+    title = f"{sheet.date} - {sheet.title}" if sheet.date else sheet.title
+    return target / _sanitize(sheet.performer) / _sanitize(title)
+
+
+def _seconds(frames: int) -> str:
+    return f"{frames / FRAMES_PER_SECOND:.6f}"
+
+
+def sox_command(sheet: CueSheet, track: CueTrack, target_file: Path) -> list[str]:
+    assert track.start is not None
+    trim = ["trim", _seconds(track.start)]
+    if track.end is not None:
+        # "=" makes the end an absolute position, rather than a length
+        trim.append(f"={_seconds(track.end)}")
+    comments = dict(
+        TITLE=track.title,
+        ARTIST=track.performer or sheet.performer,
+        ALBUM=sheet.title,
+        TRACKNUMBER=str(track.number),
+        DATE=sheet.date,
+    )
+    return [
+        "sox",
+        "-V1",
+        str(track.file),
+        "--comment",
+        "",
+        *(f"--add-comment={key}={value}" for key, value in comments.items() if value),
+        str(target_file),
+        *trim,
+    ]
+
+
+def split_cue_album(cue_file: Path, target: Path, workers: int = 1) -> Path:
+    """Split the album of a cue sheet into one flac per track, with up to
+    `workers` tracks being extracted at once, and return the songs' folder.
+    Each extraction is its own sox process, so threads are enough to drive them"""
+    sheet = parse_cue_sheet(cue_file)
+    songs_folder = album_folder(sheet, target)
+    songs_folder.mkdir(parents=True, exist_ok=True)
+    number_width = len(str(len(sheet.tracks)))
+    commands = []
+    for track in sheet.tracks:
+        if not track.file.exists():
+            raise CueSheetError(f"{track.file} of {cue_file} does not exist")
+        track_number = str(track.number).rjust(number_width, "0")
+        file_name = f"{track_number} - {_sanitize(track.title)}.flac"
+        commands.append(sox_command(sheet, track, songs_folder / file_name))
+
+    def run(command: list[str]):
+        logger.debug("Running {}", shlex.join(command))
+        subprocess.run(command, check=True, capture_output=True)
+
+    logger.info("Splitting {} tracks of {}", len(commands), cue_file)
+    if workers > 1 and len(commands) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() so that errors from the workers are raised here
+            list(executor.map(run, commands))
+    else:
+        for command in commands:
+            run(command)
+    return songs_folder
@@ -1,71 +1,55 @@
-from typing import List, Protocol, Tuple
+from typing import List, Protocol
 
 import discogs_client.models as discogs_models
 from discogs_client import Client
-from fuzzywuzzy import fuzz
+from discogs_client.exceptions import HTTPError
 
 from app.model import Album, RawAlbum, Song
+from mptreasury.adapters.discogs_cache import CachingFetcher, DiscogsCache
+from mptreasury.adapters.discogs_dump import SEARCH_PAGE_SIZE, DiscogsDumpIndex
 from mptreasury.util.injection import Injected, injectable_sync
-
-
-# TODO: this is quite the convoluted piece of logic. unit test it I guess 🤷
-def fuzzy_match_tracks(actual_tracks: List[str], potential_matches: List[str]):
-    # Triplets of actual track, potential match, matching score
-    # Could this be dog 🤔
-    triplets: List[Tuple[str, str, int]] = []
-    for potential_match in potential_matches:
-        if len(actual_tracks) == 0:
-            break
-        scores = [
-            fuzz.partial_ratio(potential_match, actual_track)
-            for actual_track in actual_tracks
-        ]
-        index_max = max(range(len(scores)), key=scores.__getitem__)
-        triplets.append((actual_tracks[index_max], potential_match, scores[index_max]))
-        del actual_tracks[index_max]
-    score = score_fuzzy_match_triplet(
-        triplets, len(actual_tracks), len(potential_matches)
-    )
-    return triplets, score
-
-
-def score_fuzzy_match_triplet(
-    triplets: List[Tuple[str, str, int]],
-    no_of_actual_tracks: int,
-    no_of_potential_tracks: int,
-):
-    score_sum = sum([triplet[2] for triplet in triplets])
-    score_mean = score_sum / len(triplets)
-    score_mean = score_mean * (1 - 0.2 * no_of_actual_tracks)
-    potential_tracks_diff = no_of_potential_tracks - len(triplets)
-    score_mean = score_mean * (1 - 0.2 * potential_tracks_diff)
-    return score_mean
+from mptreasury.util.track_matching import match_tracks as fuzzy_match_tracks
 
 
 class FakeTrack:
     def __init__(self, title) -> None:
         self.title = title
 
+    def fetch(self, key, default=None):
+        # only regular tracks are kept, not headings or index tracks
+        return "track" if key == "type_" else default
+
 
 class FakeArtist:
-    id = 1234
-    name = "test artist"
+    def __init__(self, id: int = 1234, name: str = "test artist") -> None:
+        self.id = id
+        self.name = name
 
 
 class FakeMaster:
-    title = "test master"
-    id = 12345
+    def __init__(self, id: int = 12345, title: str = "test master") -> None:
+        self.id = id
+        self.title = title
 
 
 class FakeDiscogsAlbum:
-    def __init__(self, track_names: List[str]) -> None:
+    def __init__(
+        self,
+        track_names: List[str],
+        id: int = 123,
+        title: str = "test album",
+        artist: FakeArtist | None = None,
+        master: FakeMaster | None = None,
+    ) -> None:
         self.tracklist = [FakeTrack(title) for title in track_names]
-        self.title = "test album"
+        self.title = title
         self.genres = ["test genre 1", "test genre 2"]
         self.year = 1986
-        self.artists = [FakeArtist()]
-        self.id = 123
-        self.master = FakeMaster()
+        self.artists = [artist or FakeArtist()]
+        self.id = id
+        self.master = master or FakeMaster()
+        # what search results carry without being fetched
+        self.data = dict(id=id, title=title, master_id=self.master.id)
 
 
 class PaginatedList:
@@ -92,6 +76,48 @@ class FakeDiscogsClient:
         return PaginatedList(self._tracklist)
 
 
+class FakeSearchPages:
+    def __init__(self, albums: List[FakeDiscogsAlbum]) -> None:
+        self._albums = albums
+
+    def page(self, number: int):
+        return self._albums if number == 0 else []
+
+
+class FakeDiscogsCatalogClient:
+    """Offline client that knows a whole catalog of albums, by title.
+    Searches answer with the album (if it's known) after `decoys` albums
+    with other tracks, so that matching has some candidates to go through"""
+
+    def __init__(self, albums: List[FakeDiscogsAlbum], decoys: int = 0) -> None:
+        self._albums = {album.title: album for album in albums}
+        self._decoys = [
+            FakeDiscogsAlbum(
+                [f"decoy track {track}" for track in range(10)],
+                id=-decoy - 1,
+                title=f"decoy {decoy}",
+                master=FakeMaster(id=-decoy - 1),
+            )
+            for decoy in range(decoys)
+        ]
+        self.searches = 0
+        self.queries: List[str] = []
+        self.releases = 0
+
+    def search(self, query: str, *args, **kwargs):
+        self.searches += 1
+        self.queries.append(query)
+        found = [self._albums[query]] if query in self._albums else []
+        return FakeSearchPages(self._decoys + found)
+
+    def release(self, id: int):
+        self.releases += 1
+        for album in self._albums.values():
+            if album.id == id:
+                return album
+        raise HTTPError("Release not found.", 404)
+
+
 class DiscogsAdapter:
     def __init__(self, client):
         self._client = client
@@ -139,6 +165,13 @@ class DiscogsAdapter:
         raise ValueError("could not populate album")
 
 
+class SearchPages(Protocol):
+    """What a search gives back: its results, a page at a time"""
+
+    def next_page(self) -> list:
+        ...
+
+
 class SearchResults:
     def __init__(self, results: discogs_models.MixedPaginatedList) -> None:
         self._last_page_fetched = -1
@@ -150,14 +183,68 @@ class SearchResults:
 
 
 class Searcher:
-    def __init__(self, client: Client = Injected) -> None:
+    def __init__(
+        self, client: Client = Injected, cache: DiscogsCache | None = None
+    ) -> None:
         self._client = client
+        self._cache = cache
+        if cache is not None:
+            # search pages and release/master payloads are all fetched
+            # through the client's fetcher, so that's where we cache them
+            self._client._fetcher = CachingFetcher(self._client._fetcher, cache)
+
+    def cache_stats(self) -> dict[str, int] | None:
+        if self._cache is None:
+            return None
+        return self._cache.stats()
 
     def search(
         self,
         album_name: str,
         artist_name: str | None = None,
-    ) -> SearchResults:
+    ) -> SearchPages:
         return SearchResults(
             self._client.search(album_name, type="release", artist=artist_name)
         )
+
+    def release(self, release_id: int) -> discogs_models.Release:
+        """The release with that id; it's fetched when it's first used"""
+        return self._client.release(release_id)
+
+
+class OfflineSearchResults:
+    def __init__(self, index: DiscogsDumpIndex, title: str, artist: str | None) -> None:
+        self._index = index
+        self._title = title
+        self._artist = artist
+        self._last_page_fetched = -1
+
+    def next_page(self) -> list:
+        self._last_page_fetched += 1
+        return self._index.search(
+            self._title,
+            self._artist,
+            limit=SEARCH_PAGE_SIZE,
+            offset=self._last_page_fetched * SEARCH_PAGE_SIZE,
+        )
+
+
+class OfflineSearcher(Searcher):
+    """Searcher that answers from a local index of the Discogs data dumps,
+    without ever going to the API"""
+
+    def __init__(self, index: DiscogsDumpIndex) -> None:
+        self._index = index
+        self._cache = None
+
+    def search(
+        self,
+        album_name: str,
+        artist_name: str | None = None,
+    ) -> SearchPages:
+        return OfflineSearchResults(self._index, album_name, artist_name)
+
+    def release(self, release_id: int):
+        if (release := self._index.release(release_id)) is None:
+            raise HTTPError("Release not found.", 404)
+        return release
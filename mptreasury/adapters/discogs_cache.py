@@ -0,0 +1,178 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from loguru import logger
+
+CACHE_FILE_NAME = "discogs_cache.sqlite"
+
+
+class DiscogsCache:
+    """On-disk cache of raw Discogs API payloads.
+
+    Every entry has its own expiry time; when the total size of the stored
+    payloads goes over `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        cache_folder: Path,
+        max_bytes: int,
+        search_ttl: int,
+        release_ttl: int,
+    ) -> None:
+        cache_folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.search_ttl = search_ttl
+        self.release_ttl = release_ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        # the cache is shared by every thread that talks to discogs, so all
+        # access to the connection goes through the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            cache_folder / CACHE_FILE_NAME, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, "
+            "value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_entries_last_used ON entries (last_used)"
+        )
+        self._conn.commit()
+        self._total_size: int = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> bytes | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self._total_size -= size
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: bytes, ttl: int) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            # would evict everything else and still not fit
+            return
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._total_size -= row[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now + ttl, now),
+            )
+            self._total_size += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self._total_size <= self.max_bytes:
+            return
+        # expired entries go first, regardless of when they were last used
+        self._total_size -= self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries WHERE expires_at <= ?",
+            (time.time(),),
+        ).fetchone()[0]
+        self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        cursor = self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_used ASC"
+        )
+        to_evict: list[str] = []
+        for key, size in cursor:
+            if self._total_size <= self.max_bytes:
+                break
+            to_evict.append(key)
+            self._total_size -= size
+        self._conn.executemany(
+            "DELETE FROM entries WHERE key = ?", [(key,) for key in to_evict]
+        )
+        self.evictions += len(to_evict)
+
+    def ttl_for_url(self, url: str) -> int | None:
+        """How long the payload behind `url` may be cached,
+        or None if it should not be cached at all"""
+        path = urlparse(url).path
+        if path.startswith("/database/search"):
+            return self.search_ttl
+        if path.startswith("/releases/") or path.startswith("/masters/"):
+            return self.release_ttl
+        return None
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                expired=self.expired,
+                evictions=self.evictions,
+                entries=entries,
+                size=self._total_size,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._total_size = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachingFetcher:
+    """Wraps a discogs_client fetcher and serves GET requests for search pages,
+    releases and masters from a DiscogsCache when possible"""
+
+    def __init__(self, fetcher, cache: DiscogsCache) -> None:
+        self.fetcher = fetcher
+        self.cache = cache
+
+    def fetch(self, client, method, url, data=None, headers=None, json=True):
+        ttl = self.cache.ttl_for_url(url) if method == "GET" else None
+        if ttl is None:
+            return self.fetcher.fetch(client, method, url, data, headers, json)
+        if (content := self.cache.get(url)) is not None:
+            logger.debug("Discogs cache hit for {}", url)
+            return content, 200
+        content, status_code = self.fetcher.fetch(
+            client, method, url, data, headers, json
+        )
+        if status_code == 200:
+            self.cache.put(url, content, ttl)
+        return content, status_code
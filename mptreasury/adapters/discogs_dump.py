@@ -0,0 +1,300 @@
+import gzip
+import json
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import IO, Iterator
+from xml.etree.ElementTree import Element, iterparse
+
+from loguru import logger
+
+from mptreasury.util.metrics import metrics
+from mptreasury.util.trigrams import normalize
+
+INGEST_BATCH_SIZE = 10_000
+# releases a search answers with at once, like a page of the API's results
+SEARCH_PAGE_SIZE = 50
+# "John Smith (2)" is how Discogs tells apart artists of the same name
+_NAME_NUMBER_RE = re.compile(r"\s+\(\d+\)$")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS releases ("
+    "id INTEGER PRIMARY KEY, "
+    "title TEXT NOT NULL, "
+    "master_id INTEGER, "
+    "year INTEGER, "
+    # JSON lists: [[id, name], ...] for artists, plain names for the others
+    "artists TEXT NOT NULL, "
+    "genres TEXT NOT NULL, "
+    "formats TEXT NOT NULL, "
+    "tracks TEXT NOT NULL, "
+    "track_count INTEGER NOT NULL, "
+    "normalized_title TEXT NOT NULL, "
+    "normalized_artists TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS masters ("
+    "id INTEGER PRIMARY KEY, "
+    "title TEXT NOT NULL, "
+    "year INTEGER, "
+    "main_release INTEGER)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS releases_fts USING fts5("
+    "normalized_title, normalized_artists, "
+    "content='releases', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+)
+
+
+def artist_name(name: str) -> str:
+    return _NAME_NUMBER_RE.sub("", name)
+
+
+def _text(element: Element | None, path: str) -> str:
+    if element is None:
+        return ""
+    return (element.findtext(path) or "").strip()
+
+
+def _year(value: str) -> int | None:
+    # dates are "1957", "1957-09-00" or missing
+    return int(value[:4]) if value[:4].isdigit() and int(value[:4]) else None
+
+
+def _release_row(element: Element) -> tuple | None:
+    if element.get("status", "Accepted") != "Accepted":
+        return None
+    title = _text(element, "title")
+    artists = [
+        (int(artist.findtext("id") or 0), artist_name(_text(artist, "name")))
+        for artist in element.iterfind("artists/artist")
+    ]
+    if not title or not artists:
+        return None
+    # like the API's tracklist with only the tracks of type "track": headings
+    # have no position, and index tracks are only a title over sub tracks
+    tracks = [
+        _text(track, "title")
+        for track in element.iterfind("tracklist/track")
+        if _text(track, "position") and track.find("sub_tracks") is None
+    ]
+    formats: list[str] = []
+    for release_format in element.iterfind("formats/format"):
+        formats.append(release_format.get("name", ""))
+        formats.extend(_text(d, ".") for d in release_format.iterfind("descriptions/description"))
+    master_id = _text(element, "master_id")
+    return (
+        int(element.get("id", 0)),
+        title,
+        int(master_id) if master_id.isdigit() else None,
+        _year(_text(element, "released")),
+        json.dumps(artists),
+        json.dumps([_text(genre, ".") for genre in element.iterfind("genres/genre")]),
+        json.dumps([name for name in formats if name]),
+        json.dumps(tracks),
+        len(tracks),
+        normalize(title),
+        normalize(" ".join(name for _, name in artists)),
+    )
+
+
+def _master_row(element: Element) -> tuple | None:
+    title = _text(element, "title")
+    if not title:
+        return None
+    main_release = _text(element, "main_release")
+    return (
+        int(element.get("id", 0)),
+        title,
+        _year(_text(element, "year")),
+        int(main_release) if main_release.isdigit() else None,
+    )
+
+
+def _open_dump(path: Path) -> IO[bytes]:
+    # the dumps are published gzipped, and are many times bigger unpacked
+    return gzip.open(path, "rb") if path.suffix == ".gz" else path.open("rb")
+
+
+def _iter_entries(dump: IO[bytes]) -> Iterator[Element]:
+    """The children of the dump's root, one at a time; each of them is cleared
+    once the next one is asked for, so memory use stays flat"""
+    depth = 0
+    root: Element | None = None
+    for event, element in iterparse(dump, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            yield element
+            element.clear()
+            root.clear()  # type: ignore
+
+
+class DumpArtist:
+    def __init__(self, id: int, name: str) -> None:
+        self.id = id
+        self.name = name
+
+
+class DumpMaster:
+    def __init__(self, id: int, title: str) -> None:
+        self.id = id
+        self.title = title
+
+
+class DumpTrack:
+    def __init__(self, title: str) -> None:
+        self.title = title
+
+    def fetch(self, key, default=None):
+        return "track" if key == "type_" else default
+
+
+class DumpRelease:
+    """A release from the index, with what the import reads of the API's
+    releases. Like theirs, the tracklist is only loaded when it's used"""
+
+    def __init__(self, index: "DiscogsDumpIndex", row: sqlite3.Row) -> None:
+        self._index = index
+        self._tracklist: list[DumpTrack] | None = None
+        self.id: int = row["id"]
+        self.title: str = row["title"]
+        # the API says 0 when it doesn't know
+        self.year: int = row["year"] or 0
+        self.genres: list[str] = json.loads(row["genres"])
+        self.artists = [DumpArtist(id, name) for id, name in json.loads(row["artists"])]
+        # like the API, None for releases that aren't part of any master;
+        # without the masters dump, the master is known by its id alone
+        self.master: DumpMaster | None = None
+        if row["master_id"]:
+            self.master = DumpMaster(row["master_id"], row["master_title"] or self.title)
+        # what a search result carries; the track count is the index's own
+        self.data = dict(
+            id=self.id,
+            title=f"{' & '.join(a.name for a in self.artists)} - {self.title}",
+            master_id=row["master_id"],
+            year=str(row["year"] or ""),
+            genre=self.genres,
+            format=json.loads(row["formats"]),
+            track_count=row["track_count"],
+        )
+
+    @property
+    def tracklist(self) -> list[DumpTrack]:
+        if self._tracklist is None:
+            self._tracklist = [DumpTrack(title) for title in self._index.tracks(self.id)]
+        return self._tracklist
+
+
+_RELEASE_COLUMNS = (
+    "releases.id, releases.title, releases.master_id, releases.year, "
+    "releases.artists, releases.genres, releases.formats, releases.track_count, "
+    "masters.title AS master_title"
+)
+
+
+def _match_terms(text: str) -> str:
+    return " ".join(f'"{word}"' for word in normalize(text).split())
+
+
+class DiscogsDumpIndex:
+    """Releases and masters of the Discogs data dumps, in an sqlite file,
+    searchable by title and artist"""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        # shared by the threads that fetch candidates, like the cache
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def ingest(self, dump_path: Path) -> dict[str, int]:
+        """Add the releases or masters of a dump file, whichever it holds.
+        Entries already in the index are replaced"""
+        counts = dict(releases=0, masters=0, skipped=0)
+        releases: list[tuple] = []
+        masters: list[tuple] = []
+        with self._lock, _open_dump(dump_path) as dump, metrics.span("dump_ingest"):
+            self._conn.execute("PRAGMA synchronous=OFF")
+            for element in _iter_entries(dump):
+                if element.tag == "release" and (row := _release_row(element)):
+                    releases.append(row)
+                elif element.tag == "master" and (row := _master_row(element)):
+                    masters.append(row)
+                else:
+                    counts["skipped"] += 1
+                if len(releases) + len(masters) >= INGEST_BATCH_SIZE:
+                    self._write(releases, masters, counts)
+            self._write(releases, masters, counts)
+            if counts["releases"]:
+                logger.info("Rebuilding the search index of {}", self.path)
+                self._conn.execute("INSERT INTO releases_fts(releases_fts) VALUES('rebuild')")
+            self._conn.commit()
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        metrics.increment("dump_releases_ingested", counts["releases"])
+        metrics.increment("dump_masters_ingested", counts["masters"])
+        logger.info("Ingested {}: {}", dump_path, counts)
+        return counts
+
+    def _write(self, releases: list[tuple], masters: list[tuple], counts: dict[str, int]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO releases VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            releases,
+        )
+        self._conn.executemany("INSERT OR REPLACE INTO masters VALUES (?, ?, ?, ?)", masters)
+        self._conn.commit()
+        counts["releases"] += len(releases)
+        counts["masters"] += len(masters)
+        releases.clear()
+        masters.clear()
+
+    def search(
+        self, title: str, artist: str | None = None, limit: int = SEARCH_PAGE_SIZE, offset: int = 0
+    ) -> list[DumpRelease]:
+        """Releases with every word of the title in theirs, and every word of
+        the artist in their artists' names; exact titles first, then by bm25"""
+        if not (title_terms := _match_terms(title)):
+            return []
+        match = f"{{normalized_title}} : ({title_terms})"
+        if artist and (artist_terms := _match_terms(artist)):
+            match += f" AND {{normalized_artists}} : ({artist_terms})"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_RELEASE_COLUMNS} FROM releases_fts "
+                "JOIN releases ON releases.id = releases_fts.rowid "
+                "LEFT JOIN masters ON masters.id = releases.master_id "
+                "WHERE releases_fts MATCH ? "
+                "ORDER BY releases.normalized_title != ?, "
+                "bm25(releases_fts, 4.0, 1.0), releases.id "
+                "LIMIT ? OFFSET ?",
+                (match, normalize(title), limit, offset),
+            ).fetchall()
+        return [DumpRelease(self, row) for row in rows]
+
+    def release(self, release_id: int) -> DumpRelease | None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_RELEASE_COLUMNS} FROM releases "
+                "LEFT JOIN masters ON masters.id = releases.master_id "
+                "WHERE releases.id = ?",
+                (release_id,),
+            ).fetchone()
+        return DumpRelease(self, row) if row is not None else None
+
+    def tracks(self, release_id: int) -> list[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tracks FROM releases WHERE id = ?", (release_id,)
+            ).fetchone()
+        return json.loads(row["tracks"]) if row is not None else []
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from discogs_client.fetchers import Fetcher
+from loguru import logger
+
+from mptreasury.util.metrics import metrics
+
+# Discogs counts requests over a moving minute
+WINDOW_SECONDS = 60.0
+# longest pause after a 429 that came without a Retry-After
+MAX_BACKOFF_SECONDS = 60.0
+
+
+def _header_int(headers, name: str) -> int | None:
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    """Retry-After is either a number of seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket for the Discogs API, shared by every thread of the process.
+
+    The bucket holds a minute's worth of requests and refills continuously;
+    the X-Discogs-Ratelimit headers of each response correct both its size
+    and its level, since Discogs counts all the requests made with the token.
+    Concurrency grows by one after as many successes as requests allowed in
+    flight, and halves on every 429, which also pauses all requests for as
+    long as the response's Retry-After says."""
+
+    def __init__(self, requests_per_minute: int, max_concurrency: int) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = requests_per_minute
+        self.concurrency = self.max_concurrency
+        self.throttled = 0
+        self._tokens = float(requests_per_minute)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._successes = 0
+        self._strikes = 0
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float):
+        rate = self.limit / WINDOW_SECONDS
+        self._tokens = min(self.limit, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    self._condition.wait(self._paused_until - now)
+                elif self._in_flight >= self.concurrency:
+                    self._condition.wait()
+                elif self._tokens < 1:
+                    self._condition.wait((1 - self._tokens) * WINDOW_SECONDS / self.limit)
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    break
+        metrics.observe("discogs_rate_limit_wait", time.monotonic() - started)
+
+    def release(self, status_code: int | None, headers=None):
+        """Account for the response of a request let through by `acquire`;
+        None means the request failed without one"""
+        headers = headers or {}
+        with self._condition:
+            self._in_flight -= 1
+            self._refill(time.monotonic())
+            if (limit := _header_int(headers, "X-Discogs-Ratelimit")) is not None:
+                # a worker process may be given a smaller share of the limit
+                self.limit = max(1, min(limit, self.requests_per_minute))
+            if (remaining := _header_int(headers, "X-Discogs-Ratelimit-Remaining")) is not None:
+                self._tokens = min(self._tokens, float(remaining))
+            if status_code == 429:
+                self._throttle(retry_after_seconds(headers.get("Retry-After")))
+            elif status_code is not None:
+                self._strikes = 0
+                self._successes += 1
+                if self._successes >= self.concurrency:
+                    self._successes = 0
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self._condition.notify_all()
+
+    def _throttle(self, retry_after: float | None):
+        if retry_after is None:
+            # wait for a token to come back, twice as long on every 429 in a row
+            retry_after = min(
+                MAX_BACKOFF_SECONDS, WINDOW_SECONDS / self.limit * 2**self._strikes
+            )
+        self._strikes += 1
+        self._successes = 0
+        self._tokens = 0.0
+        self.concurrency = max(1, self.concurrency // 2)
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self.throttled += 1
+        metrics.increment("discogs_throttled")
+        logger.info(
+            "Discogs rate limit hit; pausing for {:.1f}s with {} requests at once",
+            retry_after,
+            self.concurrency,
+        )
+
+    def stats(self) -> dict:
+        with self._condition:
+            self._refill(time.monotonic())
+            return dict(
+                limit=self.limit,
+                concurrency=self.concurrency,
+                tokens=self._tokens,
+                throttled=self.throttled,
+            )
+
+
+class RateLimitedFetcher(Fetcher):
+    """discogs_client fetcher authenticating with a user token, which sends
+    every request through a RateLimiter, and retries the ones that got a 429
+    once the limiter lets them through again"""
+
+    def __init__(self, user_token: str, limiter: RateLimiter, max_retries: int = 5) -> None:
+        self.user_token = user_token
+        self.limiter = limiter
+        self.max_retries = max_retries
+        # the limiter does the backing off
+        self.backoff_enabled = False
+        # a session per thread, to reuse connections
+        self._local = threading.local()
+
+    @property
+    def _session(self) -> requests.Session:
+        if (session := getattr(self._local, "session", None)) is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def fetch(self, client, method, url, data=None, headers=None, json_format=True):
+        data = json.dumps(data) if json_format and data else data
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            response = None
+            try:
+                response = self._session.request(
+                    method,
+                    url,
+                    data=data,
+                    headers=headers,
+                    params={"token": self.user_token},
+                    timeout=(self.connect_timeout, self.read_timeout),
+                )
+            finally:
+                if response is None:
+                    self.limiter.release(None)
+                else:
+                    self.limiter.release(response.status_code, response.headers)
+            if response.status_code != 429:
+                break
+            logger.debug("Got a 429 for {} (attempt {})", url, attempt + 1)
+        metrics.increment("discogs_requests", attempt + 1)
+        return response.content, response.status_code
@@ -0,0 +1,85 @@
+import re
+from collections import Counter
+from concurrent.futures import Executor
+from pathlib import Path
+
+import mutagen
+from loguru import logger
+
+from mptreasury.adapters.tag_writer import (
+    DISCOGS_RELEASE_ID,
+    TaggedFile,
+    UnsupportedFormatError,
+)
+
+_READ_TAGS = ("title", "artist", "albumartist", "album", DISCOGS_RELEASE_ID)
+# a plain id, "[r123]" like some taggers write it, or a release url
+_RELEASE_ID_RE = re.compile(r"^\[?r?(\d+)\]?$|/release/(\d+)")
+
+
+class AlbumTags:
+    """What the files of an album say about it; album-wide values are the ones
+    most of the files agree on"""
+
+    def __init__(
+        self,
+        album: str | None,
+        artist: str | None,
+        release_id: int | None,
+        titles: dict[Path, str],
+    ) -> None:
+        self.album = album
+        self.artist = artist
+        self.release_id = release_id
+        self.titles = titles
+
+    def complete_for(self, paths: list[Path]) -> bool:
+        """Whether the tags name the album, its artist, and every one of the
+        files, each with a title of its own"""
+        titles = [self.titles.get(path) for path in paths]
+        return (
+            bool(self.album and self.artist)
+            and all(titles)
+            and len(set(titles)) == len(titles)
+        )
+
+
+def _read_file(path: Path) -> dict[str, str]:
+    try:
+        tagged = TaggedFile(path)
+    except (OSError, UnsupportedFormatError, mutagen.MutagenError) as e:
+        logger.debug("Cannot read the tags of {}: {}", path, e)
+        return {}
+    tags = {}
+    for key in _READ_TAGS:
+        if (values := tagged.get(key)) and values[0].strip():
+            tags[key] = values[0].strip()
+    return tags
+
+
+def _most_common(values: list[str]) -> str | None:
+    return Counter(values).most_common(1)[0][0] if values else None
+
+
+def _release_id(value: str | None) -> int | None:
+    if value is None or not (match := _RELEASE_ID_RE.search(value)):
+        return None
+    return int(match.group(1) or match.group(2))
+
+
+def read_album_tags(paths: list[Path], executor: Executor | None = None) -> AlbumTags:
+    """Read the embedded tags of an album's files, on the executor when one is
+    given; it's meant to be shared by the albums of an import, not made per album"""
+    if executor is not None and len(paths) > 1:
+        files = list(executor.map(_read_file, paths))
+    else:
+        files = [_read_file(path) for path in paths]
+    artists = [tags.get("albumartist") or tags.get("artist") for tags in files]
+    return AlbumTags(
+        album=_most_common([tags["album"] for tags in files if "album" in tags]),
+        artist=_most_common([artist for artist in artists if artist]),
+        release_id=_release_id(
+            _most_common([tags[DISCOGS_RELEASE_ID] for tags in files if DISCOGS_RELEASE_ID in tags])
+        ),
+        titles={path: tags["title"] for path, tags in zip(paths, files) if "title" in tags},
+    )
@@ -0,0 +1,182 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import mutagen.easyid3
+import mutagen.flac
+import mutagen.id3
+import mutagen.mp3
+import mutagen.wave
+from loguru import logger
+
+from app.model import Album, Song
+
+# ID3 frames of the tags we use, for WAV files, which have no "easy" interface
+_ID3_FRAMES = {
+    "title": mutagen.id3.TIT2,
+    "artist": mutagen.id3.TPE1,
+    "albumartist": mutagen.id3.TPE2,
+    "album": mutagen.id3.TALB,
+    "genre": mutagen.id3.TCON,
+    "date": mutagen.id3.TDRC,
+}
+# tags that ID3 has no frame of its own for, kept in TXXX frames by description
+DISCOGS_RELEASE_ID = "discogs_release_id"
+_ID3_USER_TAGS = {DISCOGS_RELEASE_ID: "DISCOGS_RELEASE_ID"}
+for _key, _description in _ID3_USER_TAGS.items():
+    mutagen.easyid3.EasyID3.RegisterTXXXKey(_key, _description)
+
+
+class UnsupportedFormatError(Exception):
+    ...
+
+
+def song_tags(song: Song, album: Album | None = None) -> dict[str, str]:
+    """The tags a song's file should have, according to the db"""
+    tags = dict(artist=song.artist_name, album=song.album_name)
+    # the file of a cue track is its album's image, which has no title of its own
+    if not song.is_cue_track:
+        tags["title"] = song.title
+    if album is not None:
+        tags["genre"] = album.genre
+        if album.released:
+            tags["date"] = str(album.released)
+    return {key: value for key, value in tags.items() if value}
+
+
+class TaggedFile:
+    """The tags of one file, whatever its format, with the changes made to them"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        match path.suffix.lower():
+            case ".flac":
+                self._audio = mutagen.flac.FLAC(path)
+            case ".mp3":
+                self._audio = mutagen.mp3.EasyMP3(path)
+            case ".wav":
+                self._audio = mutagen.wave.WAVE(path)
+            case suffix:
+                raise UnsupportedFormatError(f"Cannot tag {suffix} files: {path}")
+        if self._audio.tags is None:
+            self._audio.add_tags()
+        self._is_id3 = isinstance(self._audio, mutagen.wave.WAVE)
+
+    def get(self, key: str) -> list[str]:
+        tags = self._audio.tags
+        if self._is_id3:
+            if key in _ID3_USER_TAGS:
+                frame = tags.get(f"TXXX:{_ID3_USER_TAGS[key]}")  # type: ignore
+            else:
+                frame = tags.get(_ID3_FRAMES[key].__name__)  # type: ignore
+            return [str(value) for value in frame.text] if frame else []
+        return list(tags.get(key, []))  # type: ignore
+
+    def set(self, key: str, value: str):
+        if self._is_id3:
+            if key in _ID3_USER_TAGS:
+                description = _ID3_USER_TAGS[key]
+                frame = mutagen.id3.TXXX(encoding=3, desc=description, text=[value])
+                self._audio.tags.setall(f"TXXX:{description}", [frame])  # type: ignore
+            else:
+                frame_class = _ID3_FRAMES[key]
+                frame = frame_class(encoding=3, text=[value])
+                self._audio.tags.setall(frame_class.__name__, [frame])  # type: ignore
+        else:
+            self._audio[key] = [value]
+
+    def save(self):
+        self._audio.save()
+
+
+def break_link(path: Path) -> bool:
+    """Give a hard linked file an inode of its own, so that writing it leaves
+    the other links alone: songs of other albums with the same content, or
+    the download it was linked from, whose folder fingerprint would change.
+    Returns whether the file had other links"""
+    if path.stat().st_nlink < 2:
+        return False
+    unlinked = path.with_name(f".{path.name}.unlinked")
+    shutil.copy2(path, unlinked)
+    os.replace(unlinked, path)
+    logger.debug("Broke the hard link of {} before tagging it", path)
+    return True
+
+
+def sync_file(path: Path, tags: dict[str, str]) -> bool:
+    """Write the tags that differ from the file's, leaving the others alone.
+    Returns whether the file had to be written"""
+    tagged = TaggedFile(path)
+    changed = {key: value for key, value in tags.items() if tagged.get(key) != [value]}
+    if not changed:
+        return False
+    for key, value in changed.items():
+        tagged.set(key, value)
+    # the tags were read through the link; saving writes to the path's new inode
+    break_link(path)
+    tagged.save()
+    logger.debug("Updated {} of {}", sorted(changed), path)
+    return True
+
+
+class TagSyncReport:
+    def __init__(self) -> None:
+        self.updated: list[Path] = []
+        self.unchanged = 0
+        self.failed: dict[Path, str] = {}
+
+    def to_dict(self) -> dict:
+        return dict(
+            updated=[str(path) for path in self.updated],
+            unchanged=self.unchanged,
+            failed={str(path): error for path, error in self.failed.items()},
+        )
+
+
+class TagSync:
+    """Makes the tags of the files match the db, a whole album per worker.
+    Files are only written when some of their tags differ. A file is tagged
+    once, for the first song and album it belongs to; hard linked files get
+    an inode of their own before being written, so no two workers ever write
+    the same inode, and a song never gets the tags of another album's"""
+
+    def __init__(self, workers: int = 1) -> None:
+        self.workers = workers
+
+    def _sync_files(self, files: dict[Path, dict[str, str]]) -> TagSyncReport:
+        report = TagSyncReport()
+        for path, tags in files.items():
+            try:
+                if sync_file(path, tags):
+                    report.updated.append(path)
+                else:
+                    report.unchanged += 1
+            except (OSError, UnsupportedFormatError, mutagen.MutagenError) as e:
+                logger.warning("Cannot tag {}: {}", path, e)
+                report.failed[path] = str(e)
+        return report
+
+    def sync(self, albums: list[tuple[Album | None, list[Song]]]) -> TagSyncReport:
+        # a file shared by several songs, like a cue image, gets the tags of
+        # the first of them, even when they're of different albums
+        claimed: set[Path] = set()
+        album_files: list[dict[Path, dict[str, str]]] = []
+        for album, songs in albums:
+            files: dict[Path, dict[str, str]] = {}
+            for song in songs:
+                if song.local_path is not None and song.local_path not in claimed:
+                    files.setdefault(song.local_path, song_tags(song, album))
+            claimed.update(files)
+            album_files.append(files)
+        if self.workers > 1 and len(album_files) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                reports = list(executor.map(self._sync_files, album_files))
+        else:
+            reports = [self._sync_files(files) for files in album_files]
+        report = TagSyncReport()
+        for album_report in reports:
+            report.updated.extend(album_report.updated)
+            report.unchanged += album_report.unchanged
+            report.failed.update(album_report.failed)
+        return report
@@ -0,0 +1,98 @@
+import struct
+import subprocess
+import wave
+from pathlib import Path
+from typing import Iterator
+
+from app.model import Song
+from mptreasury.adapters.cue_splitter import FRAMES_PER_SECOND
+
+CHUNK_SIZE = 64 * 1024
+
+
+def wav_header(channels: int, sample_width: int, rate: int, frames: int) -> bytes:
+    data_size = frames * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,  # PCM
+        channels,
+        rate,
+        rate * channels * sample_width,
+        channels * sample_width,
+        sample_width * 8,
+        b"data",
+        data_size,
+    )
+
+
+def _read_file(path: Path, chunk_size: int) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def _read_wav_range(
+    path: Path, start: int, end: int | None, chunk_size: int
+) -> Iterator[bytes]:
+    with wave.open(str(path), "rb") as f:
+        rate = f.getframerate()
+        frame_size = f.getnchannels() * f.getsampwidth()
+        first = round(start * rate / FRAMES_PER_SECOND)
+        last = f.getnframes() if end is None else round(end * rate / FRAMES_PER_SECOND)
+        last = min(last, f.getnframes())
+        yield wav_header(f.getnchannels(), f.getsampwidth(), rate, last - first)
+        f.setpos(first)
+        remaining = last - first
+        frames_per_chunk = max(chunk_size // frame_size, 1)
+        while remaining > 0:
+            frames = f.readframes(min(frames_per_chunk, remaining))
+            if not frames:
+                break
+            remaining -= len(frames) // frame_size
+            yield frames
+
+
+def _read_range_with_sox(
+    path: Path, start: int, end: int | None, chunk_size: int
+) -> Iterator[bytes]:
+    trim = ["trim", f"{start / FRAMES_PER_SECOND:.6f}"]
+    if end is not None:
+        trim.append(f"={end / FRAMES_PER_SECOND:.6f}")
+    process = subprocess.Popen(
+        ["sox", "-V1", str(path), "-t", "wav", "-", *trim],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    assert process.stdout is not None
+    try:
+        while chunk := process.stdout.read(chunk_size):
+            yield chunk
+    finally:
+        # the reader may stop early, in which case sox is no longer needed
+        if process.poll() is None:
+            process.kill()
+        _, stderr = process.communicate()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, process.args, stderr=stderr
+        )
+
+
+def read_song(song: Song, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """The song's audio, in chunks. Whole files are read as they are; cue tracks
+    are read from their range of the album image and come out as WAV, straight
+    from the image for WAV images and decoded by sox otherwise"""
+    if not song.is_cue_track:
+        return _read_file(song.local_path, chunk_size)
+    if song.local_path.suffix == ".wav":
+        return _read_wav_range(
+            song.local_path, song.track_start, song.track_end, chunk_size
+        )
+    return _read_range_with_sox(
+        song.local_path, song.track_start, song.track_end, chunk_size
+    )
@@ -1,24 +1,165 @@
 import asyncio
 import json
+from pathlib import Path
+
+import click
+
+from mptreasury.core.constants import SearchTermKind
+from mptreasury.protocol import MAX_MESSAGE_SIZE, encode_message, read_message
 
 SOCKET_PATH = "/tmp/my_socket"
 
 
-async def run_client():
+async def send_request(request: dict, follow: bool = False):
+    """Send a request and print what the server answers. When following,
+    keep printing the job's progress events until the final result"""
     reader: asyncio.StreamReader
     writer: asyncio.StreamWriter
-    reader, writer = await asyncio.open_unix_connection(SOCKET_PATH)
-    writer.write(
-        json.dumps(
-            {
-                "name": "import_folder",
-                "music_path": "~/Downloads/torr/Metamorfosi - Inferno/",
-            }
-        ).encode("utf8")
+    reader, writer = await asyncio.open_unix_connection(
+        SOCKET_PATH, limit=MAX_MESSAGE_SIZE
     )
-    resp = await reader.read(1024)
-    print(resp)
+    request = dict(id=1, **request)
+    writer.write(encode_message(request))
+    await writer.drain()
+    results = 0
+    while message := await read_message(reader):
+        click.echo(json.dumps(message))
+        if message["type"] == "error":
+            break
+        if message["type"] == "result":
+            results += 1
+            # a followed request gets a result when it's accepted and another
+            # one when the job is finished
+            if not follow or results == 2:
+                break
+    writer.write(encode_message(dict(name="quit")))
     writer.write_eof()
+    writer.close()
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.argument("music_path", type=click.Path(exists=True, file_okay=False))
+@click.option("--follow/--no-follow", default=True, help="Stream the job's progress")
+@click.option(
+    "--incremental/--full",
+    default=None,
+    help="Skip album folders that haven't changed since they were last imported",
+)
+def import_folder(music_path: str, follow: bool, incremental: bool | None):
+    request = dict(
+        name="import_folder",
+        music_path=str(Path(music_path).absolute()),
+        follow=follow,
+        incremental=incremental,
+    )
+    asyncio.run(send_request(request, follow=follow))
+
+
+@main.command()
+@click.argument("job_id")
+@click.option("--follow/--no-follow", default=False, help="Stream the job's progress")
+def job_status(job_id: str, follow: bool):
+    name = "follow_job" if follow else "job_status"
+    asyncio.run(send_request(dict(name=name, job_id=job_id), follow=follow))
+
+
+@main.command()
+@click.argument("job_id")
+def cancel_job(job_id: str):
+    asyncio.run(send_request(dict(name="cancel_job", job_id=job_id)))
+
+
+@main.command()
+def list_jobs():
+    asyncio.run(send_request(dict(name="list_jobs")))
+
+
+@main.command()
+@click.argument("query")
+@click.option("--page", default=0, help="Page of the results, from 0")
+@click.option("--page-size", default=20, help="Songs per page")
+def query_songs(query: str, page: int, page_size: int):
+    """Songs whose title, album, artist or genre match the words of the query"""
+    request = dict(name="query_songs", query=query, page=page, page_size=page_size)
+    asyncio.run(send_request(request))
+
+
+@main.command()
+@click.argument("query")
+@click.option(
+    "--kind",
+    "kinds",
+    type=click.Choice([kind.value for kind in SearchTermKind]),
+    multiple=True,
+    help="Kinds of names to search; all of them by default",
+)
+@click.option("--limit", default=20, help="Most matches to show")
+def fuzzy_search(query: str, kinds: tuple[str, ...], limit: int):
+    """Albums, artists and songs with names like the query, typos and all"""
+    request = dict(name="fuzzy_search", query=query, kinds=list(kinds), limit=limit)
+    asyncio.run(send_request(request))
+
+
+@main.command()
+@click.option(
+    "--album-id",
+    "album_ids",
+    type=int,
+    multiple=True,
+    help="Albums whose files to retag; the whole library by default",
+)
+def sync_tags(album_ids: tuple[int, ...]):
+    """Make the tags of the library's files match the db"""
+    request = dict(name="sync_tags", album_ids=list(album_ids) or None)
+    asyncio.run(send_request(request))
+
+
+@main.command()
+def upload_library():
+    """Upload the library's songs that aren't in the bucket yet,
+    picking up where an interrupted upload stopped"""
+    asyncio.run(send_request(dict(name="upload_library")))
+
+
+@main.command()
+@click.argument(
+    "dumps", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    "--index",
+    type=click.Path(dir_okay=False),
+    help="Index file to add to; DISCOGS_DUMP_INDEX by default",
+)
+def ingest_discogs_dump(dumps: tuple[str, ...], index: str | None):
+    """Add the releases and masters of Discogs data dumps to a local index,
+    which the server then searches instead of the API"""
+    # this runs here rather than in the server: it's a long, local job
+    # that the server only reads the outcome of
+    from mptreasury.adapters.discogs_dump import DiscogsDumpIndex
+    from mptreasury.core.config import Config
+
+    index_path = Path(index) if index else Config().DISCOGS_DUMP_INDEX
+    if index_path is None:
+        raise click.UsageError("Either pass --index or set DISCOGS_DUMP_INDEX")
+    dump_index = DiscogsDumpIndex(index_path)
+    try:
+        for dump in dumps:
+            counts = dump_index.ingest(Path(dump))
+            click.echo(json.dumps(dict(dump=dump, **counts)))
+    finally:
+        dump_index.close()
+
+
+@main.command()
+def stats():
+    """Stage timings and counters of the server"""
+    asyncio.run(send_request(dict(name="stats")))
 
 
-asyncio.run(run_client())
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,50 @@
 from discogs_client import Client
 from sqlalchemy.orm import Session
 
-from mptreasury.adapters.discogs_adapter import Searcher
+from mptreasury.adapters.discogs_adapter import OfflineSearcher, Searcher
+from mptreasury.adapters.discogs_cache import DiscogsCache
+from mptreasury.adapters.discogs_dump import DiscogsDumpIndex
+from mptreasury.adapters.discogs_rate_limit import RateLimitedFetcher, RateLimiter
 from mptreasury.core.config import Config
-from mptreasury.core.db import get_sessionmaker, create_tables
-from mptreasury.util.injection import add_injectable
+from mptreasury.core.db import DbSession, get_sessionmaker, create_tables
+from mptreasury.util.injection import add_injectable, add_scoped_injectable
 
 
-def bootstrap():
-    config = Config()
+def bootstrap(config: Config | None = None):
+    if config is None:
+        config = Config()
     add_injectable(Config, config)
 
     session = get_sessionmaker(config)
     create_tables()
     add_injectable(Session, session)
+    add_scoped_injectable(DbSession, session)
+
+    cache = DiscogsCache(
+        config.CACHE_FOLDER,
+        max_bytes=config.DISCOGS_CACHE_MAX_BYTES,
+        search_ttl=config.DISCOGS_CACHE_SEARCH_TTL,
+        release_ttl=config.DISCOGS_CACHE_RELEASE_TTL,
+    )
+    add_injectable(DiscogsCache, cache)
+
+    if config.DISCOGS_DUMP_INDEX is not None:
+        # everything is looked up locally, so there's no API budget to share
+        index = DiscogsDumpIndex(config.DISCOGS_DUMP_INDEX)
+        add_injectable(Searcher, OfflineSearcher(index))
+        return
 
     client = Client("mptreasury/0.1", user_token=config.DISCOGS_PAT)
+    # one limiter for the whole process, so that every job and every
+    # prefetching thread takes its requests from the same budget
+    limiter = RateLimiter(
+        config.DISCOGS_REQUESTS_PER_MINUTE, config.DISCOGS_MAX_CONCURRENCY
+    )
+    add_injectable(RateLimiter, limiter)
+    client._fetcher = RateLimitedFetcher(
+        config.DISCOGS_PAT, limiter, max_retries=config.DISCOGS_MAX_RETRIES
+    )
     # add_injectable(Client, client)
 
-    searcher = Searcher(client)
+    searcher = Searcher(client, cache=cache)
     add_injectable(Searcher, searcher)
@@ -2,11 +2,17 @@ import os
 from pathlib import Path
 from typing import Any, Literal, TypeVar, final
 
+from mptreasury.core.constants import CueImportMode, PlacementStrategy
+
 ENV = Literal["prod", "dev", "unit-test", "acceptance-test"]
 
 T = TypeVar("T")
 
 
+def str_to_bool(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes", "on")
+
+
 def from_env_or_from_var(type: Any, env_name: str, var: T) -> T:
     if value := os.getenv(env_name, None):
         return type(value)
@@ -25,6 +31,39 @@ class Config:
         "AWS_ACCESS_KEY",
         "AWS_SECRET_KEY",
         "SOCKET_PATH",
+        "DISCOGS_CACHE_MAX_BYTES",
+        "DISCOGS_CACHE_SEARCH_TTL",
+        "DISCOGS_CACHE_RELEASE_TTL",
+        "DISCOGS_REQUESTS_PER_MINUTE",
+        "DISCOGS_MAX_CONCURRENCY",
+        "DISCOGS_MAX_RETRIES",
+        "DISCOGS_DUMP_INDEX",
+        "CANDIDATE_PREFETCH_WORKERS",
+        "CANDIDATE_PRESCORING",
+        "IMPORT_WORKERS",
+        "JOB_WORKERS",
+        "JOB_QUEUE_SIZE",
+        "JOB_HISTORY_SIZE",
+        "DB_BATCH_SIZE",
+        "SQLITE_JOURNAL_MODE",
+        "SQLITE_SYNCHRONOUS",
+        "SQLITE_CACHE_SIZE",
+        "PLACEMENT_STRATEGY",
+        "PLACEMENT_WORKERS",
+        "PLACEMENT_VERIFY",
+        "PLACEMENT_DEDUP",
+        "TAG_WORKERS",
+        "READ_EMBEDDED_TAGS",
+        "S3_ENDPOINT_URL",
+        "S3_PART_SIZE",
+        "S3_UPLOAD_CONCURRENCY",
+        "S3_FILE_CONCURRENCY",
+        "S3_VERIFY_ETAG",
+        "INCREMENTAL_SCAN",
+        "CUE_SPLIT_CACHE_MAX_BYTES",
+        "CUE_SPLIT_WORKERS",
+        "CUE_IMPORT_MODE",
+        "METRICS_FILE",
     )
 
     def __init__(
@@ -38,6 +77,72 @@ class Config:
         AWS_ACCESS_KEY: str | None = None,
         AWS_SECRET_KEY: str | None = None,
         SOCKET_PATH: Path = Path("/tmp/my_socket"),
+        DISCOGS_CACHE_MAX_BYTES: int = 256 * 1024 * 1024,
+        DISCOGS_CACHE_SEARCH_TTL: int = 24 * 60 * 60,
+        DISCOGS_CACHE_RELEASE_TTL: int = 30 * 24 * 60 * 60,
+        # Discogs' limit for authenticated clients; the response headers
+        # lower it if the actual limit is smaller
+        DISCOGS_REQUESTS_PER_MINUTE: int = 60,
+        # requests to Discogs in flight at once, across all of the server's threads
+        DISCOGS_MAX_CONCURRENCY: int = 4,
+        # times a request that got a 429 is sent again
+        DISCOGS_MAX_RETRIES: int = 5,
+        # index of the Discogs data dumps; when set, albums are looked up
+        # in it instead of through the API
+        DISCOGS_DUMP_INDEX: Path | None = None,
+        # 0 or 1 means candidates are fetched one after the other
+        CANDIDATE_PREFETCH_WORKERS: int = 0,
+        # rank candidates by their search results, and drop the hopeless
+        # ones, before fetching any of them
+        CANDIDATE_PRESCORING: bool = True,
+        # processes used for importing the albums of an artist folder;
+        # 0 or 1 means albums are imported one after the other
+        IMPORT_WORKERS: int = 0,
+        JOB_WORKERS: int = 2,
+        JOB_QUEUE_SIZE: int = 100,
+        # finished jobs whose status and last events are kept
+        JOB_HISTORY_SIZE: int = 100,
+        # albums written per transaction during an import run;
+        # 0 means everything is written at the end of the run
+        DB_BATCH_SIZE: int = 50,
+        SQLITE_JOURNAL_MODE: str = "WAL",
+        SQLITE_SYNCHRONOUS: str = "NORMAL",
+        # negative values are KiB, as per the sqlite docs
+        SQLITE_CACHE_SIZE: int = -64000,
+        # how files get into LIBRARY_DIR: copy, hardlink, reflink or move
+        PLACEMENT_STRATEGY: str = "copy",
+        PLACEMENT_WORKERS: int = 4,
+        # compare checksums of source and target after copying
+        PLACEMENT_VERIFY: bool = False,
+        # hash files before placing them, and hard link the ones whose content
+        # is already in the library instead of copying them again; every file
+        # is read in full to hash it, so this slows down imports without duplicates
+        PLACEMENT_DEDUP: bool = False,
+        # albums whose files' tags are synced with the db at once, and files
+        # whose tags are read at once while importing; reading tags is CPU bound,
+        # so more threads than one made imports slower
+        TAG_WORKERS: int = 1,
+        # prefer the albums' tags to their file names, and look up the
+        # Discogs release they're tagged with before searching
+        READ_EMBEDDED_TAGS: bool = True,
+        # for S3-compatible stores other than AWS
+        S3_ENDPOINT_URL: str | None = None,
+        S3_PART_SIZE: int = 8 * 1024 * 1024,
+        # parts of a file uploaded at once, and files uploaded at once
+        S3_UPLOAD_CONCURRENCY: int = 4,
+        S3_FILE_CONCURRENCY: int = 4,
+        # also compare ETags, not just sizes, of objects already in the bucket
+        S3_VERIFY_ETAG: bool = False,
+        # skip source folders that haven't changed since they were last imported
+        INCREMENTAL_SCAN: bool = False,
+        # songs split from cue albums are kept in CACHE_FOLDER up to this size
+        CUE_SPLIT_CACHE_MAX_BYTES: int = 4 * 1024 * 1024 * 1024,
+        # tracks of a cue album extracted at once; 0 or 1 means one after the other
+        CUE_SPLIT_WORKERS: int = os.cpu_count() or 1,
+        # how cue albums are imported: split or virtual
+        CUE_IMPORT_MODE: str = "split",
+        # Prometheus text file with the server's metrics, updated after every job
+        METRICS_FILE: Path | None = None,
     ) -> None:
         self.LIBRARY_DIR = from_env_or_from_var(Path, "LIBRARY_DIR", LIBRARY_DIR)
         self.DISCOGS_PAT = from_env_or_from_var(str, "DISCOGS_PAT", DISCOGS_PAT)
@@ -54,6 +159,91 @@ class Config:
             str, "AWS_SECRET_KEY", AWS_SECRET_KEY
         )
         self.SOCKET_PATH = from_env_or_from_var(Path, "SOCKET_PATH", SOCKET_PATH)
+        self.DISCOGS_CACHE_MAX_BYTES = from_env_or_from_var(
+            int, "DISCOGS_CACHE_MAX_BYTES", DISCOGS_CACHE_MAX_BYTES
+        )
+        self.DISCOGS_CACHE_SEARCH_TTL = from_env_or_from_var(
+            int, "DISCOGS_CACHE_SEARCH_TTL", DISCOGS_CACHE_SEARCH_TTL
+        )
+        self.DISCOGS_CACHE_RELEASE_TTL = from_env_or_from_var(
+            int, "DISCOGS_CACHE_RELEASE_TTL", DISCOGS_CACHE_RELEASE_TTL
+        )
+        self.DISCOGS_REQUESTS_PER_MINUTE = from_env_or_from_var(
+            int, "DISCOGS_REQUESTS_PER_MINUTE", DISCOGS_REQUESTS_PER_MINUTE
+        )
+        self.DISCOGS_MAX_CONCURRENCY = from_env_or_from_var(
+            int, "DISCOGS_MAX_CONCURRENCY", DISCOGS_MAX_CONCURRENCY
+        )
+        self.DISCOGS_MAX_RETRIES = from_env_or_from_var(
+            int, "DISCOGS_MAX_RETRIES", DISCOGS_MAX_RETRIES
+        )
+        self.DISCOGS_DUMP_INDEX = from_env_or_from_var(
+            Path, "DISCOGS_DUMP_INDEX", DISCOGS_DUMP_INDEX
+        )
+        self.CANDIDATE_PREFETCH_WORKERS = from_env_or_from_var(
+            int, "CANDIDATE_PREFETCH_WORKERS", CANDIDATE_PREFETCH_WORKERS
+        )
+        self.CANDIDATE_PRESCORING = from_env_or_from_var(
+            str_to_bool, "CANDIDATE_PRESCORING", CANDIDATE_PRESCORING
+        )
+        self.IMPORT_WORKERS = from_env_or_from_var(int, "IMPORT_WORKERS", IMPORT_WORKERS)
+        self.JOB_WORKERS = from_env_or_from_var(int, "JOB_WORKERS", JOB_WORKERS)
+        self.JOB_QUEUE_SIZE = from_env_or_from_var(int, "JOB_QUEUE_SIZE", JOB_QUEUE_SIZE)
+        self.JOB_HISTORY_SIZE = from_env_or_from_var(
+            int, "JOB_HISTORY_SIZE", JOB_HISTORY_SIZE
+        )
+        self.DB_BATCH_SIZE = from_env_or_from_var(int, "DB_BATCH_SIZE", DB_BATCH_SIZE)
+        self.SQLITE_JOURNAL_MODE = from_env_or_from_var(
+            str, "SQLITE_JOURNAL_MODE", SQLITE_JOURNAL_MODE
+        )
+        self.SQLITE_SYNCHRONOUS = from_env_or_from_var(
+            str, "SQLITE_SYNCHRONOUS", SQLITE_SYNCHRONOUS
+        )
+        self.SQLITE_CACHE_SIZE = from_env_or_from_var(
+            int, "SQLITE_CACHE_SIZE", SQLITE_CACHE_SIZE
+        )
+        self.PLACEMENT_STRATEGY = from_env_or_from_var(
+            PlacementStrategy, "PLACEMENT_STRATEGY", PlacementStrategy(PLACEMENT_STRATEGY)
+        )
+        self.PLACEMENT_WORKERS = from_env_or_from_var(
+            int, "PLACEMENT_WORKERS", PLACEMENT_WORKERS
+        )
+        self.PLACEMENT_VERIFY = from_env_or_from_var(
+            str_to_bool, "PLACEMENT_VERIFY", PLACEMENT_VERIFY
+        )
+        self.PLACEMENT_DEDUP = from_env_or_from_var(
+            str_to_bool, "PLACEMENT_DEDUP", PLACEMENT_DEDUP
+        )
+        self.TAG_WORKERS = from_env_or_from_var(int, "TAG_WORKERS", TAG_WORKERS)
+        self.READ_EMBEDDED_TAGS = from_env_or_from_var(
+            str_to_bool, "READ_EMBEDDED_TAGS", READ_EMBEDDED_TAGS
+        )
+        self.S3_ENDPOINT_URL = from_env_or_from_var(
+            str, "S3_ENDPOINT_URL", S3_ENDPOINT_URL
+        )
+        self.S3_PART_SIZE = from_env_or_from_var(int, "S3_PART_SIZE", S3_PART_SIZE)
+        self.S3_UPLOAD_CONCURRENCY = from_env_or_from_var(
+            int, "S3_UPLOAD_CONCURRENCY", S3_UPLOAD_CONCURRENCY
+        )
+        self.S3_FILE_CONCURRENCY = from_env_or_from_var(
+            int, "S3_FILE_CONCURRENCY", S3_FILE_CONCURRENCY
+        )
+        self.S3_VERIFY_ETAG = from_env_or_from_var(
+            str_to_bool, "S3_VERIFY_ETAG", S3_VERIFY_ETAG
+        )
+        self.INCREMENTAL_SCAN = from_env_or_from_var(
+            str_to_bool, "INCREMENTAL_SCAN", INCREMENTAL_SCAN
+        )
+        self.CUE_SPLIT_CACHE_MAX_BYTES = from_env_or_from_var(
+            int, "CUE_SPLIT_CACHE_MAX_BYTES", CUE_SPLIT_CACHE_MAX_BYTES
+        )
+        self.CUE_SPLIT_WORKERS = from_env_or_from_var(
+            int, "CUE_SPLIT_WORKERS", CUE_SPLIT_WORKERS
+        )
+        self.CUE_IMPORT_MODE = from_env_or_from_var(
+            CueImportMode, "CUE_IMPORT_MODE", CueImportMode(CUE_IMPORT_MODE)
+        )
+        self.METRICS_FILE = from_env_or_from_var(Path, "METRICS_FILE", METRICS_FILE)
 
     def db_uri(self):
         return f"sqlite:///{self.DB_FILE}"
@@ -1,6 +1,62 @@
+from enum import StrEnum
+
 SUPPORTED_MUSIC_EXTENSIONS = [".flac", ".mp3", ".wav"]
 ALL_MUSIC_EXTENSIONS = [".flac", ".mp3", ".wav"]
 
 MAX_GUESS_ATTEMPTS = 25
 
 MINIMUM_MATCHING_ALBUM_SCORE = 81
+
+# candidates whose search result title is less similar than this to the
+# album's are not worth fetching
+MINIMUM_CANDIDATE_TITLE_SIMILARITY = 50
+# releases in these formats only, without an audio one, have nothing to match
+VIDEO_FORMATS = {
+    "DVD",
+    "DVDr",
+    "Blu-ray",
+    "Blu-ray-R",
+    "HD DVD",
+    "VHS",
+    "Betamax",
+    "Laserdisc",
+    "VCD",
+    "UMD",
+}
+AUDIO_FORMATS = {
+    "Vinyl",
+    "CD",
+    "CDr",
+    "SACD",
+    "Cassette",
+    "File",
+    "Shellac",
+    "Minidisc",
+    "DAT",
+    "Reel-To-Reel",
+    "Flexi-disc",
+    "Lathe Cut",
+    "8-Track Cartridge",
+    "DVD-Audio",
+}
+
+
+class PlacementStrategy(StrEnum):
+    copy = "copy"
+    hardlink = "hardlink"
+    # copy-on-write clone, on filesystems that support it (btrfs, xfs...)
+    reflink = "reflink"
+    move = "move"
+
+
+class CueImportMode(StrEnum):
+    # one file per track, cut from the album image
+    split = "split"
+    # songs point at their range of the album image, nothing is written
+    virtual = "virtual"
+
+
+class SearchTermKind(StrEnum):
+    album = "album"
+    artist = "artist"
+    song = "song"
@@ -1,17 +1,38 @@
+import uuid
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Callable, Iterable, List, MutableMapping, NewType
 
-from sqlalchemy import MetaData, create_engine, select, types
+from loguru import logger
+from sqlalchemy import (
+    MetaData,
+    bindparam,
+    create_engine,
+    delete,
+    event,
+    inspect,
+    or_,
+    select,
+    text,
+    types,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as OrmSession
 from sqlalchemy.orm import registry, sessionmaker
-from sqlalchemy.sql.schema import Column, Table
-from sqlalchemy.sql.sqltypes import Integer, String
+from sqlalchemy.sql.schema import Column, Index, Table
+from sqlalchemy.sql.sqltypes import Float, Integer, String
 
 from mptreasury.core.config import Config
+from mptreasury.core.constants import SearchTermKind
+from mptreasury.util.metrics import metrics
+from mptreasury.util.trigrams import trigrams
 from app.model import Album, Song
 
 
 class PathType(types.TypeDecorator):
     impl = String
+    cache_ok = True
 
     def process_bind_param(self, value: Path, dialect) -> Any:
         if value is None:
@@ -24,6 +45,10 @@ class PathType(types.TypeDecorator):
         return Path(value)
 
 
+# a session that lives as long as an injection scope, e.g. one import job;
+# the sessionmaker itself is injected as sqlalchemy's Session
+DbSession = NewType("DbSession", OrmSession)
+
 mapper_registry = registry()
 songs_table = Table(
     "songs",
@@ -34,6 +59,11 @@ songs_table = Table(
     Column("remote_path", PathType, nullable=True),
     Column("album_name", String, index=True),
     Column("artist_name", String),
+    # range of a cue track in its album image, in cue frames; see RawSong
+    Column("track_start", Integer, nullable=False, default=0, server_default="0"),
+    Column("track_end", Integer, nullable=True),
+    Column("album_id", Integer, nullable=True, index=True),
+    Column("content_hash", String, nullable=True, index=True),
 )
 
 albums_table = Table(
@@ -50,6 +80,83 @@ albums_table = Table(
     Column("master_provider_id", Integer),
 )
 
+# songs that made it to remote storage, so that interrupted uploads can resume
+uploads_table = Table(
+    "uploads",
+    mapper_registry.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("local_path", PathType, nullable=False),
+    Column("bucket", String, nullable=False),
+    Column("remote_path", PathType, nullable=False),
+    Column("size", Integer, nullable=False),
+    Column("mtime", Float, nullable=False),
+    Column("etag", String),
+    Column("uploaded_at", Float, nullable=False),
+)
+Index(
+    "ux_uploads_bucket_local_path",
+    uploads_table.c.bucket,
+    uploads_table.c.local_path,
+    unique=True,
+)
+
+# what source folders looked like when they were last imported,
+# so that incremental scans can skip the ones that haven't changed
+folder_fingerprints_table = Table(
+    "folder_fingerprints",
+    mapper_registry.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("path", PathType, nullable=False, unique=True),
+    Column("fingerprint", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("scanned_at", Float, nullable=False),
+)
+
+# names of albums, artists and songs, and the trigrams of every name, for
+# typo tolerant search; an artist's ref_id is its provider id, like albums.artist_id
+search_terms_table = Table(
+    "search_terms",
+    mapper_registry.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("kind", String, nullable=False),
+    Column("ref_id", Integer, nullable=False),
+    Column("text", String, nullable=False),
+)
+Index(
+    "ux_search_terms_kind_ref_id",
+    search_terms_table.c.kind,
+    search_terms_table.c.ref_id,
+    unique=True,
+)
+trigrams_table = Table(
+    "trigrams",
+    mapper_registry.metadata,
+    Column("gram", String, primary_key=True),
+    Column("kind", String, primary_key=True),
+    Column("term_id", Integer, primary_key=True),
+    # the primary key is the table, so looking a gram up reads its terms in order
+    sqlite_with_rowid=False,
+)
+Index("ix_trigrams_term_id", trigrams_table.c.term_id)
+
+# dedup keys for imports; these are also the conflict targets of the upserts below
+Index("ux_albums_master_provider_id", albums_table.c.master_provider_id, unique=True)
+# releases that aren't part of any master are only the same as themselves
+Index(
+    "ux_albums_masterless_provider_id",
+    albums_table.c.provider_id,
+    unique=True,
+    sqlite_where=albums_table.c.master_provider_id.is_(None),
+)
+Index(
+    "ux_songs_local_path_track_start",
+    songs_table.c.local_path,
+    songs_table.c.track_start,
+    unique=True,
+)
+# replaced by the ones above, removed from existing dbs
+_DROPPED_INDEXES = ["ux_songs_local_path"]
+
 mapper_registry.map_imperatively(Album, albums_table)
 mapper_registry.map_imperatively(Song, songs_table)
 master_engine = None
@@ -61,35 +168,641 @@ def get_sessionmaker(config: Config):
     if not master_engine:
         # TODO: config option for echo
         master_engine = create_engine(config.db_uri(), echo=False)
+        _configure_sqlite(config)
     # TODO: I should remove the expire_on_commit arg and create function
     # that converts an sqlalchemy object instance to a model instance
     maker = sessionmaker(master_engine, expire_on_commit=False)
     return maker
 
 
+def _configure_sqlite(config: Config):
+    @event.listens_for(master_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size={int(config.SQLITE_CACHE_SIZE)}")
+        cursor.close()
+
+
 def create_tables():
     global master_engine
     if master_engine is None:
         raise ValueError("There was no engine initialized")
     mapper_registry.metadata.create_all(master_engine)
     MetaData().create_all(master_engine)
+    _add_missing_columns(master_engine)
+    with master_engine.begin() as conn:
+        for index_name in _DROPPED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+    # create_all skips tables that already exist, along with their indexes
+    for table in (albums_table, songs_table, uploads_table, search_terms_table):
+        for index in table.indexes:
+            try:
+                index.create(master_engine, checkfirst=True)
+            except IntegrityError as e:
+                raise ValueError(
+                    f"Cannot create unique index {index.name}: "
+                    "the db already holds duplicates that must be cleaned up first"
+                ) from e
+    _create_songs_fts(master_engine)
+    _backfill_search_terms(master_engine)
+
+
+# full-text index over songs; the rowid is the song's id. Imports index their
+# songs in bulk (see _index_songs), updates and deletes are followed by triggers.
+# Songs from before album_id existed get their genre by album name
+_SONG_GENRE = (
+    "COALESCE((SELECT genre FROM albums WHERE albums.id = {song}.album_id), "
+    "(SELECT genre FROM albums WHERE albums.name = {song}.album_name "
+    "AND albums.artist_name = {song}.artist_name LIMIT 1))"
+)
+_SONGS_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5("
+    "title, album_name, artist_name, genre, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    # a trigger per inserted row made import writes more than twice as slow
+    "DROP TRIGGER IF EXISTS songs_fts_insert",
+    # replaced, in case it's the one that also fired on remote_path updates
+    "DROP TRIGGER IF EXISTS songs_fts_update",
+    "CREATE TRIGGER songs_fts_update "
+    "AFTER UPDATE OF title, album_name, artist_name, album_id ON songs BEGIN "
+    "DELETE FROM songs_fts WHERE rowid = old.id; "
+    "INSERT INTO songs_fts (rowid, title, album_name, artist_name, genre) VALUES "
+    f"(new.id, new.title, new.album_name, new.artist_name, {_SONG_GENRE.format(song='new')}); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN "
+    "DELETE FROM songs_fts WHERE rowid = old.id; "
+    "END",
+]
+
+
+def _create_songs_fts(engine):
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'songs_fts'")
+        ).first()
+        for statement in _SONGS_FTS_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            # songs added before the index existed
+            conn.execute(
+                text(
+                    "INSERT INTO songs_fts (rowid, title, album_name, artist_name, genre) "
+                    "SELECT id, title, album_name, artist_name, "
+                    f"{_SONG_GENRE.format(song='songs')} FROM songs"
+                )
+            )
+
+
+def _backfill_search_terms(engine):
+    """Index the albums and songs added before there was a search index"""
+    with engine.begin() as conn:
+        if conn.execute(select(search_terms_table.c.id).limit(1)).first():
+            return
+        albums = conn.execute(
+            select(
+                albums_table.c.id,
+                albums_table.c.name,
+                albums_table.c.artist_id,
+                albums_table.c.artist_name,
+            )
+        ).all()
+        songs = conn.execute(select(songs_table.c.id, songs_table.c.title)).all()
+        if not albums and not songs:
+            return
+        logger.info("Indexing {} albums and {} songs for search", len(albums), len(songs))
+        terms = [(SearchTermKind.song, id, title) for id, title in songs]
+        for id, name, artist_id, artist_name in albums:
+            terms.append((SearchTermKind.album, id, name))
+            terms.append((SearchTermKind.artist, artist_id, artist_name))
+        index_search_terms(conn, terms)
+
+
+def index_search_terms(conn, terms: Iterable[tuple[SearchTermKind, int | None, str | None]]):
+    """Add or replace the (kind, ref_id, text) search terms, trigrams included.
+    Terms whose text hasn't changed are left alone, so only new and renamed
+    ones cost any writes. conn is a connection or session, whose transaction
+    it becomes part of"""
+    unique = {
+        (kind, ref_id): text for kind, ref_id, text in terms if ref_id is not None and text
+    }
+    if not unique:
+        return
+    existing = _existing_search_terms(conn, unique)
+    renamed = {
+        key: text
+        for key, text in unique.items()
+        if key in existing and existing[key][1] != text
+    }
+    new = {key: text for key, text in unique.items() if key not in existing}
+    renamed_ids = [existing[key][0] for key in renamed]
+    if renamed:
+        conn.execute(
+            update(search_terms_table)
+            .where(search_terms_table.c.id == bindparam("term_id"))
+            .values(text=bindparam("new_text")),
+            [
+                dict(term_id=term_id, new_text=text)
+                for term_id, text in zip(renamed_ids, renamed.values())
+            ],
+        )
+        # renamed terms must not be found by their old trigrams
+        for start in range(0, len(renamed_ids), _MAX_BOUND_PARAMETERS):
+            chunk = renamed_ids[start : start + _MAX_BOUND_PARAMETERS]
+            conn.execute(delete(trigrams_table).where(trigrams_table.c.term_id.in_(chunk)))
+    new_ids: List[int] = []
+    if new:
+        # RETURNING ids in order would take a statement per row; reading
+        # them back takes one per chunk
+        conn.execute(
+            insert(search_terms_table),
+            [dict(kind=kind, ref_id=ref_id, text=text) for (kind, ref_id), text in new.items()],
+        )
+        inserted = _existing_search_terms(conn, new)
+        new_ids = [inserted[key][0] for key in new]
+    gram_rows = [
+        (gram, str(kind), term_id)
+        for ((kind, _), text), term_id in zip(
+            [*renamed.items(), *new.items()], [*renamed_ids, *new_ids]
+        )
+        for gram in trigrams(text)
+    ]
+    if gram_rows:
+        # tens of thousands of rows for a big import: straight to the driver,
+        # without per-row parameter processing
+        if isinstance(conn, OrmSession):
+            conn = conn.connection()
+        conn.exec_driver_sql(
+            "INSERT INTO trigrams (gram, kind, term_id) VALUES (?, ?, ?)", gram_rows
+        )
+
+
+def _existing_search_terms(
+    conn, keys: Iterable[tuple[SearchTermKind, int]]
+) -> dict[tuple[SearchTermKind, int], tuple[int, str]]:
+    """Ids and texts of the terms that are already indexed, by (kind, ref_id)"""
+    ref_ids_by_kind: dict[SearchTermKind, List[int]] = {}
+    for kind, ref_id in keys:
+        ref_ids_by_kind.setdefault(kind, []).append(ref_id)
+    existing = {}
+    for kind, ref_ids in ref_ids_by_kind.items():
+        for start in range(0, len(ref_ids), _MAX_BOUND_PARAMETERS):
+            rows = conn.execute(
+                select(
+                    search_terms_table.c.id,
+                    search_terms_table.c.ref_id,
+                    search_terms_table.c.text,
+                ).where(
+                    search_terms_table.c.kind == kind,
+                    search_terms_table.c.ref_id.in_(
+                        ref_ids[start : start + _MAX_BOUND_PARAMETERS]
+                    ),
+                )
+            )
+            existing.update(((kind, ref_id), (id, text)) for id, ref_id, text in rows)
+    return existing
+
+
+def _add_missing_columns(engine):
+    """create_all doesn't touch tables that already exist,
+    so columns added since a db was created are added here"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in mapper_registry.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                definition = f"{column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    default = column.server_default.arg  # type: ignore
+                    definition += f" NOT NULL DEFAULT {default}"
+                logger.info("Adding column {}.{}", table.name, column.name)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+
+
+# well under sqlite's limit on the parameters of a statement
+_MAX_BOUND_PARAMETERS = 30_000
+
+
+def album_key(album: Album) -> tuple[str, int]:
+    """What makes an album the same as another: its master, or for a release
+    without one, the release itself"""
+    if album.master_provider_id is not None:
+        return ("master", album.master_provider_id)
+    return ("release", album.provider_id)
 
 
 def get_album_id(album: Album, Session) -> int | None:
     with Session(future=True) as session:
-        existing_album = session.execute(
-            select(Album).filter_by(master_provider_id=album.master_provider_id)
-        ).first()
-        if existing_album:
-            return existing_album[0]
-        else:
-            return None
+        return _album_ids_by_key(session, [album_key(album)]).get(album_key(album))
+
+
+def get_existing_master_ids(master_ids: Iterable[int], Session) -> set[int]:
+    """Which of the given master ids are already in the library, in one query"""
+    master_ids = {master_id for master_id in master_ids if master_id is not None}
+    if not master_ids:
+        return set()
+    with Session() as session:
+        return _album_ids_by_master(session, master_ids).keys() & master_ids
+
+
+def _album_ids_by_master(session, master_ids: Iterable[int]) -> dict[int, int]:
+    rows = session.execute(
+        select(albums_table.c.master_provider_id, albums_table.c.id).where(
+            albums_table.c.master_provider_id.in_(list(master_ids))
+        )
+    )
+    return {master_id: album_id for master_id, album_id in rows}
+
+
+def _album_ids_by_key(
+    session, keys: Iterable[tuple[str, int]]
+) -> dict[tuple[str, int], int]:
+    keys = set(keys)
+    master_ids = [id for kind, id in keys if kind == "master"]
+    ids = {
+        ("master", master_id): album_id
+        for master_id, album_id in _album_ids_by_master(session, master_ids).items()
+    }
+    if release_ids := [id for kind, id in keys if kind == "release"]:
+        rows = session.execute(
+            select(albums_table.c.provider_id, albums_table.c.id).where(
+                albums_table.c.master_provider_id.is_(None),
+                albums_table.c.provider_id.in_(release_ids),
+            )
+        )
+        ids.update((("release", release_id), album_id) for release_id, album_id in rows)
+    return ids
+
+
+def _upsert_albums(session, albums: List[Album]) -> List[int]:
+    """Insert the albums, giving back their ids, or the ids of the rows that
+    another writer may have added for them in the meantime; the no-op update
+    makes RETURNING give back those"""
+    albums_insert = insert(albums_table)
+    if albums[0].master_provider_id is not None:
+        upsert = albums_insert.on_conflict_do_update(
+            index_elements=[albums_table.c.master_provider_id],
+            set_=dict(master_provider_id=albums_insert.excluded.master_provider_id),
+        )
+    else:
+        upsert = albums_insert.on_conflict_do_update(
+            index_elements=[albums_table.c.provider_id],
+            index_where=albums_table.c.master_provider_id.is_(None),
+            set_=dict(provider_id=albums_insert.excluded.provider_id),
+        )
+    return session.scalars(
+        upsert.returning(albums_table.c.id, sort_by_parameter_order=True),
+        [_without_id(album_row(album)) for album in albums],
+    ).all()
+
+
+def album_row(album: Album) -> dict:
+    return {column.name: getattr(album, column.name) for column in albums_table.c}
+
+
+def song_row(song: Song) -> dict:
+    return {
+        column.name: getattr(song, column.name, None) for column in songs_table.c
+    }
+
+
+def _without_id(row: dict) -> dict:
+    return {key: value for key, value in row.items() if key != "id"}
+
+
+def add_albums_and_songs(
+    entries: List[tuple[Album, List[Song]]], Session, session: OrmSession | None = None
+):
+    """Write many albums and their songs in a single transaction,
+    with one bulk upsert per table. Albums whose master is already in the
+    library are not written again, and neither are their songs.
+    Written with `session` when given, else with a session of its own."""
+    if not entries:
+        return
+    if session is None:
+        with Session() as session:
+            _add_albums_and_songs(entries, session)
+        return
+    try:
+        _add_albums_and_songs(entries, session)
+    except Exception:
+        # the session outlives this write, so it must be usable again
+        session.rollback()
+        raise
+
+
+def _add_albums_and_songs(entries: List[tuple[Album, List[Song]]], session: OrmSession):
+    with metrics.span("db_write"):
+        existing = _album_ids_by_key(session, [album_key(album) for album, _ in entries])
+        new_entries: List[tuple[Album, List[Song]]] = []
+        firsts: dict[tuple[str, int], Album] = {}
+        # albums whose master comes up earlier in the batch, with that album
+        duplicates: List[tuple[Album, Album]] = []
+        for album, songs in entries:
+            if album_key(album) in existing:
+                album.id = existing[album_key(album)]
+                logger.info("Album {} already in db with id: {}", album.name, album.id)
+                continue
+            if album_key(album) in firsts:
+                duplicates.append((album, firsts[album_key(album)]))
+                logger.info("Album {} is already part of this batch", album.name)
+                continue
+            firsts[album_key(album)] = album
+            new_entries.append((album, songs))
+        if not new_entries:
+            return
+        # the two kinds of albums are deduplicated by different indexes
+        new_entries.sort(key=lambda entry: entry[0].master_provider_id is None)
+        album_ids: List[int] = []
+        for has_master in (True, False):
+            albums = [
+                album
+                for album, _ in new_entries
+                if (album.master_provider_id is not None) == has_master
+            ]
+            if albums:
+                album_ids.extend(_upsert_albums(session, albums))
+        songs: List[Song] = []
+        for (album, album_songs), album_id in zip(new_entries, album_ids):
+            album.id = album_id
+            for song in album_songs:
+                song.album_id = album_id
+            songs.extend(album_songs)
+        for album, first in duplicates:
+            album.id = first.id
+        if songs:
+            songs_insert = insert(songs_table)
+            song_ids = session.scalars(
+                songs_insert.on_conflict_do_update(
+                    index_elements=[songs_table.c.local_path, songs_table.c.track_start],
+                    set_=dict(
+                        title=songs_insert.excluded.title,
+                        album_name=songs_insert.excluded.album_name,
+                        artist_name=songs_insert.excluded.artist_name,
+                        album_id=songs_insert.excluded.album_id,
+                    ),
+                ).returning(songs_table.c.id, sort_by_parameter_order=True),
+                [_without_id(song_row(song)) for song in songs],
+            ).all()
+            for song, song_id in zip(songs, song_ids):
+                song.id = song_id
+            _index_songs(session, song_ids)
+        index_search_terms(session, _search_terms(new_entries))
+        session.commit()
+        metrics.increment("albums_written", len(new_entries))
+        metrics.increment("songs_written", len(songs))
+
+
+def _index_songs(session, song_ids: List[int]):
+    """Add the songs that aren't in the full-text index yet, in one statement
+    per chunk; songs that were updated instead are there already, by trigger"""
+    # every id is bound twice
+    chunk_size = _MAX_BOUND_PARAMETERS // 2
+    for start in range(0, len(song_ids), chunk_size):
+        chunk = song_ids[start : start + chunk_size]
+        session.execute(
+            text(
+                "INSERT INTO songs_fts (rowid, title, album_name, artist_name, genre) "
+                "SELECT id, title, album_name, artist_name, "
+                f"{_SONG_GENRE.format(song='songs')} FROM songs "
+                "WHERE id IN :ids AND id NOT IN "
+                "(SELECT rowid FROM songs_fts WHERE rowid IN :ids)"
+            ).bindparams(bindparam("ids", expanding=True)),
+            dict(ids=chunk),
+        )
+
+
+def _search_terms(entries: List[tuple[Album, List[Song]]]) -> list[tuple]:
+    terms = []
+    for album, songs in entries:
+        terms.append((SearchTermKind.album, album.id, album.name))
+        terms.append((SearchTermKind.artist, album.artist_id, album.artist_name))
+        terms.extend((SearchTermKind.song, song.id, song.title) for song in songs)
+    return terms
 
 
 def add_album_and_songs(album: Album, songs: List[Song], Session):
+    add_albums_and_songs([(album, songs)], Session)
+
+
+class ImportBatch:
+    """Albums and songs of an import run, waiting to be written together.
+    Written once `batch_size` albums are pending, and on flush()"""
+
+    def __init__(
+        self,
+        Session,
+        batch_size: int,
+        on_flush: Callable[[List[Album]], None] | None = None,
+        session: OrmSession | None = None,
+        claims: MutableMapping[tuple[str, int], str] | None = None,
+    ) -> None:
+        self._Session = Session
+        # the import job's own session, when it has one
+        self._session = session
+        # album keys taken by the run's albums, before their files are placed;
+        # shared by the batches of the worker processes of a run
+        self._claims = claims if claims is not None else {}
+        self.batch_size = batch_size
+        self._on_flush = on_flush
+        self.pending: List[tuple[Album, List[Song]]] = []
+        self._pending_keys: set[tuple[str, int]] = set()
+        self.written = 0
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def has_album(self, album: Album) -> bool:
+        return album_key(album) in self._pending_keys
+
+    def claim(self, album: Album) -> bool:
+        """Take the album's key for this run, unless another of the run's
+        albums has taken it already"""
+        token = uuid.uuid4().hex
+        # a single call, so that it's atomic even when the claims are shared
+        return self._claims.setdefault(album_key(album), token) == token
+
+    def release(self, album: Album):
+        """Give back the key of a claimed album that won't be added after all"""
+        self._claims.pop(album_key(album), None)
+
+    def add(self, album: Album, songs: List[Song]):
+        self.pending.append((album, songs))
+        self._pending_keys.add(album_key(album))
+        if self.batch_size > 0 and len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> List[Album]:
+        if not self.pending:
+            return []
+        pending = self.pending
+        logger.info("Writing {} albums to the db", len(pending))
+        add_albums_and_songs(pending, self._Session, self._session)
+        self.pending = []
+        self._pending_keys = set()
+        self.written += len(pending)
+        albums = [album for album, _ in pending]
+        if self._on_flush:
+            self._on_flush(albums)
+        return albums
+
+    def rows(self) -> List[tuple[dict, List[dict]]]:
+        """The pending albums and songs as plain dicts, for handing them
+        over to another process"""
+        return [
+            (album_row(album), [song_row(song) for song in songs])
+            for album, songs in self.pending
+        ]
+
+    def add_rows(self, rows: List[tuple[dict, List[dict]]]):
+        for album_dict, song_dicts in rows:
+            album = Album(**album_dict)
+            songs = [Song(**song_dict, album=album) for song_dict in song_dicts]
+            self.add(album, songs)
+
+
+def get_albums_with_songs(
+    album_ids: Iterable[int] | None, Session
+) -> List[tuple[Album | None, List[Song]]]:
+    """Albums and their songs, all of them by default. Songs that were added
+    before they were linked to their album come last, without one"""
+    with Session() as session:
+        albums_query = select(Album)
+        songs_query = select(Song)
+        if album_ids is not None:
+            album_ids = list(album_ids)
+            albums_query = albums_query.where(albums_table.c.id.in_(album_ids))
+            songs_query = songs_query.where(songs_table.c.album_id.in_(album_ids))
+        albums = {album.id: album for album in session.scalars(albums_query)}
+        songs_by_album: dict[int | None, List[Song]] = {}
+        for song in session.scalars(songs_query.order_by(songs_table.c.id)):
+            album_id = song.album_id if song.album_id in albums else None
+            songs_by_album.setdefault(album_id, []).append(song)
+    entries: List[tuple[Album | None, List[Song]]] = [
+        (albums[album_id], songs)
+        for album_id, songs in songs_by_album.items()
+        if album_id is not None
+    ]
+    if None in songs_by_album:
+        entries.append((None, songs_by_album[None]))
+    return entries
+
+
+def get_library_files(content_hashes: Iterable[str], Session) -> dict[str, Path]:
+    """A library file with each of the contents that are already in it"""
+    content_hashes = list(content_hashes)
+    files: dict[str, Path] = {}
+    with Session() as session:
+        for start in range(0, len(content_hashes), _MAX_BOUND_PARAMETERS):
+            chunk = content_hashes[start : start + _MAX_BOUND_PARAMETERS]
+            rows = session.execute(
+                select(songs_table.c.content_hash, songs_table.c.local_path).where(
+                    songs_table.c.content_hash.in_(chunk)
+                )
+            )
+            files.update((content_hash, path) for content_hash, path in rows)
+    return files
+
+
+def set_content_hashes(hashes: dict[Path, str], Session):
+    """Store the new content hash of the songs of each file"""
+    with Session() as session:
+        for local_path, content_hash in hashes.items():
+            session.execute(
+                update(songs_table)
+                .where(songs_table.c.local_path == local_path)
+                .values(content_hash=content_hash)
+            )
+        session.commit()
+
+
+def get_uploads(bucket: str, Session) -> dict[Path, dict]:
+    """Ledger of completed uploads to the bucket, by local path"""
+    with Session() as session:
+        rows = session.execute(
+            select(uploads_table).where(uploads_table.c.bucket == bucket)
+        ).mappings()
+        return {row["local_path"]: dict(row) for row in rows}
+
+
+def record_upload(songs: List[Song], upload: dict, Session):
+    """Add the upload of the songs' file to the ledger
+    and store the songs' remote path"""
+    with Session() as session:
+        statement = insert(uploads_table)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[uploads_table.c.bucket, uploads_table.c.local_path],
+                set_={
+                    key: statement.excluded[key]
+                    for key in ("remote_path", "size", "mtime", "etag", "uploaded_at")
+                },
+            ),
+            upload,
+        )
+        _update_remote_path(songs, upload["remote_path"], session)
+        session.commit()
+
+
+def record_remote_path(songs: List[Song], remote_path: Path, Session):
+    """Store the remote path of songs whose file is already uploaded"""
+    if all(song.id is None for song in songs):
+        return
+    with Session() as session:
+        _update_remote_path(songs, remote_path, session)
+        session.commit()
+
+
+def _update_remote_path(songs: List[Song], remote_path: Path, session: OrmSession):
+    song_ids = [song.id for song in songs if song.id is not None]
+    if song_ids:
+        session.execute(
+            update(songs_table)
+            .where(songs_table.c.id.in_(song_ids))
+            .values(remote_path=remote_path)
+        )
+
+
+def get_songs_to_upload(Session) -> List[Song]:
+    with Session() as session:
+        return list(
+            session.execute(select(Song).where(songs_table.c.remote_path.is_(None)))
+            .scalars()
+            .all()
+        )
+
+
+def get_folder_fingerprints(root: Path, Session) -> dict[Path, str]:
+    """Fingerprints of root and every folder recorded under it, in one query"""
+    path_column = folder_fingerprints_table.c.path
+    with Session() as session:
+        rows = session.execute(
+            select(path_column, folder_fingerprints_table.c.fingerprint).where(
+                or_(
+                    path_column == root,
+                    path_column.startswith(f"{root}/", autoescape=True),
+                )
+            )
+        )
+        return {path: fingerprint for path, fingerprint in rows}
+
+
+def save_folder_fingerprints(rows: List[dict], Session):
+    if not rows:
+        return
     with Session() as session:
-        session.add(album)
-        for song in songs:
-            session.add(song)
+        statement = insert(folder_fingerprints_table)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[folder_fingerprints_table.c.path],
+                set_={
+                    key: statement.excluded[key]
+                    for key in ("fingerprint", "status", "scanned_at")
+                },
+            ),
+            rows,
+        )
         session.commit()
-        session.flush()
@@ -0,0 +1,67 @@
+"""Wire format shared by the server and the client.
+
+Every message is a single JSON object on its own line. Requests carry an
+optional "id" that is echoed back in every message answering them, so a
+client can pipeline several requests on one connection and tell the
+answers apart. Answers have a "type":
+- "result": the answer to the request
+- "event": a progress event of a job the request follows
+- "error": the request could not be handled
+"""
+import asyncio
+import json
+
+# also the limit of the stream readers on both sides
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+
+class ProtocolError(Exception):
+    ...
+
+
+def encode_message(message: dict) -> bytes:
+    return json.dumps(message).encode("utf8") + b"\n"
+
+
+def decode_message(line: bytes) -> dict:
+    try:
+        message = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ProtocolError(f"Invalid JSON: {e}")
+    if not isinstance(message, dict):
+        raise ProtocolError("Messages must be JSON objects")
+    return message
+
+
+async def _discard_line(
+    reader: asyncio.StreamReader, error: asyncio.LimitOverrunError
+):
+    """Skip the rest of a line that's longer than the reader's limit,
+    up to and including its newline"""
+    while True:
+        await reader.readexactly(error.consumed)
+        try:
+            await reader.readuntil(b"\n")
+            return
+        except asyncio.LimitOverrunError as e:
+            error = e
+        except asyncio.IncompleteReadError:
+            return
+
+
+async def read_message(reader: asyncio.StreamReader) -> dict | None:
+    """Next message from the stream, or None when the other side is done"""
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            # the last line, if it wasn't terminated
+            line = e.partial
+        except asyncio.LimitOverrunError as e:
+            # the whole oversized line is dropped, so the stream stays usable
+            await _discard_line(reader, e)
+            raise ProtocolError(f"Message is larger than {MAX_MESSAGE_SIZE} bytes")
+        if not line:
+            return None
+        if line.strip():
+            return decode_message(line)
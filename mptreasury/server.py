@@ -1,54 +1,210 @@
 import asyncio
-import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Awaitable, Callable
 
 from loguru import logger
 
+import mptreasury.services.fuzzy_search_service
 import mptreasury.services.import_service
+import mptreasury.services.query_service
+import mptreasury.services.tag_service
+import mptreasury.services.upload_service
 from mptreasury.core.bootstrap import bootstrap
+from mptreasury.core.config import Config
+from mptreasury.protocol import (
+    MAX_MESSAGE_SIZE,
+    ProtocolError,
+    encode_message,
+    read_message,
+)
+from mptreasury.services.job_service import (
+    Job,
+    JobQueue,
+    QueueFullError,
+    UnknownJobError,
+)
+from mptreasury.util.injection import Injected, injectable_sync, injection_scope
+from mptreasury.util.metrics import metrics
 
 SOCKET_PATH = "/tmp/my_socket"
 
+job_queue: JobQueue | None = None
 
-def parse_request(request: str) -> dict | None:
+# requests that query the db or the disk, served on a thread so that a slow
+# one doesn't hold up the event loop, and with it every other client
+BLOCKING_REQUESTS = {"sync_tags", "upload_library", "query_songs", "fuzzy_search"}
+
+
+@injectable_sync
+def run_import_job(job: Job, *, config: Config = Injected) -> list[dict]:
+    # scoped dependencies, like the db session, are shared by the whole job
+    try:
+        with injection_scope():
+            imported = mptreasury.services.import_service.import_folder(
+                job.music_path, job, incremental=job.incremental
+            )
+    finally:
+        if config.METRICS_FILE is not None:
+            metrics.write_prometheus_file(config.METRICS_FILE)
+    return mptreasury.services.import_service.describe_import(
+        imported, job.music_path
+    )
+
+
+def handle_request(request_body: dict) -> dict:
+    if job_queue is None:
+        raise ValueError("Job queue was not started")
+    try:
+        match request_body.get("name"):
+            case "import_folder":
+                job = job_queue.submit(
+                    Path(request_body["music_path"]), request_body.get("incremental")
+                )
+            case "job_status" | "follow_job":
+                job = job_queue.get(request_body["job_id"])
+            case "cancel_job":
+                job = job_queue.cancel(request_body["job_id"])
+            case "list_jobs":
+                return dict(type="result", jobs=[job.to_dict() for job in job_queue.jobs()])
+            case "stats":
+                return dict(type="result", **metrics.snapshot())
+            case "fuzzy_search":
+                matches = mptreasury.services.fuzzy_search_service.fuzzy_search(
+                    str(request_body["query"]),
+                    request_body.get("kinds"),
+                    int(
+                        request_body.get(
+                            "limit", mptreasury.services.fuzzy_search_service.DEFAULT_LIMIT
+                        )
+                    ),
+                )
+                return dict(type="result", matches=matches)
+            case "sync_tags":
+                return dict(
+                    type="result",
+                    **mptreasury.services.tag_service.sync_tags(
+                        request_body.get("album_ids")
+                    ),
+                )
+            case "upload_library":
+                return dict(
+                    type="result",
+                    **mptreasury.services.upload_service.upload_library(),
+                )
+            case "query_songs":
+                return dict(
+                    type="result",
+                    **mptreasury.services.query_service.query_songs(
+                        str(request_body["query"]),
+                        int(request_body.get("page", 0)),
+                        int(
+                            request_body.get(
+                                "page_size",
+                                mptreasury.services.query_service.DEFAULT_PAGE_SIZE,
+                            )
+                        ),
+                    ),
+                )
+            case name:
+                return dict(type="error", error=f"Unknown request {name}")
+    except (QueueFullError, UnknownJobError, KeyError) as e:
+        return dict(type="error", error=str(e))
+    return dict(type="result", **job.to_dict())
+
+
+def wants_events(request_body: dict) -> bool:
+    match request_body.get("name"):
+        case "follow_job":
+            return True
+        case "import_folder":
+            return bool(request_body.get("follow", False))
+    return False
+
+
+async def serve_request(request_body: dict, send: Callable[[dict], Awaitable[None]]):
+    request_id = request_body.get("id")
     try:
-        request_body = json.loads(request)
-    except json.JSONDecodeError as e:
-        logger.info("Failed to parse request '{}': {}", request, e)
-        return None
-    return request_body
+        if request_body.get("name") in BLOCKING_REQUESTS:
+            response = await asyncio.to_thread(handle_request, request_body)
+        else:
+            response = handle_request(request_body)
+    except Exception as e:
+        # whatever went wrong, the client is waiting for an answer to this id
+        logger.exception("Failed to serve request {}", request_id)
+        response = dict(type="error", error=f"{type(e).__name__}: {e}")
+    await send(dict(id=request_id, **response))
+    if response["type"] != "result" or not wants_events(request_body):
+        return
+    if job_queue is None:
+        return
+    job = job_queue.get(response["job_id"])
+    events = job.subscribe()
+    try:
+        while (event := await events.get()) is not None:
+            await send(dict(id=request_id, type="event", **event))
+    finally:
+        job.unsubscribe(events)
+    await send(dict(id=request_id, type="result", **job.to_dict()))
 
 
 async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    write_lock = asyncio.Lock()
+    requests: set[asyncio.Task] = set()
+
+    async def send(message: dict):
+        # requests are served concurrently, but their messages must not interleave
+        async with write_lock:
+            writer.write(encode_message(message))
+            await writer.drain()
+
     try:
-        request: str | None = None
-        while request != "quit":
-            # TODO: handle messages larger than 255 bytes
-            request = (await reader.read(255)).decode("utf8")
-            if reader.at_eof():
+        while True:
+            try:
+                request_body = await read_message(reader)
+            except ProtocolError as e:
+                logger.info("Bad request: {}", e)
+                await send(dict(id=None, type="error", error=str(e)))
+                continue
+            if request_body is None or request_body.get("name") == "quit":
                 logger.info("bye client")
                 break
-            if not (request_body := parse_request(request)):
-                continue
-            match request_body["name"]:
-                case "import_folder":
-                    mptreasury.services.import_service.import_folder(
-                        Path(request_body["music_path"])
-                    )
-            response = "some response"
-            writer.write(response.encode("utf8"))
-            await writer.drain()
+            task = asyncio.create_task(serve_request(request_body, send))
+            requests.add(task)
+            task.add_done_callback(requests.discard)
+        # answer everything that was asked before the client hung up
+        await asyncio.gather(*requests, return_exceptions=True)
     except Exception as e:
         logger.info("Something wonky happened: {}", e)
     finally:
+        for task in requests:
+            task.cancel()
         writer.close()
 
 
 async def run_server():
-    bootstrap()
-    server = await asyncio.start_unix_server(handle_client, SOCKET_PATH)
-    async with server:
-        await server.serve_forever()
+    global job_queue
+    config = Config()
+    bootstrap(config)
+    executor = ThreadPoolExecutor(max_workers=config.JOB_WORKERS)
+    job_queue = JobQueue(
+        run_import_job,
+        executor,
+        workers=config.JOB_WORKERS,
+        max_queued=config.JOB_QUEUE_SIZE,
+        max_finished=config.JOB_HISTORY_SIZE,
+    )
+    job_queue.start()
+    server = await asyncio.start_unix_server(
+        handle_client, SOCKET_PATH, limit=MAX_MESSAGE_SIZE
+    )
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await job_queue.close()
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
-asyncio.run(run_server())
+if __name__ == "__main__":
+    asyncio.run(run_server())
@@ -0,0 +1,77 @@
+"""Typo tolerant lookup of albums, artists and songs.
+
+Terms that share the most trigrams with the query are read from the trigram
+index, and only those get scored with rapidfuzz, instead of every name in
+the library.
+"""
+from typing import Iterable
+
+from rapidfuzz import fuzz, process
+from sqlalchemy import desc, func, select
+from sqlalchemy.orm import Session
+
+from mptreasury.core import db
+from mptreasury.core.constants import SearchTermKind
+from mptreasury.util.injection import Injected, injectable_sync
+from mptreasury.util.trigrams import normalize, trigrams
+
+DEFAULT_LIMIT = 20
+# how many of the terms sharing the most trigrams with the query get scored
+CANDIDATES = 200
+MINIMUM_SCORE = 60
+
+
+def candidate_terms(session, query: str, kinds: list[SearchTermKind], candidates: int):
+    grams = trigrams(query)
+    if not grams:
+        return []
+    shared = (
+        select(
+            db.trigrams_table.c.term_id, func.count().label("shared_grams")
+        )
+        .where(
+            db.trigrams_table.c.gram.in_(grams),
+            db.trigrams_table.c.kind.in_(kinds),
+        )
+        .group_by(db.trigrams_table.c.term_id)
+        .order_by(desc("shared_grams"))
+        .limit(candidates)
+        .subquery()
+    )
+    terms = db.search_terms_table
+    return session.execute(
+        select(terms.c.kind, terms.c.ref_id, terms.c.text).join(
+            shared, shared.c.term_id == terms.c.id
+        )
+    ).all()
+
+
+@injectable_sync
+def fuzzy_search(
+    query: str,
+    kinds: Iterable[SearchTermKind] | None = None,
+    limit: int = DEFAULT_LIMIT,
+    *,
+    Session: Session = Injected,
+) -> list[dict]:
+    """Best matches of the query among the names of the given kinds, all by default"""
+    kinds = [SearchTermKind(kind) for kind in kinds] if kinds else list(SearchTermKind)
+    with Session() as session:  # type: ignore
+        candidates = candidate_terms(session, query, kinds, CANDIDATES)
+    matches = process.extract(
+        query,
+        [text for _, _, text in candidates],
+        scorer=fuzz.WRatio,
+        processor=normalize,
+        limit=limit,
+        score_cutoff=MINIMUM_SCORE,
+    )
+    return [
+        dict(
+            kind=candidates[index].kind,
+            id=candidates[index].ref_id,
+            name=candidates[index].text,
+            score=round(score, 1),
+        )
+        for _, score, index in matches
+    ]
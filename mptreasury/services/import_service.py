@@ -1,20 +1,41 @@
+import contextlib
+import copy
+import functools
+import multiprocessing
 import os
-import shutil
 import typing
-import unicodedata
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
 from enum import StrEnum
 from pathlib import Path
 
 from discogs_client import models as discogs_models
-from fuzzywuzzy import fuzz  # type: ignore
+from discogs_client.exceptions import HTTPError
 from loguru import logger
+from rapidfuzz import fuzz
 from sqlalchemy.orm import Session
 
 from app.model import Album, CueParser, RawAlbum, Song
 from mptreasury.adapters.discogs_adapter import Searcher
+from mptreasury.adapters.embedded_tags import AlbumTags, read_album_tags
 from mptreasury.core import constants, db
+from mptreasury.core.constants import PlacementStrategy
 from mptreasury.core.config import Config
+from mptreasury.services.job_service import ImportCancelledError, Job
+from mptreasury.services.placement_service import hash_songs, place_songs
+from mptreasury.services.scan_service import FolderScan
 from mptreasury.util.injection import Injected, injectable_sync
+from mptreasury.util.metrics import metrics
+from mptreasury.util.track_matching import (  # noqa: F401
+    MatchTriplet,
+    match_tracks as fuzzy_match_tracks,
+    score_fuzzy_match_triplet,
+)
+from mptreasury.util.trigrams import normalize
 
 
 class FolderType(StrEnum):
@@ -22,6 +43,19 @@ class FolderType(StrEnum):
     artist_folder = "artist_folder"
 
 
+class AlbumImportStatus(StrEnum):
+    imported = "imported"
+    no_match = "no_match"
+    failed = "failed"
+    # skipped by an incremental scan
+    unchanged = "unchanged"
+
+
+# folders in these states are not imported again until they change;
+# failed ones are retried on every scan
+SETTLED_STATUSES = (AlbumImportStatus.imported, AlbumImportStatus.no_match)
+
+
 def determine_folder_type(path: Path) -> FolderType:
     subdirs = 0
     music_files = 0
@@ -43,65 +77,28 @@ def determine_folder_type(path: Path) -> FolderType:
         return FolderType.artist_folder
 
 
-def copy_songs_to_music_folder(songs: list[Song], library_folder: Path):
-    for song in songs:
-        target_folder_name = os.path.join(
-            library_folder, song.artist_name, song.album_name
-        )
-        normalized_target_folder_name = (
-            unicodedata.normalize("NFKD", target_folder_name)
-            .encode("ascii", "ignore")
-            .decode()
-        )
-        target_folder_path = Path(normalized_target_folder_name)
-        normalized_song_file_name = (
-            unicodedata.normalize("NFKD", f"{song.title}{song.local_path.suffix}")
-            .encode("ascii", "ignore")
-            .decode()
-        )
-
-        if not target_folder_path.exists():
-            os.makedirs(target_folder_path)
-        target_path = target_folder_path / normalized_song_file_name
-        shutil.copy(song.local_path, target_path)
-        song.local_path = target_path
-
-
-# TODO: this is quite the convoluted piece of logic. do some renames and add a dataclass for these triplets maybe?
-def fuzzy_match_tracks(actual_tracks: list[str], potential_matches: list[str]):
-    # Triplets of actual track, potential match, matching score
-    # Could this be dog 🤔
-
-    # create a copy of the list so that we can change it safely
-    actual_tracks = actual_tracks.copy()
-    triplets: list[tuple[str, str, int]] = []
-    for potential_match in potential_matches:
-        if len(actual_tracks) == 0:
-            break
-        scores = [
-            fuzz.partial_ratio(potential_match, actual_track)
-            for actual_track in actual_tracks
-        ]
-        index_max = max(range(len(scores)), key=scores.__getitem__)
-        triplets.append((actual_tracks[index_max], potential_match, scores[index_max]))
-        del actual_tracks[index_max]
-    score = score_fuzzy_match_triplet(
-        triplets, len(actual_tracks), len(potential_matches)
-    )
-    return triplets, score
-
-
-def score_fuzzy_match_triplet(
-    triplets: list[tuple[str, str, int]],
-    no_of_actual_tracks: int,
-    no_of_potential_tracks: int,
+def copy_songs_to_music_folder(
+    songs: list[Song],
+    library_folder: Path,
+    strategy: PlacementStrategy = PlacementStrategy.copy,
+    workers: int = 1,
+    verify: bool = False,
+    dedup: bool = False,
+    session: Session | None = None,
 ):
-    score_sum = sum([triplet[2] for triplet in triplets])
-    score_mean = score_sum / len(triplets)
-    score_mean = score_mean * (1 - 0.2 * no_of_actual_tracks)
-    potential_tracks_diff = no_of_potential_tracks - len(triplets)
-    score_mean = score_mean * (1 - 0.2 * potential_tracks_diff)
-    return score_mean
+    """With dedup, the songs are hashed first, and the ones whose content is
+    already in the library (when a session is given to look it up), or that
+    are the same as another one of the songs, are linked rather than copied"""
+    library_files = None
+    if dedup:
+        with metrics.span("content_hash"):
+            hash_songs(songs, workers)
+        if session is not None:
+            library_files = db.get_library_files(
+                {song.content_hash for song in songs if song.content_hash}, session
+            )
+    linked = place_songs(songs, library_folder, strategy, workers, verify, library_files)
+    metrics.increment("songs_deduplicated", linked)
 
 
 @injectable_sync
@@ -109,11 +106,19 @@ def load_discogs_album_into_raw_album(
     album_res: discogs_models.Release,
     raw_album: RawAlbum,
     match_triplets: typing.Any,
+    job: Job | None = None,
+    batch: db.ImportBatch | None = None,
+    known_master_ids: set[int] | None = None,
     *,
     session: Session = Injected,
     config: Config = Injected,
 ):
+    """Build the album and its songs, and add them to the library. When a batch
+    is given, the db write is left to it. known_master_ids, when given, are the
+    masters already looked up as being in the library, which saves a query"""
     new_songs: list[Song] = []
+    # plenty of releases aren't part of any master
+    master = album_res.master
     new_album = Album(
         name=str(album_res.title),
         genre=album_res.genres[0],  # type: ignore
@@ -121,8 +126,8 @@ def load_discogs_album_into_raw_album(
         artist_id=album_res.artists[0].id,  # type: ignore # type: ignore
         artist_name=album_res.artists[0].name,  # type: ignore
         provider_id=album_res.id,  # type: ignore
-        master_name=album_res.master.title,  # type: ignore
-        master_provider_id=album_res.master.id,  # type: ignore
+        master_name=master.title if master is not None else None,  # type: ignore
+        master_provider_id=master.id if master is not None else None,  # type: ignore
     )
     logger.info("Loading songs from {}", raw_album.songs[0].path.parent)
     for actual_track, potential_track, _ in match_triplets:
@@ -135,74 +140,647 @@ def load_discogs_album_into_raw_album(
             album_name=album_res.title,  # type: ignore
             artist_name=album_res.artists[0].name,  # type: ignore
             album=new_album,
+            track_start=raw_song.track_start,
+            track_end=raw_song.track_end,
         )
         new_songs.append(new_song)
-    if not (id := db.get_album_id(new_album, session)):
-        logger.info("Adding songs for {} to library", new_album.name)
-        copy_songs_to_music_folder(new_songs, config.LIBRARY_DIR)
-        db.add_album_and_songs(new_album, new_songs, session)
+    # claimed before its files are placed, since with worker processes
+    # the same master could otherwise be placed by two of them
+    if batch is not None and not batch.claim(new_album):
+        logger.info("Album {} is already part of this import", new_album.name)
+        return new_album, new_songs
+    if known_master_ids is not None and new_album.master_provider_id is not None:
+        already_in_library = new_album.master_provider_id in known_master_ids
+    else:
+        already_in_library = db.get_album_id(new_album, session) is not None
+    if already_in_library:
+        logger.info("Album {} already in db", new_album.name)
+        _report(job, "committed", album=new_album.name, already_in_library=True)
     else:
-        logger.info("Album {} already in db with id: {}", new_album.name, id)
+        logger.info("Adding songs for {} to library", new_album.name)
+        try:
+            with metrics.span("placement"):
+                copy_songs_to_music_folder(
+                    new_songs,
+                    config.LIBRARY_DIR,
+                    config.PLACEMENT_STRATEGY,
+                    config.PLACEMENT_WORKERS,
+                    config.PLACEMENT_VERIFY,
+                    config.PLACEMENT_DEDUP,
+                    session,
+                )
+        except Exception:
+            # so that another folder of the same master still gets its chance
+            if batch is not None:
+                batch.release(new_album)
+            raise
+        metrics.increment("songs_placed", len(new_songs))
+        _report(job, "copied", album=new_album.name, songs=len(new_songs))
+        if batch is not None:
+            batch.add(new_album, new_songs)
+        else:
+            db.add_album_and_songs(new_album, new_songs, session)
+            _report(job, "committed", album=new_album.name, album_id=new_album.id)
     return new_album, new_songs
 
 
+class CandidateMatch:
+    def __init__(
+        self,
+        index: int,
+        album_res: discogs_models.Release,
+        discogs_tracks: list[str],
+        triplets: list[MatchTriplet],
+        score: float,
+    ) -> None:
+        self.index = index
+        self.album_res = album_res
+        self.discogs_tracks = discogs_tracks
+        self.triplets = triplets
+        self.score = score
+
+    @property
+    def accepted(self) -> bool:
+        return self.score >= constants.MINIMUM_MATCHING_ALBUM_SCORE
+
+
+def score_candidate(
+    index: int, album_res: discogs_models.Release, raw_tracks: list[str]
+) -> CandidateMatch:
+    # accessing the tracklist is what fetches the full release
+    with metrics.span("candidate_fetch"):
+        discogs_tracks = [track.title for track in album_res.tracklist if track.fetch("type_") == "track"]  # type: ignore
+    metrics.increment("candidates_fetched")
+    discogs_tracks.sort()
+    with metrics.span("matching"):
+        match_triplets, overall_score = fuzzy_match_tracks(raw_tracks, discogs_tracks)
+    match = CandidateMatch(
+        index, album_res, discogs_tracks, match_triplets, overall_score
+    )
+    if not match.accepted:
+        logger.info("Rejected candidate {}: {} by {} - {} with score {}", index, album_res.title, album_res.artists[0].name, album_res.id, overall_score)  # type: ignore
+    return match
+
+
+def prescore_candidate(
+    album_res: discogs_models.Release,
+    album_name: str,
+    artist_name: str | None,
+    track_count: int,
+) -> float:
+    """How promising a candidate looks from its search result alone, which
+    comes with the search page, unlike the tracklist: the similarity of its
+    title to the album's, or 0 when its format or track count rule it out.
+    A candidate without search data can't be judged, so it's kept"""
+    data = getattr(album_res, "data", None)
+    if not isinstance(data, dict) or not data.get("title") or not normalize(album_name):
+        return 100.0
+    formats = set(data.get("format") or [])
+    if formats & constants.VIDEO_FORMATS and not formats & constants.AUDIO_FORMATS:
+        return 0.0
+    # the API's results don't say, but the dump index's do
+    if (count := data.get("track_count")) and abs(count - track_count) > max(
+        2, track_count // 2
+    ):
+        return 0.0
+    # API titles are "Artist - Title"; token sets don't mind the artist
+    title = normalize(str(data["title"]))
+    return max(
+        fuzz.token_set_ratio(normalize(album_name), title),
+        fuzz.token_set_ratio(normalize(f"{artist_name or ''} {album_name}"), title),
+    )
+
+
+def rank_candidates(
+    candidates: list[discogs_models.Release],
+    album_name: str,
+    artist_name: str | None,
+    track_count: int,
+) -> tuple[list[discogs_models.Release], int]:
+    """The promising candidates, most promising first, and how many were
+    dropped without being fetched. Ties keep the search's order"""
+    with metrics.span("prescoring"):
+        scored = [
+            (prescore_candidate(album_res, album_name, artist_name, track_count), i)
+            for i, album_res in enumerate(candidates)
+        ]
+    kept = [
+        (score, i)
+        for score, i in scored
+        if score >= constants.MINIMUM_CANDIDATE_TITLE_SIMILARITY
+    ]
+    kept.sort(key=lambda item: -item[0])
+    pruned = len(candidates) - len(kept)
+    if pruned:
+        logger.info(
+            "Dropped {} of {} candidates before fetching them", pruned, len(candidates)
+        )
+    return [candidates[i] for _, i in kept], pruned
+
+
+def find_matching_candidate(
+    raw_tracks: list[str], candidates: list[discogs_models.Release]
+) -> CandidateMatch | None:
+    for i, album_res in enumerate(candidates):
+        match = score_candidate(i, album_res, raw_tracks)
+        if match.accepted:
+            return match
+    return None
+
+
+def find_matching_candidate_concurrently(
+    raw_tracks: list[str], candidates: list[discogs_models.Release], workers: int
+) -> CandidateMatch | None:
+    """Fetch and score candidates on a pool of threads, in search order.
+    To pick the same candidate as find_matching_candidate would, an accepted
+    candidate only wins once every candidate before it has been rejected;
+    candidates after it are dropped as soon as it's accepted."""
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {
+        executor.submit(score_candidate, i, album_res, raw_tracks): i
+        for i, album_res in enumerate(candidates)
+    }
+    pending = set(futures.values())
+    best: CandidateMatch | None = None
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            pending.discard(index)
+            if future.cancelled():
+                # dropped after a candidate before it was accepted
+                continue
+            match = future.result()
+            if match.accepted and (best is None or match.index < best.index):
+                best = match
+                for other_future, other_index in futures.items():
+                    if other_index > best.index and other_future.cancel():
+                        pending.discard(other_index)
+            if best is not None and not any(i < best.index for i in pending):
+                break
+    finally:
+        # fetches that are already running can't be interrupted, but we don't
+        # need to wait for them either
+        executor.shutdown(wait=False, cancel_futures=True)
+    return best
+
+
+def use_embedded_tags(raw_album: RawAlbum, tags: AlbumTags):
+    """Prefer what the files' tags say to what was guessed from the folder and
+    file names, when they say enough: the album, its artist and every title"""
+    raw_album.release_id = tags.release_id
+    if not tags.complete_for([song.path for song in raw_album.songs]):
+        return
+    raw_album.name = tags.album  # type: ignore
+    raw_album.artist_name = tags.artist  # type: ignore
+    for song in raw_album.songs:
+        song.title = tags.titles[song.path]
+        song.album_name = raw_album.name
+        song.artist_name = raw_album.artist_name
+
+
+def match_tagged_release(
+    release_id: int, raw_tracks: list[str], searcher: Searcher
+) -> CandidateMatch | None:
+    """The release the files are tagged with, if it matches them;
+    a release that doesn't exist (anymore) doesn't match"""
+    try:
+        with metrics.span("release_lookup"):
+            match = score_candidate(0, searcher.release(release_id), raw_tracks)
+    except HTTPError as e:
+        logger.info("Cannot get tagged release {}: {}", release_id, e)
+        return None
+    metrics.increment("tagged_releases_matched" if match.accepted else "tagged_releases_rejected")
+    return match if match.accepted else None
+
+
+def _search_master_id(album_res: discogs_models.Release) -> int | None:
+    data = getattr(album_res, "data", None)
+    if not isinstance(data, dict):
+        return None
+    return data.get("master_id") or None
+
+
+def _log_cache_stats(searcher: Searcher):
+    if (cache_stats := searcher.cache_stats()) is not None:
+        logger.info("Discogs cache stats: {}", cache_stats)
+
+
+class AlbumImportResult:
+    """Outcome of importing one album folder. Kept to plain values,
+    since it travels back from worker processes"""
+
+    def __init__(
+        self,
+        music_path: Path,
+        status: AlbumImportStatus,
+        album_name: str | None = None,
+        artist_name: str | None = None,
+        provider_id: int | None = None,
+        songs_count: int = 0,
+        error: str | None = None,
+        pending_rows: list[tuple[dict, list[dict]]] | None = None,
+        metrics: dict | None = None,
+    ) -> None:
+        self.music_path = music_path
+        self.status = status
+        self.album_name = album_name
+        self.artist_name = artist_name
+        self.provider_id = provider_id
+        self.songs_count = songs_count
+        self.error = error
+        # albums and songs a worker process imported but left for the parent to write
+        self.pending_rows = pending_rows or []
+        # what a worker process recorded while importing the album
+        self.metrics = metrics
+
+    def __repr__(self) -> str:
+        return f"AlbumImportResult({self.music_path}, {self.status})"
+
+    def to_dict(self) -> dict:
+        return dict(
+            music_path=str(self.music_path),
+            status=str(self.status),
+            album_name=self.album_name,
+            artist_name=self.artist_name,
+            provider_id=self.provider_id,
+            songs_count=self.songs_count,
+            error=self.error,
+        )
+
+
+def describe_import(
+    imported: tuple[Album, list[Song]] | list[AlbumImportResult] | None,
+    music_path: Path,
+) -> list[dict]:
+    """JSON-friendly summary of whatever import_folder returned"""
+    if imported is None:
+        return [AlbumImportResult(music_path, AlbumImportStatus.no_match).to_dict()]
+    if isinstance(imported, list):
+        return [result.to_dict() for result in imported]
+    album, songs = imported
+    return [
+        AlbumImportResult(
+            music_path,
+            AlbumImportStatus.imported,
+            album_name=album.name,
+            artist_name=album.artist_name,
+            provider_id=album.provider_id,
+            songs_count=len(songs),
+        ).to_dict()
+    ]
+
+
+def _report_committed(job: Job | None, albums: list[Album]):
+    for album in albums:
+        _report(job, "committed", album=album.name, album_id=album.id)
+
+
+def _check_cancelled(job: Job | None):
+    if job is not None:
+        job.check_cancelled()
+
+
+def _report(job: Job | None, stage: str, **details):
+    if job is not None:
+        job.report(stage, **details)
+
+
+@injectable_sync
+def import_raw_album(
+    raw_album: RawAlbum,
+    job: Job | None = None,
+    batch: db.ImportBatch | None = None,
+    *,
+    config: Config = Injected,
+    searcher: Searcher = Injected,
+    Session: Session = Injected,
+) -> tuple[Album, list[Song]] | None:
+    raw_tracks = [track.title for track in raw_album.songs]
+    raw_tracks.sort()
+    logger.info(
+        "Trying to import {} by {} from {}",
+        raw_album.name,
+        raw_album.artist_name,
+        raw_album.music_path,
+    )
+    candidate: CandidateMatch | None = None
+    pruned = 0
+    if raw_album.release_id is not None:
+        # the tags tell which release it is, no need to search for it
+        candidate = match_tagged_release(raw_album.release_id, raw_tracks, searcher)
+    if candidate is not None:
+        candidates = [candidate.album_res]
+    else:
+        logger.info(
+            "Searching for album {} from {}", raw_album.name, raw_album.artist_name
+        )
+        with metrics.span("search"):
+            search = searcher.search(
+                album_name=raw_album.name,
+                artist_name=raw_album.artist_name,
+            )
+            candidates = search.next_page()[: constants.MAX_GUESS_ATTEMPTS]
+        if config.CANDIDATE_PRESCORING:
+            candidates, pruned = rank_candidates(
+                candidates, raw_album.name, raw_album.artist_name, len(raw_tracks)
+            )
+            metrics.increment("candidate_fetches_avoided", pruned)
+    _report(
+        job, "searched", album=raw_album.name, candidates=len(candidates), pruned=pruned
+    )
+    # search results already carry the master id, so one query tells which
+    # candidates are in the library before any of them is fetched
+    candidate_masters = [_search_master_id(album_res) for album_res in candidates]
+    known_master_ids: set[int] | None = None
+    if all(master_id is not None for master_id in candidate_masters):
+        known_master_ids = db.get_existing_master_ids(candidate_masters, Session)
+    if candidate is None:
+        if config.CANDIDATE_PREFETCH_WORKERS > 1:
+            candidate = find_matching_candidate_concurrently(
+                raw_tracks, candidates, config.CANDIDATE_PREFETCH_WORKERS
+            )
+        else:
+            candidate = find_matching_candidate(raw_tracks, candidates)
+    if not candidate:
+        _report(job, "matched", album=raw_album.name, accepted=False)
+        return None
+    album_res = candidate.album_res
+    logger.info("Accepted candidate {}: {} by {} - {} with score {}", candidate.index, album_res.title, album_res.artists[0].name, album_res.id, candidate.score)  # type: ignore
+    logger.info(
+        "Attempting to import tracks: {}",
+        raw_tracks,
+    )
+    logger.info("Accepted candidate tracks: {}", candidate.discogs_tracks)
+    _report(
+        job,
+        "matched",
+        album=raw_album.name,
+        accepted=True,
+        provider_id=album_res.id,  # type: ignore
+        score=candidate.score,
+    )
+    _check_cancelled(job)
+    return load_discogs_album_into_raw_album(
+        album_res=album_res,
+        raw_album=raw_album,
+        match_triplets=candidate.triplets,
+        job=job,
+        batch=batch,
+        known_master_ids=known_master_ids,
+        session=Session,
+    )
+
+
+@injectable_sync
+def import_album_folder(
+    album_path: Path,
+    job: Job | None = None,
+    batch: db.ImportBatch | None = None,
+    tag_reader: Executor | None = None,
+    *,
+    config: Config = Injected,
+) -> AlbumImportResult:
+    """Import a single album folder, turning any failure into a result.
+    Its files' tags are read on tag_reader, if given, and one by one otherwise"""
+    try:
+        with metrics.span("raw_album"):
+            raw_album = RawAlbum(album_path, cue_parser=CueParser(config))
+        paths = [song.path for song in raw_album.songs]
+        # tracks of a cue image share it, and their tags are in the cue sheet
+        if config.READ_EMBEDDED_TAGS and len(set(paths)) == len(paths):
+            with metrics.span("embedded_tags"):
+                use_embedded_tags(raw_album, read_album_tags(paths, tag_reader))
+        imported = import_raw_album(raw_album, job, batch)
+    except ImportCancelledError:
+        raise
+    except Exception as e:
+        logger.exception("Failed to import {}", album_path)
+        return AlbumImportResult(album_path, AlbumImportStatus.failed, error=str(e))
+    if not imported:
+        logger.info("No matching condidate was worthy for {}", album_path)
+        return AlbumImportResult(
+            album_path,
+            AlbumImportStatus.no_match,
+            album_name=raw_album.name,
+            artist_name=raw_album.artist_name,
+        )
+    album, songs = imported
+    return AlbumImportResult(
+        album_path,
+        AlbumImportStatus.imported,
+        album_name=album.name,
+        artist_name=album.artist_name,
+        provider_id=album.provider_id,
+        songs_count=len(songs),
+    )
+
+
+def _tag_reader(config: Config) -> contextlib.AbstractContextManager[Executor | None]:
+    """The threads that read the tags of all of an import's albums, if they're
+    to be read on more than one thread"""
+    if config.READ_EMBEDDED_TAGS and config.TAG_WORKERS > 1:
+        return ThreadPoolExecutor(max_workers=config.TAG_WORKERS)
+    return contextlib.nullcontext()
+
+
+# album keys claimed by the albums of the run, shared with the other workers
+_album_claims: typing.MutableMapping[tuple[str, int], str] | None = None
+
+
+def _init_import_worker(
+    config: Config, workers: int, claims: typing.MutableMapping[tuple[str, int], str]
+):
+    # worker processes are spawned, so they start with nothing injected
+    from mptreasury.core.bootstrap import bootstrap
+
+    global _album_claims
+    _album_claims = claims
+
+    # each worker has a limiter of its own, so they split the Discogs budget
+    config = copy.copy(config)
+    config.DISCOGS_REQUESTS_PER_MINUTE = max(
+        1, config.DISCOGS_REQUESTS_PER_MINUTE // workers
+    )
+    config.DISCOGS_MAX_CONCURRENCY = max(1, config.DISCOGS_MAX_CONCURRENCY // workers)
+    bootstrap(config)
+
+
+@injectable_sync
+def _import_album_folder_in_worker(
+    album_path: Path, *, Session: Session = Injected
+) -> AlbumImportResult:
+    # the parent writes everything to the db, so that there is a single writer
+    batch = db.ImportBatch(Session, batch_size=0, claims=_album_claims)
+    result = import_album_folder(album_path, batch=batch)
+    result.pending_rows = batch.rows()
+    result.metrics = metrics.drain()
+    return result
+
+
+@injectable_sync
+def import_artist_folder(
+    music_path: Path,
+    workers: int,
+    job: Job | None = None,
+    incremental: bool = False,
+    *,
+    config: Config = Injected,
+    Session: Session = Injected,
+    db_session: db.DbSession = Injected,
+) -> list[AlbumImportResult]:
+    """Import every album of an artist folder. With more than one worker,
+    albums are imported on a pool of processes: cue splitting, searching,
+    matching and copying happen in the workers, and db writes in here.
+    Either way, db writes are batched, with the session of the injection
+    scope, i.e. of the import job. When incremental, album folders that
+    haven't changed since they were last imported are skipped."""
+    album_paths = sorted(
+        music_path / res for res in os.listdir(music_path) if (music_path / res).is_dir()
+    )
+    results: list[AlbumImportResult] = []
+    scan: FolderScan | None = None
+    if incremental:
+        scan = FolderScan(music_path, Session)
+        changed = scan.changed(album_paths)
+        results.extend(
+            AlbumImportResult(album_path, AlbumImportStatus.unchanged)
+            for album_path in sorted(set(album_paths) - set(changed))
+        )
+        album_paths = changed
+        metrics.increment("albums_unchanged", len(results))
+    _report(
+        job,
+        "scanned",
+        folder_type="artist_folder",
+        albums=len(album_paths),
+        unchanged=len(results),
+    )
+
+    batch = db.ImportBatch(
+        Session,
+        config.DB_BATCH_SIZE,
+        on_flush=functools.partial(_report_committed, job),
+        session=db_session,
+    )
+    try:
+        if workers > 1:
+            # already parallel: the workers read their albums' tags one by one
+            _import_albums_in_processes(
+                album_paths, workers, batch, results, job, config
+            )
+        else:
+            with _tag_reader(config) as tag_reader:
+                for album_path in album_paths:
+                    _check_cancelled(job)
+                    result = import_album_folder(album_path, job, batch, tag_reader)
+                    metrics.increment(f"albums_{result.status}")
+                    _report(job, "album_done", **result.to_dict())
+                    results.append(result)
+    finally:
+        # whatever was imported before a cancellation or a crash still gets written
+        batch.flush()
+        if scan is not None:
+            scan.record(
+                {
+                    result.music_path: str(result.status)
+                    for result in results
+                    if result.status in SETTLED_STATUSES
+                }
+            )
+    results.sort(key=lambda result: result.music_path)
+    return results
+
+
+def _import_albums_in_processes(
+    album_paths: list[Path],
+    workers: int,
+    batch: db.ImportBatch,
+    results: list[AlbumImportResult],
+    job: Job | None,
+    config: Config,
+):
+    # spawn rather than fork: the parent holds an sqlite engine and
+    # the discogs cache connection, which must not be shared with children
+    context = multiprocessing.get_context("spawn")
+    # workers claim their albums' masters before placing any files, so that
+    # only one of them places an album that's in the folder twice
+    with context.Manager() as manager, ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_import_worker,
+        initargs=(config, workers, manager.dict()),
+    ) as executor:
+        futures = {
+            executor.submit(_import_album_folder_in_worker, album_path): album_path
+            for album_path in album_paths
+        }
+        for future in as_completed(futures):
+            if job is not None and job.cancel_event.is_set():
+                executor.shutdown(wait=False, cancel_futures=True)
+                _check_cancelled(job)
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker itself died, e.g. during bootstrap
+                result = AlbumImportResult(
+                    futures[future], AlbumImportStatus.failed, error=str(e)
+                )
+            logger.info("Imported {}: {}", result.music_path, result.status)
+            if result.metrics is not None:
+                metrics.merge(result.metrics)
+                result.metrics = None
+            metrics.increment(f"albums_{result.status}")
+            batch.add_rows(result.pending_rows)
+            result.pending_rows = []
+            _report(job, "album_done", **result.to_dict())
+            results.append(result)
+
+
 @injectable_sync
 def import_folder(
     music_path: Path,
+    job: Job | None = None,
+    incremental: bool | None = None,
     *,
     config: Config = Injected,
     searcher: Searcher = Injected,
     Session: Session = Injected,
+    db_session: db.DbSession = Injected,
 ):
     music_path = music_path.expanduser()
+    if incremental is None:
+        incremental = config.INCREMENTAL_SCAN
     logger.info("Gonna look up in {}", music_path)
-    folder_type = determine_folder_type(music_path)
+    with metrics.span("classify"):
+        folder_type = determine_folder_type(music_path)
     match folder_type:
         case FolderType.album_folder:
-            raw_albums = [RawAlbum(music_path, cue_parser=CueParser(config))]
+            scan = FolderScan(music_path, Session) if incremental else None
+            if scan is not None and not scan.changed([music_path]):
+                _report(job, "scanned", folder_type=str(folder_type), albums=0)
+                metrics.increment("albums_unchanged")
+                return [AlbumImportResult(music_path, AlbumImportStatus.unchanged)]
+            _report(job, "scanned", folder_type=str(folder_type), albums=1)
+            # the same way as an album of an artist folder, embedded tags included
+            batch = db.ImportBatch(
+                Session,
+                batch_size=0,
+                on_flush=functools.partial(_report_committed, job),
+                session=db_session,
+            )
+            try:
+                with _tag_reader(config) as tag_reader:
+                    result = import_album_folder(music_path, job, batch, tag_reader)
+            finally:
+                batch.flush()
+            metrics.increment(f"albums_{result.status}")
+            _report(job, "album_done", **result.to_dict())
+            if scan is not None and result.status in SETTLED_STATUSES:
+                scan.record({music_path: str(result.status)})
+            imported = [result]
         case FolderType.artist_folder:
-            raw_albums = []
-            for res in os.listdir(music_path):
-                album_path = music_path / res
-                raw_albums.append(RawAlbum(album_path, cue_parser=CueParser(config)))
-
-    for raw_album in raw_albums:
-        raw_tracks = [track.title for track in raw_album.songs]
-        raw_tracks.sort()
-        logger.info(
-            "Trying to import {} by {} from {}",
-            raw_album.name,
-            raw_album.artist_name,
-            raw_album.music_path,
-        )
-        logger.info(
-            "Searching for album {} from {}", raw_album.name, raw_album.artist_name
-        )
-        search = searcher.search(
-            album_name=raw_album.name,
-            artist_name=raw_album.artist_name,
-        )
-        candidates = search.next_page()
-        for i, album_res in zip(range(constants.MAX_GUESS_ATTEMPTS), candidates):
-            discogs_tracks = [track.title for track in album_res.tracklist if track.fetch("type_") == "track"]  # type: ignore
-            discogs_tracks.sort()
-            match_triplets, overall_score = fuzzy_match_tracks(
-                raw_tracks, discogs_tracks
+            imported = import_artist_folder(
+                music_path, config.IMPORT_WORKERS, job, incremental
             )
-            if overall_score >= constants.MINIMUM_MATCHING_ALBUM_SCORE:
-                logger.info("Accepted candidate {}: {} by {} - {} with score {}", i, album_res.title, album_res.artists[0].name, album_res.id, overall_score)  # type: ignore
-                logger.info(
-                    "Attempting to import tracks: {}",
-                    raw_tracks,
-                )
-                logger.info("Accepted candidate tracks: {}", discogs_tracks)
-                album, songs = load_discogs_album_into_raw_album(
-                    album_res=album_res,
-                    raw_album=raw_album,
-                    match_triplets=match_triplets,
-                    session=Session,
-                )
-                return album, songs
-            else:
-                logger.info("Rejected candidate {}: {} by {} - {} with score {}", i, album_res.title, album_res.artists[0].name, album_res.id, overall_score)  # type: ignore
-        logger.info("No matching condidate was worthy. Exiting")
+    _log_cache_stats(searcher)
+    return imported
@@ -0,0 +1,214 @@
+import asyncio
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Executor
+from enum import StrEnum
+from pathlib import Path
+from typing import Any, Callable
+
+from loguru import logger
+
+# events kept of a finished job, for clients that subscribe late; the last
+# of them says how it finished
+FINISHED_JOB_EVENTS = 50
+
+
+class JobStatus(StrEnum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class QueueFullError(Exception):
+    ...
+
+
+class UnknownJobError(Exception):
+    ...
+
+
+class ImportCancelledError(Exception):
+    ...
+
+
+class Job:
+    def __init__(
+        self,
+        music_path: Path,
+        loop: asyncio.AbstractEventLoop,
+        incremental: bool | None = None,
+    ) -> None:
+        self.id = uuid.uuid4().hex
+        self.music_path = music_path
+        # None leaves it to the INCREMENTAL_SCAN setting
+        self.incremental = incremental
+        self.status = JobStatus.queued
+        self.result: Any = None
+        self.error: str | None = None
+        # checked by the import pipeline between steps; a running import
+        # can't be interrupted halfway through copying an album
+        self.cancel_event = threading.Event()
+        self.events: list[dict] = []
+        self._loop = loop
+        self._subscribers: list[asyncio.Queue[dict | None]] = []
+
+    @property
+    def active(self) -> bool:
+        return self.status in (JobStatus.queued, JobStatus.running)
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise ImportCancelledError("Import was cancelled")
+
+    def report(self, stage: str, **details):
+        """Publish a progress event. Called from executor threads"""
+        event = dict(job_id=self.id, stage=stage, **details)
+        self._loop.call_soon_threadsafe(self._publish, event)
+
+    def subscribe(self) -> "asyncio.Queue[dict | None]":
+        """Queue of the job's events, starting with the ones already published.
+        None is put on the queue once the job is finished"""
+        queue: asyncio.Queue[dict | None] = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        if self.active:
+            self._subscribers.append(queue)
+        else:
+            queue.put_nowait(None)
+        return queue
+
+    def unsubscribe(self, queue: "asyncio.Queue[dict | None]"):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def _publish(self, event: dict | None):
+        if event is not None:
+            self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+        if event is None:
+            self._subscribers = []
+
+    def to_dict(self) -> dict:
+        return dict(
+            job_id=self.id,
+            music_path=str(self.music_path),
+            status=str(self.status),
+            result=self.result,
+            error=self.error,
+        )
+
+
+# runs in an executor worker and returns something JSON-serializable
+JobRunner = Callable[[Job], Any]
+
+
+class JobQueue:
+    """Bounded queue of import jobs, run on an executor so that the event loop
+    stays free for other clients. Submitting a path that already has a queued
+    or running job returns that job instead of creating a new one.
+    Only the last `max_finished` finished jobs are remembered."""
+
+    def __init__(
+        self,
+        run: JobRunner,
+        executor: Executor,
+        workers: int,
+        max_queued: int,
+        max_finished: int = 100,
+    ) -> None:
+        self._run = run
+        self._executor = executor
+        self._workers = workers
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=max_queued)
+        self._jobs: dict[str, Job] = {}
+        self._active_by_path: dict[Path, Job] = {}
+        self._max_finished = max_finished
+        self._finished: deque[Job] = deque()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        for _ in range(self._workers):
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, music_path: Path, incremental: bool | None = None) -> Job:
+        key = music_path.expanduser().resolve()
+        if (existing := self._active_by_path.get(key)) and existing.active:
+            logger.info("Coalescing import of {} into job {}", key, existing.id)
+            return existing
+        job = Job(key, asyncio.get_running_loop(), incremental)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(
+                f"Import queue is full ({self._queue.maxsize} jobs), try again later"
+            )
+        self._jobs[job.id] = job
+        self._active_by_path[key] = job
+        logger.info("Queued job {} for {}", job.id, key)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        try:
+            return self._jobs[job_id]
+        except KeyError:
+            raise UnknownJobError(f"No job with id {job_id}")
+
+    def cancel(self, job_id: str) -> Job:
+        job = self.get(job_id)
+        if not job.active:
+            return job
+        job.cancel_event.set()
+        if job.status == JobStatus.queued:
+            # it will be skipped when a worker takes it off the queue
+            self._finish(job, JobStatus.cancelled)
+        return job
+
+    def jobs(self) -> list[Job]:
+        return list(self._jobs.values())
+
+    def _finish(self, job: Job, status: JobStatus):
+        job.status = status
+        if self._active_by_path.get(job.music_path) is job:
+            del self._active_by_path[job.music_path]
+        job._publish(dict(job_id=job.id, stage=str(status)))
+        job._publish(None)
+        # a finished job's events are only replayed to late subscribers
+        del job.events[:-FINISHED_JOB_EVENTS]
+        self._finished.append(job)
+        while len(self._finished) > self._max_finished:
+            forgotten = self._finished.popleft()
+            self._jobs.pop(forgotten.id, None)
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.cancel_event.is_set():
+                    continue
+                job.status = JobStatus.running
+                logger.info("Running job {} for {}", job.id, job.music_path)
+                try:
+                    job.result = await loop.run_in_executor(
+                        self._executor, self._run, job
+                    )
+                except ImportCancelledError:
+                    self._finish(job, JobStatus.cancelled)
+                except Exception as e:
+                    logger.exception("Job {} failed", job.id)
+                    job.error = str(e)
+                    self._finish(job, JobStatus.failed)
+                else:
+                    self._finish(job, JobStatus.done)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,182 @@
+import errno
+import hashlib
+import os
+import shutil
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from loguru import logger
+
+from app.model import Song
+from mptreasury.core.constants import PlacementStrategy
+
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# errors meaning "not possible between these two paths", rather than a real failure
+_FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.EMLINK,
+}
+
+
+class ChecksumMismatchError(Exception):
+    ...
+
+
+def _ascii(value: str) -> str:
+    return unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode()
+
+
+def library_path_for(song: Song, library_folder: Path) -> Path:
+    target_folder_path = Path(
+        _ascii(os.path.join(library_folder, song.artist_name, song.album_name))
+    )
+    if song.is_cue_track:
+        # the album image is placed once, for all of its tracks
+        return target_folder_path / _ascii(song.local_path.name)
+    return target_folder_path / _ascii(f"{song.title}{song.local_path.suffix}")
+
+
+def file_checksum(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(CHECKSUM_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _run(function, items: list, workers: int) -> list:
+    if workers > 1 and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() so that errors from the workers are raised here
+            return list(executor.map(function, items))
+    return [function(item) for item in items]
+
+
+def hash_songs(songs: list[Song], workers: int = 1):
+    """Set the content_hash of the songs that don't have one yet, reading
+    every file once; hashing is mostly reads and hashlib releases the GIL,
+    so threads are enough"""
+    paths = list({song.local_path for song in songs if song.content_hash is None})
+    hashes = dict(zip(paths, _run(file_checksum, paths, workers)))
+    for song in songs:
+        if song.content_hash is None:
+            song.content_hash = hashes[song.local_path]
+
+
+def _reflink(source: Path, target: Path):
+    import fcntl
+
+    with source.open("rb") as src, target.open("wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            target.unlink()
+            raise
+
+
+def _copy(source: Path, target: Path, verify: bool, checksum: str | None = None):
+    shutil.copy(source, target)
+    if verify and (checksum or file_checksum(source)) != file_checksum(target):
+        target.unlink()
+        raise ChecksumMismatchError(f"{target} differs from {source} after copying")
+
+
+def place_file(
+    source: Path,
+    target: Path,
+    strategy: PlacementStrategy,
+    verify: bool = False,
+    checksum: str | None = None,
+) -> PlacementStrategy:
+    """Put source at target, returning the strategy that was actually used:
+    when the requested one isn't possible between the two paths (e.g. they're on
+    different devices), this falls back to copying. Links and same-device moves
+    share the source's data, so only actual copies are verified, against
+    the source's checksum when it's already known."""
+    if target.exists() and target.samefile(source):
+        return strategy
+    if target.exists() and strategy != PlacementStrategy.move:
+        target.unlink()
+    try:
+        match strategy:
+            case PlacementStrategy.hardlink:
+                os.link(source, target)
+                return strategy
+            case PlacementStrategy.reflink:
+                _reflink(source, target)
+                return strategy
+            case PlacementStrategy.move:
+                os.rename(source, target)
+                return strategy
+    except OSError as e:
+        if e.errno not in _FALLBACK_ERRNOS:
+            raise
+        logger.debug("Cannot {} {} to {}: {}; copying", strategy, source, target, e)
+    _copy(source, target, verify, checksum)
+    if strategy == PlacementStrategy.move:
+        source.unlink()
+        return PlacementStrategy.move
+    return PlacementStrategy.copy
+
+
+def place_songs(
+    songs: list[Song],
+    library_folder: Path,
+    strategy: PlacementStrategy = PlacementStrategy.copy,
+    workers: int = 1,
+    verify: bool = False,
+    library_files: dict[str, Path] | None = None,
+) -> int:
+    """Place the songs in the library and point their local_path there.
+    Songs with a content_hash that's in library_files, or that's the same as
+    another song's, are hard linked to that file instead of being copied again
+    (and their own file is removed when moving).
+    Returns how many files were linked that way"""
+    targets = [library_path_for(song, library_folder) for song in songs]
+    for folder in {target.parent for target in targets}:
+        folder.mkdir(parents=True, exist_ok=True)
+
+    known = dict(library_files or {})
+    placements: dict[Path, tuple[Path, str | None]] = {}
+    # placed once the files they're linked to are
+    duplicates: dict[Path, tuple[Path, Path]] = {}
+    for song, target in zip(songs, targets):
+        # cue tracks of the same image share a file
+        if target in placements or target in duplicates:
+            continue
+        same_content = known.get(song.content_hash) if song.content_hash else None
+        if same_content is not None and same_content != target:
+            if same_content in placements or same_content.exists():
+                duplicates[target] = (same_content, song.local_path)
+                continue
+        placements[target] = (song.local_path, song.content_hash)
+        if song.content_hash:
+            known[song.content_hash] = target
+
+    def place(target_and_source: tuple[Path, tuple[Path, str | None]]):
+        target, (source, checksum) = target_and_source
+        place_file(source, target, strategy, verify, checksum)
+
+    def link(target_and_sources: tuple[Path, tuple[Path, Path]]):
+        target, (same_content, source) = target_and_sources
+        logger.debug("{} is already in the library as {}", target, same_content)
+        place_file(same_content, target, PlacementStrategy.hardlink)
+        if strategy == PlacementStrategy.move and not source.samefile(target):
+            source.unlink()
+
+    _run(place, list(placements.items()), workers)
+    _run(link, list(duplicates.items()), workers)
+    for song, target in zip(songs, targets):
+        song.local_path = target
+    return len(duplicates)
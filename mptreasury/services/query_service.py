@@ -0,0 +1,112 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from mptreasury.util.injection import Injected, injectable_sync
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 500
+
+# bm25 reads every match of every term of the query, which stops taking
+# milliseconds when a query matches more songs than this; those are listed
+# newest first instead, songs matching by title before the others
+RANK_LIMIT = 10_000
+
+# bm25 weights of title, album, artist and genre; a hit in the title counts most
+_WEIGHTS = "10.0, 4.0, 4.0, 1.0"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_COLUMNS = (
+    "songs.id, songs.title, songs.album_name, songs.artist_name, "
+    "songs.local_path, songs.remote_path, songs_fts.genre"
+)
+_RANKED_SQL = text(
+    f"SELECT {_COLUMNS}, bm25(songs_fts, {_WEIGHTS}) AS rank "
+    "FROM songs_fts JOIN songs ON songs.id = songs_fts.rowid "
+    "WHERE songs_fts MATCH :match "
+    "ORDER BY rank LIMIT :limit OFFSET :offset"
+)
+_NEWEST_SQL = text(
+    f"SELECT {_COLUMNS}, NULL AS rank "
+    "FROM songs_fts JOIN songs ON songs.id = songs_fts.rowid "
+    "WHERE songs_fts MATCH :match "
+    "ORDER BY songs_fts.rowid DESC LIMIT :limit OFFSET :offset"
+)
+# stops counting at the limit, so it's cheap however broad the query
+_BOUNDED_COUNT_SQL = text(
+    "SELECT count(*) FROM "
+    "(SELECT 1 FROM songs_fts WHERE songs_fts MATCH :match LIMIT :limit)"
+)
+_COUNT_SQL = text("SELECT count(*) FROM songs_fts WHERE songs_fts MATCH :match")
+
+
+def match_expression(query: str) -> str | None:
+    """FTS5 query for user input: every word must appear in some column,
+    and the last one may be the start of a word, as it's likely still being typed.
+    Words are quoted, so FTS5 operators in the input are searched for as text"""
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _newest_first(session, match: str, limit: int, offset: int) -> list:
+    """A page of the title matches, newest first, followed by the other matches"""
+    in_title = f"{{title}} : ({match})"
+    rows = session.execute(
+        _NEWEST_SQL, dict(match=in_title, limit=limit, offset=offset)
+    ).all()
+    if len(rows) == limit:
+        return rows
+    # the page goes past the title matches, so their count is needed after all
+    title_matches = session.execute(_COUNT_SQL, dict(match=in_title)).scalar_one()
+    return rows + session.execute(
+        _NEWEST_SQL,
+        dict(
+            match=f"({match}) NOT {in_title}",
+            limit=limit - len(rows),
+            offset=max(offset - title_matches, 0),
+        ),
+    ).all()
+
+
+@injectable_sync
+def query_songs(
+    query: str,
+    page: int = 0,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    *,
+    Session: Session = Injected,
+) -> dict:
+    """Songs matching the query, best first. Only the page is read from the
+    index, plus one row to tell whether there's a next page"""
+    page = max(page, 0)
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    songs: list[dict] = []
+    ranked = True
+    if (match := match_expression(query)) is not None:
+        limit, offset = page_size + 1, page * page_size
+        with Session() as session:  # type: ignore
+            matches = session.execute(
+                _BOUNDED_COUNT_SQL, dict(match=match, limit=RANK_LIMIT + 1)
+            ).scalar_one()
+            if matches <= RANK_LIMIT:
+                rows = session.execute(
+                    _RANKED_SQL, dict(match=match, limit=limit, offset=offset)
+                ).all()
+            else:
+                ranked = False
+                rows = _newest_first(session, match, limit, offset)
+            songs = [dict(row._mapping) for row in rows]
+    return dict(
+        query=query,
+        page=page,
+        page_size=page_size,
+        ranked=ranked,
+        has_more=len(songs) > page_size,
+        songs=songs[:page_size],
+    )
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from mptreasury.core import db
+
+
+def folder_fingerprint(path: Path) -> str:
+    """Digest of the names, sizes and mtimes of everything in the folder
+    and its subfolders; files are not read"""
+    digest = hashlib.sha1()
+    pending = [path]
+    while pending:
+        folder = pending.pop()
+        with os.scandir(folder) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                stat = entry.stat(follow_symlinks=False)
+                relative = os.path.relpath(entry.path, path)
+                if entry.is_dir(follow_symlinks=False):
+                    digest.update(f"{relative}/\0".encode(errors="surrogateescape"))
+                    pending.append(Path(entry.path))
+                else:
+                    digest.update(
+                        f"{relative}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode(
+                            errors="surrogateescape"
+                        )
+                    )
+    return digest.hexdigest()
+
+
+class FolderScan:
+    """Which folders under a root changed since they were last imported.
+    The recorded fingerprints are loaded in one query, so checking a folder
+    costs one listing of it and a dict lookup"""
+
+    def __init__(self, root: Path, Session) -> None:
+        self.root = root
+        self._Session = Session
+        self._known = db.get_folder_fingerprints(root, Session)
+        self.skipped = 0
+
+    def changed(self, folders: list[Path]) -> list[Path]:
+        changed = []
+        for folder in folders:
+            try:
+                fingerprint = folder_fingerprint(folder)
+            except OSError as e:
+                logger.warning("Cannot fingerprint {}: {}", folder, e)
+                changed.append(folder)
+                continue
+            if self._known.get(folder) == fingerprint:
+                self.skipped += 1
+            else:
+                changed.append(folder)
+        logger.info(
+            "{} of {} folders changed since the last scan", len(changed), len(folders)
+        )
+        return changed
+
+    def record(self, statuses: dict[Path, str]):
+        """Remember the folders as they are now. Fingerprints are taken again,
+        since importing may have changed the folder (e.g. when moving files)"""
+        now = time.time()
+        rows = []
+        for folder, status in statuses.items():
+            try:
+                fingerprint = folder_fingerprint(folder)
+            except OSError as e:
+                logger.warning("Cannot fingerprint {}: {}", folder, e)
+                continue
+            rows.append(
+                dict(path=folder, fingerprint=fingerprint, status=status, scanned_at=now)
+            )
+            self._known[folder] = fingerprint
+        db.save_folder_fingerprints(rows, self._Session)
@@ -0,0 +1,44 @@
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from mptreasury.adapters.tag_writer import TagSync
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.services.placement_service import hash_songs
+from mptreasury.util.injection import Injected, injectable_sync
+from mptreasury.util.metrics import metrics
+
+
+@injectable_sync
+def sync_tags(
+    album_ids: Iterable[int] | None = None,
+    *,
+    Session: Session = Injected,
+    config: Config = Injected,
+) -> dict:
+    """Make the tags of the albums' files, the whole library's by default,
+    match the db, e.g. after correcting an album. Only files whose tags
+    differ are written, and the content hashes of those are updated"""
+    albums = db.get_albums_with_songs(album_ids, Session)
+    with metrics.span("tag_sync"):
+        report = TagSync(config.TAG_WORKERS).sync(albums)
+    metrics.increment("files_retagged", len(report.updated))
+    updated = set(report.updated)
+    retagged = [
+        song
+        for _, songs in albums
+        for song in songs
+        if song.local_path in updated and song.content_hash is not None
+    ]
+    if retagged:
+        # new tags are new content; an outdated hash would get new imports
+        # linked to a file that isn't theirs anymore
+        for song in retagged:
+            song.content_hash = None
+        with metrics.span("content_hash"):
+            hash_songs(retagged, config.TAG_WORKERS)
+        db.set_content_hashes(
+            {song.local_path: song.content_hash for song in retagged}, Session
+        )
+    return report.to_dict()
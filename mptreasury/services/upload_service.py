@@ -0,0 +1,22 @@
+from sqlalchemy.orm import Session
+
+from app.remote_storage_service import UploadEngine, get_s3_client
+from mptreasury.core import db
+from mptreasury.core.config import Config
+from mptreasury.util.injection import Injected, injectable_sync
+
+
+@injectable_sync
+def upload_library(
+    s3_client=None,
+    *,
+    Session: Session = Injected,
+    config: Config = Injected,
+) -> dict:
+    """Upload the library's songs that aren't in the bucket yet. Files the
+    ledger or the bucket already have are skipped, so an interrupted upload
+    is resumed by running it again"""
+    if s3_client is None:
+        s3_client = get_s3_client(config)
+    engine = UploadEngine.from_config(config, s3_client, Session)
+    return engine.upload(db.get_songs_to_upload(Session)).to_dict()
@@ -1,5 +1,8 @@
+import functools
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
 from inspect import _ParameterKind, signature
-from typing import Awaitable, Callable, Hashable, ParamSpec, TypeVar
+from typing import Awaitable, Callable, Hashable, Iterator, ParamSpec, TypeVar
 
 
 class MissingDependencyError(Exception):
@@ -15,6 +18,8 @@ class DoubleInjectionError(Exception):
 
 
 _INJECTS: dict[Hashable, object] = {}
+# factories of dependencies that live as long as an injection scope
+_SCOPED_INJECTS: dict[Hashable, Callable[[], object]] = {}
 
 
 class Injected:
@@ -25,58 +30,130 @@ _P = ParamSpec("_P")
 _T = TypeVar("_T")
 
 
+class Scope:
+    """Instances of scoped dependencies, created the first time they're needed.
+    Those that are context managers are entered then, and exited on close()"""
+
+    def __init__(self) -> None:
+        self._instances: dict[Hashable, object] = {}
+        self._exit_stack = ExitStack()
+
+    def get(self, annotation: Hashable) -> object:
+        try:
+            return self._instances[annotation]
+        except KeyError:
+            pass
+        instance = _SCOPED_INJECTS[annotation]()
+        if hasattr(instance, "__enter__") and hasattr(instance, "__exit__"):
+            instance = self._exit_stack.enter_context(instance)  # type: ignore
+        self._instances[annotation] = instance
+        return instance
+
+    def close(self):
+        self._instances = {}
+        self._exit_stack.close()
+
+
+_current_scope: ContextVar[Scope | None] = ContextVar("injection_scope", default=None)
+
+
+@contextmanager
+def injection_scope() -> Iterator[Scope]:
+    """Scope for scoped dependencies, e.g. one import job. Injected calls
+    made outside of any scope get one of their own, for the length of the call"""
+    scope = Scope()
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        scope.close()
+
+
+_Plan = tuple[tuple[str, Hashable], ...]
+
+
+def _injection_plan(func: Callable) -> _Plan:
+    """The parameters of func that get injected, worked out once"""
+    plan = []
+    for name, sig in signature(func).parameters.items():
+        if sig.default is Injected:
+            if sig.kind is not _ParameterKind.KEYWORD_ONLY:
+                msg = (
+                    f"Injected parameter {name} in "
+                    f"{func.__name__} must be keyword-only"
+                )
+                raise IncorrectInjectableSignatureError(msg)
+            plan.append((name, sig.annotation))
+    return tuple(plan)
+
+
+def _inject(func: Callable, plan: _Plan, kwargs: dict) -> list[str]:
+    """Fill in kwargs from the plan, returning the scoped dependencies still missing"""
+    scoped = []
+    for name, annotation in plan:
+        if kwargs.get(name) is not None:
+            continue
+        try:
+            kwargs[name] = _INJECTS[annotation]
+        except KeyError:
+            if annotation not in _SCOPED_INJECTS:
+                msg = f"Missing dependency for {name}: {annotation} in {func}"
+                raise MissingDependencyError(msg) from None
+            scoped.append(name)
+    return scoped
+
+
+def _inject_scoped(plan: _Plan, scoped: list[str], kwargs: dict, scope: Scope):
+    for name, annotation in plan:
+        if name in scoped:
+            kwargs[name] = scope.get(annotation)
+
+
 def injectable(func: Callable[_P, Awaitable[_T]]) -> Callable[_P, Awaitable[_T]]:
+    plan = _injection_plan(func)
+
+    @functools.wraps(func)
     async def inner(*args: _P.args, **kwargs: _P.kwargs) -> _T:
-        for name, sig in signature(func).parameters.items():
-            if sig.default is Injected:
-                if sig.kind is not _ParameterKind.KEYWORD_ONLY:
-                    msg = (
-                        f"Injected parameter {name} in "
-                        f"{func.__name__} must be keyword-only"
-                    )
-                    raise IncorrectInjectableSignatureError(msg)
-                if kwargs.get(name) is not None:
-                    pass
-                elif sig.annotation in _INJECTS:
-                    kwargs.update({name: _INJECTS[sig.annotation]})
-                else:
-                    msg = (
-                        "Missing dependency for "
-                        f"{name}: {sig.annotation} in {func.__name__}"
-                    )
-                    raise MissingDependencyError(msg)
-        return await func(*args, **kwargs)
+        if not (scoped := _inject(func, plan, kwargs)):
+            return await func(*args, **kwargs)
+        if (scope := _current_scope.get()) is not None:
+            _inject_scoped(plan, scoped, kwargs, scope)
+            return await func(*args, **kwargs)
+        with injection_scope() as scope:
+            _inject_scoped(plan, scoped, kwargs, scope)
+            return await func(*args, **kwargs)
 
     return inner
 
 
 def injectable_sync(func: Callable[_P, _T]) -> Callable[_P, _T]:
+    plan = _injection_plan(func)
+
+    @functools.wraps(func)
     def inner(*args: _P.args, **kwargs: _P.kwargs) -> _T:
-        for name, sig in signature(func).parameters.items():
-            if sig.default is Injected:
-                if sig.kind is not _ParameterKind.KEYWORD_ONLY:
-                    msg = (
-                        f"Injected parameter {name} in "
-                        f"{func.__name__} must be keyword-only"
-                    )
-                    raise IncorrectInjectableSignatureError(msg)
-                if kwargs.get(name) is not None:
-                    pass
-                elif sig.annotation in _INJECTS:
-                    kwargs.update({name: _INJECTS[sig.annotation]})
-                else:
-                    msg = (
-                        "Missing dependency for "
-                        f"{name}: {sig.annotation} in {func}"
-                    )
-                    raise MissingDependencyError(msg)
-        return func(*args, **kwargs)
+        if not (scoped := _inject(func, plan, kwargs)):
+            return func(*args, **kwargs)
+        if (scope := _current_scope.get()) is not None:
+            _inject_scoped(plan, scoped, kwargs, scope)
+            return func(*args, **kwargs)
+        with injection_scope() as scope:
+            _inject_scoped(plan, scoped, kwargs, scope)
+            return func(*args, **kwargs)
 
     return inner
 
 
 def add_injectable(annotation: Hashable, injectable: object) -> None:
-    if annotation in _INJECTS:
+    if annotation in _INJECTS or annotation in _SCOPED_INJECTS:
         msg = f"Injectable {annotation} already added"
         raise DoubleInjectionError(msg)
     _INJECTS[annotation] = injectable
+
+
+def add_scoped_injectable(annotation: Hashable, factory: Callable[[], object]) -> None:
+    """Inject a new instance from factory in every injection scope"""
+    if annotation in _INJECTS or annotation in _SCOPED_INJECTS:
+        msg = f"Injectable {annotation} already added"
+        raise DoubleInjectionError(msg)
+    _SCOPED_INJECTS[annotation] = factory
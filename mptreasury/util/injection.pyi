@@ -1,9 +1,20 @@
-from typing import Any, Awaitable, Callable, ParamSpec, TypeVar
+from contextlib import AbstractContextManager
+from typing import Any, Awaitable, Callable, Hashable, ParamSpec, TypeVar
 
 _P = ParamSpec("_P")
 _T = TypeVar("_T")
 Injected: Any
 
+class MissingDependencyError(Exception): ...
+class IncorrectInjectableSignatureError(Exception): ...
+class DoubleInjectionError(Exception): ...
+
+class Scope:
+    def get(self, annotation: Hashable) -> object: ...
+    def close(self) -> None: ...
+
+def injection_scope() -> AbstractContextManager[Scope]: ...
 def injectable(func: Callable[_P, Awaitable[_T]]) -> Callable[_P, Awaitable[_T]]: ...
 def injectable_sync(func: Callable[_P, _T]) -> Callable[_P, _T]: ...
 def add_injectable(annotation: Any, injectable: Any) -> None: ...
+def add_scoped_injectable(annotation: Any, factory: Callable[[], Any]) -> None: ...
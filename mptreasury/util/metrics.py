@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+# upper bounds, in seconds, of the stage duration histograms' buckets
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    60.0,
+    float("inf"),
+)
+
+PROMETHEUS_PREFIX = "mptreasury"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        # per bucket, not cumulative; that's only done when exporting
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, snapshot: dict):
+        for i, count in enumerate(snapshot["counts"]):
+            self.counts[i] += count
+        self.count += snapshot["count"]
+        self.sum += snapshot["sum"]
+
+    def snapshot(self) -> dict:
+        return dict(counts=list(self.counts), count=self.count, sum=self.sum)
+
+
+class Metrics:
+    """Counters and stage duration histograms of this process.
+    Recording one is a dict lookup and a few additions under a lock,
+    cheap enough to leave on"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: dict[str, float] = {}
+        self.stages: dict[str, Histogram] = {}
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            if (histogram := self.stages.get(stage)) is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time the block as one run of the stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def snapshot(self) -> dict:
+        """Plain, JSON-friendly copy of everything recorded so far"""
+        with self._lock:
+            return dict(
+                counters=dict(self.counters),
+                stages={
+                    stage: histogram.snapshot()
+                    for stage, histogram in self.stages.items()
+                },
+            )
+
+    def drain(self) -> dict:
+        """Snapshot and reset, e.g. to hand a worker process' metrics over"""
+        with self._lock:
+            snapshot = dict(
+                counters=self.counters,
+                stages={
+                    stage: histogram.snapshot()
+                    for stage, histogram in self.stages.items()
+                },
+            )
+            self.counters = {}
+            self.stages = {}
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        """Add the metrics of a snapshot, e.g. from a worker process"""
+        for name, value in snapshot["counters"].items():
+            self.increment(name, value)
+        with self._lock:
+            for stage, histogram_snapshot in snapshot["stages"].items():
+                if (histogram := self.stages.get(stage)) is None:
+                    histogram = self.stages[stage] = Histogram()
+                histogram.merge(histogram_snapshot)
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        metric = f"{PROMETHEUS_PREFIX}_stage_seconds"
+        if snapshot["stages"]:
+            lines.append(f"# TYPE {metric} histogram")
+        for stage, histogram in sorted(snapshot["stages"].items()):
+            cumulative = 0
+            for bound, count in zip(DEFAULT_BUCKETS, histogram["counts"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_file(self, path: Path):
+        """Write the metrics where a node exporter's textfile collector can
+        pick them up; replaced atomically, so it's never read half-written"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.{os.getpid()}")
+        partial.write_text(self.to_prometheus())
+        os.replace(partial, path)
+
+
+metrics = Metrics()
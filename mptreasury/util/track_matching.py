@@ -0,0 +1,124 @@
+"""Matching of local track names against the tracklist of a release.
+
+Instead of greedily picking the best local track for every Discogs track
+(where one early bad pick can sink the whole candidate), we score every
+(Discogs track, local track) pair and then pick the assignment with the
+highest total score.
+"""
+from rapidfuzz import fuzz, process
+
+# (actual track, potential match, matching score)
+MatchTriplet = tuple[str, str, int]
+
+
+def score_matrix(
+    actual_tracks: list[str], potential_matches: list[str]
+) -> list[list[int]]:
+    """Row i holds the scores of potential_matches[i] against every actual track"""
+    matrix: list[list[int]] = []
+    for potential_match in potential_matches:
+        # extract scores the whole row in one call, in native code
+        row = [0] * len(actual_tracks)
+        for _, score, index in process.extract(
+            potential_match, actual_tracks, scorer=fuzz.partial_ratio, limit=None
+        ):
+            row[index] = round(score)
+        matrix.append(row)
+    return matrix
+
+
+def optimal_assignment(matrix: list[list[int]]) -> list[tuple[int, int]]:
+    """Hungarian algorithm, returning the (row, column) pairs that maximize the
+    sum of the picked scores. Every row gets a column if there are more
+    columns than rows, and the other way around"""
+    if not matrix or not matrix[0]:
+        return []
+    transposed = len(matrix) > len(matrix[0])
+    if transposed:
+        matrix = [list(column) for column in zip(*matrix)]
+    n, m = len(matrix), len(matrix[0])
+    # costs are negated scores, since the algorithm minimizes; indices are 1-based
+    # with 0 being a sentinel, as in the textbook formulation
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    column_owner = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for row in range(1, n + 1):
+        column_owner[0] = row
+        current_column = 0
+        min_slack = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[current_column] = True
+            current_row = column_owner[current_column]
+            delta = inf
+            next_column = 0
+            for column in range(1, m + 1):
+                if used[column]:
+                    continue
+                slack = (
+                    -matrix[current_row - 1][column - 1] - u[current_row] - v[column]
+                )
+                if slack < min_slack[column]:
+                    min_slack[column] = slack
+                    way[column] = current_column
+                if min_slack[column] < delta:
+                    delta = min_slack[column]
+                    next_column = column
+            for column in range(m + 1):
+                if used[column]:
+                    u[column_owner[column]] += delta
+                    v[column] -= delta
+                else:
+                    min_slack[column] -= delta
+            current_column = next_column
+            if column_owner[current_column] == 0:
+                break
+        while current_column:
+            previous_column = way[current_column]
+            column_owner[current_column] = column_owner[previous_column]
+            current_column = previous_column
+    pairs = [
+        (column_owner[column] - 1, column - 1)
+        for column in range(1, m + 1)
+        if column_owner[column] != 0
+    ]
+    if transposed:
+        pairs = [(column, row) for row, column in pairs]
+    pairs.sort()
+    return pairs
+
+
+def match_tracks(
+    actual_tracks: list[str], potential_matches: list[str]
+) -> tuple[list[MatchTriplet], float]:
+    """Same contract as the old greedy fuzzy_match_tracks: the triplets come
+    in the order of potential_matches, along with the overall score"""
+    matrix = score_matrix(actual_tracks, potential_matches)
+    triplets: list[MatchTriplet] = [
+        (actual_tracks[column], potential_matches[row], matrix[row][column])
+        for row, column in optimal_assignment(matrix)
+    ]
+    score = score_fuzzy_match_triplet(
+        triplets,
+        len(actual_tracks) - len(triplets),
+        len(potential_matches),
+    )
+    return triplets, score
+
+
+def score_fuzzy_match_triplet(
+    triplets: list[MatchTriplet],
+    no_of_actual_tracks: int,
+    no_of_potential_tracks: int,
+) -> float:
+    """no_of_actual_tracks is the number of local tracks left without a match"""
+    if not triplets:
+        return 0
+    score_sum = sum([triplet[2] for triplet in triplets])
+    score_mean = score_sum / len(triplets)
+    score_mean = score_mean * (1 - 0.2 * no_of_actual_tracks)
+    potential_tracks_diff = no_of_potential_tracks - len(triplets)
+    score_mean = score_mean * (1 - 0.2 * potential_tracks_diff)
+    return score_mean
@@ -0,0 +1,25 @@
+import unicodedata
+
+
+def normalize(text: str) -> str:
+    """Lowercase, without accents, and with anything but letters and digits
+    turned into single spaces"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    kept = (
+        char if char.isalnum() else " "
+        for char in decomposed
+        if not unicodedata.combining(char)
+    )
+    return " ".join("".join(kept).split())
+
+
+def trigrams(text: str) -> set[str]:
+    """Trigrams of every word, padded so that a word's start and end are
+    grams of their own: "abc" gives " ab", "abc", "bc ". Unlike postgres'
+    pg_trgm, there's no "  a" gram: a first letter is shared by too many
+    words to tell them apart, and reading its terms would be most of a lookup"""
+    grams: set[str] = set()
+    for word in normalize(text).split():
+        padded = f" {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams